@@ -7,6 +7,7 @@ import errno
 import abc
 import collections
 import gevent
+import gevent.queue
 import autoprocessing
 import gevent
 from HardwareRepository.TaskUtils import *
@@ -47,6 +48,132 @@ BeamlineConfig = collections.namedtuple('BeamlineConfig',
                                          'input_files_server'])
 
 
+class LimsImageWriter(object):
+    """
+    Stores image records in LIMS from a background greenlet, so the
+    acquisition loop only enqueues a record. Records are grouped in
+    batches, sent when batch_size records are queued or flush_interval
+    seconds after the first record of the batch. The records of a batch
+    that did not get an image id are retried with exponential backoff,
+    the stored ones are not sent again. Beam status
+    (intensity, machine current and message, cryo temperature) is read
+    once per batch with status_func.
+    Queue is bounded: records are dropped (and counted) if LIMS is so
+    slow that max_size records are waiting.
+    """
+    def __init__(self, lims, status_func=None, batch_size=50, flush_interval=1.0,
+                 max_size=5000, max_retries=3, retry_delay=0.5):
+        self.lims = lims
+        self.status_func = status_func
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.queue = gevent.queue.Queue(max_size)
+        self.summary = None
+        self.__writer_task = None
+
+    def start(self):
+        self.summary = {"stored": 0, "batches": 0, "retries": 0,
+                        "failed": 0, "dropped": 0}
+        self.__writer_task = gevent.spawn(self.__write_records)
+
+    def put(self, image_dict):
+        try:
+            self.queue.put_nowait(image_dict)
+        except gevent.queue.Full:
+            self.summary["dropped"] += 1
+
+    def flush(self, timeout=30):
+        """
+        Waits until all queued records are stored and stops the writer
+
+        :returns: dict with number of stored, failed and dropped records
+        """
+        if self.__writer_task is not None:
+            try:
+                self.queue.put(None, timeout=timeout)
+                self.__writer_task.join(timeout=timeout)
+            except gevent.queue.Full:
+                pass
+            if not self.__writer_task.ready():
+                self.__writer_task.kill()
+                self.summary["failed"] += self.queue.qsize()
+            self.__writer_task = None
+        return self.summary
+
+    def __write_records(self):
+        stop = False
+        while not stop:
+            record = self.queue.get()
+            if record is None:
+                break
+            batch = [record]
+            flush_time = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get(timeout=max(0, flush_time - time.time()))
+                except gevent.queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self.__store_batch(batch)
+
+    def __store_batch(self, batch):
+        if hasattr(self.lims, "is_disabled") and self.lims.is_disabled():
+            return
+
+        if self.status_func is not None:
+            try:
+                status = self.status_func()
+                for record in batch:
+                    record.update(status)
+            except:
+                logging.getLogger("HWR").exception("Could not read beam status for LIMS images")
+
+        # Only the records without an image id are sent again, the
+        # records already stored would be inserted twice
+        pending = batch
+        for attempt in range(self.max_retries + 1):
+            image_ids = self.__store_records(pending)
+            pending = [record for record, image_id in zip(pending, image_ids)
+                       if image_id is None]
+            self.summary["stored"] += len(image_ids) - image_ids.count(None)
+            if not pending:
+                break
+            if attempt == self.max_retries:
+                logging.getLogger("HWR").error("Could not store %d images in LIMS" % len(pending))
+                self.summary["failed"] += len(pending)
+                break
+            self.summary["retries"] += 1
+            gevent.sleep(self.retry_delay * 2 ** attempt)
+        self.summary["batches"] += 1
+
+    def __store_records(self, records):
+        """
+        Returns the image ids of records, None for the records not stored
+        """
+        if hasattr(self.lims, "store_images"):
+            try:
+                image_ids = list(self.lims.store_images(records))
+            except:
+                logging.getLogger("HWR").exception("Could not store images in LIMS")
+                image_ids = []
+            return image_ids + [None] * (len(records) - len(image_ids))
+
+        image_ids = []
+        for record in records:
+            try:
+                image_ids.append(self.lims.store_image(record))
+            except:
+                # LIMS is probably not reachable, next records are not sent
+                logging.getLogger("HWR").exception("Could not store image in LIMS")
+                break
+        return image_ids + [None] * (len(records) - len(image_ids))
+
+
 class AbstractMultiCollect(object):
     __metaclass__ = abc.ABCMeta
 
@@ -58,6 +185,7 @@ class AbstractMultiCollect(object):
         self.current_lims_sample = None
         self.__safety_shutter_close_task = None
         self.run_without_loop = None
+        self.lims_image_writer = None
 
 
     def setControlObjects(self, **control_objects):
@@ -291,6 +419,28 @@ class AbstractMultiCollect(object):
       pass
 
     
+    def get_lims_image_status(self):
+        """
+        Beam status stored with each image in LIMS
+        """
+        return {'measuredIntensity': self.get_measured_intensity(),
+                'synchrotronCurrent': self.get_machine_current(),
+                'machineMessage': self.get_machine_message(),
+                'temperature': self.get_cryo_temperature()}
+
+
+    def flush_lims_images(self):
+        """
+        Waits until all images of the collection are stored in LIMS
+        """
+        if self.lims_image_writer is not None:
+            summary = self.lims_image_writer.flush()
+            logging.getLogger("HWR").info("LIMS images: %(stored)d stored in " \
+                "%(batches)d batches, %(retries)d retries, %(failed)d failed, " \
+                "%(dropped)d dropped" % summary)
+            self.lims_image_writer = None
+
+
     @abc.abstractmethod
     @task
     def generate_image_jpeg(self, filename, jpeg_path, jpeg_thumbnail_path):
@@ -647,7 +797,12 @@ class AbstractMultiCollect(object):
         # 0: software binned, 1: unbinned, 2:hw binned
         self.set_detector_mode(data_collect_parameters["detector_mode"])
 
-        with cleanup(self.data_collection_cleanup):
+        if self.bl_control.lims:
+            self.lims_image_writer = LimsImageWriter(self.bl_control.lims,
+                                                     self.get_lims_image_status)
+            self.lims_image_writer.start()
+
+        with cleanup(self.data_collection_cleanup), cleanup(self.flush_lims_images):
             if not self.safety_shutter_opened():
                 logging.getLogger("user_level_log").info("Opening safety shutter")
                 self.open_safety_shutter(timeout=10)
@@ -756,20 +911,13 @@ class AbstractMultiCollect(object):
                               lims_image={'dataCollectionId': self.collection_id,
                                           'fileName': filename,
                                           'fileLocation': file_location,
-                                          'imageNumber': frame,
-                                          'measuredIntensity': self.get_measured_intensity(),
-                                          'synchrotronCurrent': self.get_machine_current(),
-                                          'machineMessage': self.get_machine_message(),
-                                          'temperature': self.get_cryo_temperature()}
+                                          'imageNumber': frame}
 
                               if archive_directory:
                                 lims_image['jpegFileFullPath'] = jpeg_full_path
                                 lims_image['jpegThumbnailFileFullPath'] = jpeg_thumbnail_full_path
 
-                              try:
-                                  self.bl_control.lims.store_image(lims_image)
-                              except:
-                                  logging.getLogger("HWR").exception("Could not store store image in LIMS")
+                              self.lims_image_writer.put(lims_image)
                           
                               self.generate_image_jpeg(str(file_path), str(jpeg_full_path), str(jpeg_thumbnail_full_path),wait=False)
                           if data_collect_parameters.get("processing", False)=="True":
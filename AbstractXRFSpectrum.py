@@ -15,11 +15,10 @@ import os
 import logging
 import time
 import gevent
-import numpy
 import abc
 from HardwareRepository.TaskUtils import cleanup	
-from matplotlib.figure import Figure
-from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+import XRFSpectrumProcessing
 
 
 class AbstractXRFSpectrum(object):
@@ -161,41 +160,20 @@ class AbstractXRFSpectrum(object):
             self.spectrum_info['endTime'] = time.strftime("%Y-%m-%d %H:%M:%S")
             self.spectrum_running = False
 
-            xmin = 0
-            xmax = 0
-            mca_data = []
-            calibrated_data = []
+            spectrum = XRFSpectrumProcessing.calibrate_spectrum(\
+                 self.spectrum_data, self.mca_calib)
+            xmin, xmax = spectrum.get_mca_range()
+            mca_data = spectrum.get_mca_data()
 
             try:
-               spectrum_file_raw = open(self.spectrum_info["scanFileFullPath"], "w")
-               archive_file_raw = open(self.spectrum_info["scanFilePath"], "w")
+               XRFSpectrumProcessing.write_spectrum(spectrum,
+                    self.spectrum_info["scanFileFullPath"],
+                    self.spectrum_info["scanFilePath"])
             except:
                logging.getLogger("HWR").exception(
                  "XRFSpectrum: could not create spectrum result raw file %s" % \
                  self.spectrum_info["scanFileFullPath"])
 
-            for n, value in enumerate(self.spectrum_data):
-                energy = (self.mca_calib[2] + \
-                          self.mca_calib[1] * n + \
-                          self.mca_calib[0] * n * n) / 1000
-                if energy < 13:
-                    if energy > xmax:
-                        xmax = value
-                    if energy < xmin:
-                        xmin = value
-                    calibrated_data.append([energy, value])
-                    mca_data.append((n / 1000.0, value))
-                    if spectrum_file_raw:
-                        spectrum_file_raw.write("%f,%f\r\n" % (energy, value))
-                    if archive_file_raw:
-                        archive_file_raw.write("%f,%f\r\n" % (energy, value))
-            if spectrum_file_raw:
-                spectrum_file_raw.close()
-            if archive_file_raw:
-                archive_file_raw.close()
-
-            calibrated_array = numpy.array(calibrated_data)
-
             self.spectrum_info["beamTransmission"] = self.transmission_hwobj.getAttFactor()
             self.spectrum_info["energy"] = self.get_current_energy()
             beam_size = self.beam_info_hwobj.get_beam_size()
@@ -211,18 +189,11 @@ class AbstractXRFSpectrum(object):
             self.spectrum_info.pop("htmldir")
             self.spectrum_info.pop("scanFilePath")
 
-            fig = Figure(figsize=(15, 11))
-            ax = fig.add_subplot(111)
-            ax.set_title(self.spectrum_info["jpegScanFileFullPath"])
-            ax.grid(True)
-
-            ax.plot(*(zip(*calibrated_array)), **{"color" : 'black'})
-            ax.set_xlabel("Energy")
-            ax.set_ylabel("Counts")
-            canvas = FigureCanvasAgg(fig)
             logging.getLogger().info("XRFSpectrum: Rendering spectrum to PNG file : %s", \
                                      self.spectrum_info["jpegScanFileFullPath"])
-            canvas.print_figure(self.spectrum_info["jpegScanFileFullPath"], dpi = 80)
+            XRFSpectrumProcessing.render_spectrum_png(spectrum,
+                 self.spectrum_info["jpegScanFileFullPath"],
+                 self.spectrum_info["jpegScanFileFullPath"])
             #logging.getLogger().debug("Copying .fit file to: %s", a_dir)
             #tmpname=filename.split(".")
             #logging.getLogger().debug("finished %r", self.spectrum_info)
@@ -46,11 +46,22 @@ class CentringMath(Procedure):
         return self.vector_to_camera_coordinates(numpy.dot(self.F.T,dum))
 
     def listOfCentringsToScreen(self,list_of_centring_dicts):
+        """
+        Factorizes once and projects all centrings in one matrix product
+        """
         self.factorize()
-        lst= []
-        for centring in list_of_centring_dicts:
-          lst.append(self.centringToScreen(centring,factorized = True))
-        return lst
+        camera_coordinates = self.centringsArrayToScreen(numpy.array(\
+             [self.centred_positions_to_vector(centring) for centring in list_of_centring_dicts]))
+        return [self.vector_to_camera_coordinates(vector) for vector in camera_coordinates]
+
+    def centringsArrayToScreen(self,tau_cntrd_array):
+        """
+        One _must_ self.factorize() before!!!
+        Input is (N, translation axes) array of centred translation motor
+        positions, output (N, camera axes) array of camera coordinates.
+        """
+        tau_cntrd_array = numpy.asarray(tau_cntrd_array,dtype=float).reshape(-1,self.translationAxesCount)
+        return numpy.dot(numpy.asarray(self.tau,dtype=float) - tau_cntrd_array, self.F)
   
     def factorize(self):
         # this should be automatic, on the gonio both rot and trans datum update
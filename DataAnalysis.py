@@ -3,6 +3,7 @@ import logging
 import gevent.event
 import threading
 import subprocess
+import XSDataParser
 import AbstractDataAnalysis
 
 import queue_model_enumerables_v1 as qme
@@ -259,7 +260,8 @@ class DataAnalysis(AbstractDataAnalysis.AbstractDataAnalysis, HardwareObject):
 
         self.processing_done_event = edna_processing_thread.start()
         self.processing_done_event.wait()
-        self.result = XSDataResultMXCuBE.parseFile(edna_results_file)
+        self.result = XSDataParser.parse_file(XSDataResultMXCuBE,
+                                              edna_results_file)
 
         return self.result
 
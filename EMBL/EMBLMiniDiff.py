@@ -566,22 +566,32 @@ class EMBLMiniDiff(GenericDiffractometer):
         """
         Descript. :
         """
-        c = centred_positions_dict
+        return self.motor_positions_to_screen_list([centred_positions_dict])[0]
 
+    def motor_positions_to_screen_list(self, centred_positions_list):
+        """
+        Descript. : projects all centred positions with one factorization
+                    of the centring math (motor positions are read once)
+        """
         kappa = self.current_motor_positions["kappa"] 
         phi = self.current_motor_positions["kappa_phi"] 
 
-        if (c['kappa'], c['kappa_phi']) != (kappa, phi) \
-         and self.minikappa_correction_hwobj is not None:
-            #c['sampx'], c['sampy'], c['phiy']
-            c['sampx'], c['sampy'], c['phiy'] = self.minikappa_correction_hwobj.shift(
-            c['kappa'], c['kappa_phi'], [c['sampx'], c['sampy'], c['phiy']], kappa, phi)
-        xy = self.centring_hwobj.centringToScreen(c)
-        x = (xy['X'] + c['beam_x']) * self.pixels_per_mm_x + \
-              self.zoom_centre['x']
-        y = (xy['Y'] + c['beam_y']) * self.pixels_per_mm_y + \
-             self.zoom_centre['y']
-        return x, y
+        for c in centred_positions_list:
+            if (c['kappa'], c['kappa_phi']) != (kappa, phi) \
+             and self.minikappa_correction_hwobj is not None:
+                #c['sampx'], c['sampy'], c['phiy']
+                c['sampx'], c['sampy'], c['phiy'] = self.minikappa_correction_hwobj.shift(
+                c['kappa'], c['kappa_phi'], [c['sampx'], c['sampy'], c['phiy']], kappa, phi)
+        xy_list = self.centring_hwobj.listOfCentringsToScreen(centred_positions_list)
+
+        screen_coord = []
+        for c, xy in zip(centred_positions_list, xy_list):
+            x = (xy['X'] + c['beam_x']) * self.pixels_per_mm_x + \
+                  self.zoom_centre['x']
+            y = (xy['Y'] + c['beam_y']) * self.pixels_per_mm_y + \
+                 self.zoom_centre['y']
+            screen_coord.append((x, y))
+        return screen_coord
  
     def move_to_centred_position(self, centred_position):
         """
@@ -3,19 +3,29 @@ from ESRFMultiCollect import *
 #from detectors.LimaEiger import Eiger
 from detectors.LimaPilatus import Pilatus
 import gevent
-import socket
 import shutil
 import logging
 import os
 import gevent
-#import cPickle as pickle
 from PyTango.gevent import DeviceProxy
+from ImageNotifier import ImageNotifier
 
 class ID30A3MultiCollect(ESRFMultiCollect):
     def __init__(self, name):
         ESRFMultiCollect.__init__(self, name, PixelDetector(Pilatus), FixedEnergy(0.9677, 12.812))
 
-        self._notify_greenlet = None
+        self.image_notifier_hwobj = None
+
+    def init(self):
+        ESRFMultiCollect.init(self)
+
+        self.image_notifier_hwobj = self.getObjectByRole("image_notifier")
+        if self.image_notifier_hwobj is None:
+            # adxv on aelita, images sent 1 s after they are written and
+            # at most every 3 s
+            self.image_notifier_hwobj = ImageNotifier("image_notifier")
+            self.image_notifier_hwobj.add_subscriber("adxv", "aelita.esrf.fr", 8100,
+                                                     delay=1, min_interval=3)
 
     @task
     def data_collection_hook(self, data_collect_parameters):
@@ -26,16 +36,8 @@ class ID30A3MultiCollect(ESRFMultiCollect):
       self.getObjectByRole("diffractometer").controller.set_diagfile(diagfile)
 
       self._detector.shutterless = data_collect_parameters["shutterless"]
-      
-      """
-      try:
-          albula_socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-          albula_socket.connect(('localhost', 31337))
-      except:
-          pass
-      else:
-          albula_socket.sendall(pickle.dumps({"type":"newcollection"}))
-      """
+
+      self.image_notifier_hwobj.new_collection()
 
     @task
     def get_beam_size(self):
@@ -119,40 +121,16 @@ class ID30A3MultiCollect(ESRFMultiCollect):
     @task
     def set_detector_filenames(self, frame_number, start, filename, jpeg_full_path, jpeg_thumbnail_full_path):
         self.last_image_filename = filename
+        self.last_image_frame = frame_number
         return ESRFMultiCollect.set_detector_filenames(self, frame_number, start, filename, jpeg_full_path, jpeg_thumbnail_full_path)
        
  
-    def adxv_notify(self, image_filename):
-        logging.info("adxv_notify %r", image_filename)
-        try:
-            adxv_notify_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            adxv_notify_socket.connect(("aelita.esrf.fr", 8100))
-            adxv_notify_socket.sendall("load_image %s\n" % image_filename)
-            adxv_notify_socket.close()
-        except:
-            pass
-        else:
-            gevent.sleep(3)
-        
-    """
-    def albula_notify(self, image_filename):
-       try:
-          albula_socket = socket.socket(socket.AF_INET,socket.SOCK_STREAM)
-          albula_socket.connect(('localhost', 31337))
-      except:
-          pass
-      else:
-          albula_socket.sendall(pickle.dumps({ "type":"newimage", "path": image_filename }))
-    """
-
     @task
     def write_image(self, last_frame):
         ESRFMultiCollect.write_image(self, last_frame)
-        if last_frame:
-            gevent.spawn_later(1, self.adxv_notify, self.last_image_filename)
-        else:
-            if self._notify_greenlet is None or self._notify_greenlet.ready():
-                self._notify_greenlet = gevent.spawn_later(1, self.adxv_notify, self.last_image_filename)
+        # Subscribers coalesce the images, the last one is always sent
+        self.image_notifier_hwobj.publish(self.last_image_filename,
+                                          self.last_image_frame)
 
 #    def trigger_auto_processing(self, *args, **kw):
 #        return
@@ -1,37 +1,29 @@
 import logging
 import sys
+import numpy
+from FluxCalibration import get_file_calibration
 
 class CalculateFlux:
 
     def __init__(self, fname=None):
         self.FLUX = {}
+        self.labels = []
+        self.calibration = None
 
     def init(self, fname="/users/blissadm/local/beamline_control/configuration/calibrated_diodes.dat"):
         self.calib_array=self._load_flux_calibration(fname)
 
     def _load_flux_calibration(self, fname):
         try:
-            f = open(fname)
-            array = []
-            nb_line = 0
-            for line in f:  
-                if not line.startswith('#') and line.strip() :
-                    array.append(map(float,line.split()))
-                    nb_line += 1
-                else:
-                    if line.startswith('#'):
-                        #line = line[1:]
-                        ll = line[1:].split()
-                        self.labels=[]
-                        idx = []
-                        for i in ll:
-                            self.labels.append(i.lower())
-                            idx.append(0)
-            f.close()
+            self.calibration, self.labels = get_file_calibration(fname)
         except IOError:
             logging.exception("Cannot read calibrated diodes file")
-        self.FLUX = dict(zip(self.labels, idx))
-        return array
+            raise
+        self.FLUX = dict.fromkeys(self.labels, 0)
+        # table as in the file: energies in decreasing order
+        columns = [self.calibration.energies] + \
+                  [self.calibration.coefficients[label] for label in self.labels[1:]]
+        return numpy.column_stack(columns)[::-1].tolist()
 
     def calc_flux_coef(self, en):
         if en < 4:
@@ -43,56 +35,24 @@ class CalculateFlux:
 
         self.FLUX[self.labels[0]] = int(en)
 
-        if en >= self.calib_array[0][0]:
-            calib = self.calib_array[0][1:]
-        elif en <= self.calib_array[-1][0]:
-            calib = self.calib_array[-1][1:]
-        else:
-            calib = self._interpol(self.calib_array, int(en))
+        # calibration points closer than 10 eV are used without interpolation
+        calib = [self.calibration.get_coefficient(int(en), label, tolerance=10) \
+                 for label in self.labels[1:]]
 
-        for i in calib:
-            self.FLUX[self.labels[calib.index(i)+1]] = i
+        for index, value in enumerate(calib):
+            self.FLUX[self.labels[index + 1]] = value
 
         return calib
 
-    def _interpol(self, arr, val, debug=0):
-        larr = []
-        for i, vals in enumerate(arr):
-            if abs(vals[0] - val)  < 10:
-                return vals[1:]
-
-            larr.append(abs(vals[0] - val))
-        min_index = larr.index(min(larr))
-        x1 = arr[min_index][0]
-        y1 = arr[min_index][1]
-        try:
-            z1 = arr[min_index][2]
-        except:
-            pass
-        if debug:
-            print arr[min_index]
-        if x1 < val and min_index > 0:
-            min_index -= 1
-        elif x1 > val and min_index < len(arr)-1:
-            min_index += 1
-        else:
-            return None
-        if debug:
-            print arr[min_index]
-        x2 = arr[min_index][0]
-        y2 = arr[min_index][1]
-        try:
-            z2 = arr[min_index][2]
-        except:
-            pass        
-        bb = (y2-y1)/(x2-x1)
-        aa =  y1 - bb*x1
-        try:
-            dd = (z2-z1)/(x2-x1)
-            cc = z1 - dd*x1
-            return [aa+bb*val, cc+dd*val]
-        except:
-            return aa+bb*val
+    def calc_flux_coef_series(self, energies, label=None):
+        """
+        Coefficients for an array of energies (eV or keV, as calc_flux_coef)
+        of one diode (default: first calibrated diode)
+        """
+        energies = numpy.array(energies, dtype=float)
+        energies[energies < 1000] *= 1000
+        return self.calibration.get_coefficients(energies.astype(int),
+             label or self.labels[1], tolerance=10)
     
 
 if __name__ == '__main__' :
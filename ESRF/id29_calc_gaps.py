@@ -1,126 +1,70 @@
 import logging
-import math
 import sys
+import EdgeDatabase
 
 class CalculateGaps:
     def __init__(self, energy):
         self.GAPS = {}
 
-    def _calc_gaps(self,energy, undulator=None):
+    def _get_undulator_table(self):
         config_file = "/users/blissadm/local/spec/userconf/undulators.dat"
         #config_file = "/tmp/undulators.dat"
+        return EdgeDatabase.get_undulator_table(config_file)
 
+    def _calc_gaps(self,energy, undulator=None):
         try:
-            f = open(config_file) 
-            array = []
-            nb_line = 0
-            for line in f:
-                if not line.startswith('#'):
-                    array.append(line.split())
-                    nb_line += 1
-                else:
-                    pass
-        except IOError:
+            table = self._get_undulator_table()
+        except (IOError, OSError):
             logging.exception("Cannot read undulators file")
+            return self.GAPS
 
-        if nb_line == 1:
-            larr = map(float,array[2:])
-            gg = self._calc_gap(energy, larr)
-            if gg == 0:
-                gg = array[1]
-            self.GAPS[array[0]] = gg
-        elif nb_line > 1:
-            gap = {}
-            p_gap = {}
+        if not table.names:
+            logging.exception("Undulators file format error")
+            return self.GAPS
 
-            for i in array:
-                larr = map(float,i[2:])
-                gg = self._calc_gap(energy, larr)
-                if gg == 0:
-                    gg = int(i[1].strip("."))
-                p_gap[i[0]] = gg
-                if undulator != None:
-                   if i[0] == undulator:
-                       gmax = int(i[1].strip("."))
-                       if gg != 0:
-                           gap[i[0]] = gg
-                   else:
-                       gap[i[0]] = int(i[1].strip("."))
-                else:
-                    gap[i[0]] = gg
-            if undulator != None:
-                for i in array:
-                    if i[0] != undulator and gap[undulator] == gmax :
-                        larr = map(float,i[2:])
-                        gg = self._calc_gap(energy, larr)
-                        gap[i[0]] = gg
-            gaps = gap.values()
-            labels = gap.keys()
+        energy_gaps = table.calc_gaps(energy)
+        gap = {}
+        p_gap = {}
+
+        for name, max_gap in zip(table.names, table.max_gaps):
+            gg = float(energy_gaps[name])
+            if gg == 0:
+                gg = max_gap
+            p_gap[name] = gg
             if undulator != None:
-                for i in gaps:
-                    if i == gmax and gaps.index(i) != 0:
-                        gaps.reverse()
-                        labels.reverse()
-            self.GAPS = dict(zip(labels, gaps))
-        else:
-            logging.exception("Undulators file format error")
-        print p_gap
+               if name == undulator:
+                   gmax = max_gap
+                   if gg != 0:
+                       gap[name] = gg
+               else:
+                   gap[name] = max_gap
+            else:
+                gap[name] = gg
+        if undulator != None:
+            for name in table.names:
+                if name != undulator and gap[undulator] == gmax :
+                    gap[name] = float(energy_gaps[name])
+        gaps = gap.values()
+        labels = gap.keys()
+        if undulator != None:
+            for i in gaps:
+                if i == gmax and gaps.index(i) != 0:
+                    gaps.reverse()
+                    labels.reverse()
+        self.GAPS = dict(zip(labels, gaps))
+        logging.debug("Undulator gaps: %s" % str(p_gap))
         return self.GAPS
 
-    def _calc_gap(self, energy, arr):
-        gamma = 0.511/6040
-        contst_en = 6.04
-        dist = 31            #Calculate beam size at 31 m from source
-        sigma_x = 0.000088
-        sigma_y = 0.0000038
-        sigma_h = 0.1334
-        sigma_v = 0.0242
-        const=13.056*arr[1]*100/pow(contst_en,2)
-        k2 = (math.pi/arr[1])/1000
-        #Transform energy in wavelength
-        h_over_e = 12.3984
-        energy = h_over_e/energy
-        target=energy/const
-        nsols=0
-
-        k = [0]*19
-        g = [0]*19
-        pis = [0]*19
-        kout = [0]*19
-        iharm = [0]*19
-        hsiz = [0]*19
-        vsiz = [0]*19
-        #calculate gap now ...
-        for i in range(1,19,2):
-            targ = target*i
-            targ = (targ-1)*2
-            if targ > 0:
-                k[i]=math.sqrt(targ)
-                bo = k[i]/(arr[1]*93.4)
-                g[i] = -1*math.log(bo/arr[2])/k2
-                #gap is not quite right - correction factors
-                g[i] += arr[5]
-                #Power [GeV] at 200 mA
-                pis[i] = 0.633*(pow(contst_en,2))*(pow(bo,2))*0.2*arr[1]*arr[0]
-                if g[i] > arr[4]:
-                    nsols += 1
-                    g[nsols]=g[i]
-                    pis[nsols]=pis[i]
-                    kout[nsols]=k[i]
-                    iharm[nsols]=i
-                    consta = 1+pow(k[i],2)/2
-                    constb = consta/(2*i*arr[0])
-                    sigmarp=math.sqrt(constb)*gamma
-                    #Answer is in rad, we want mrad
-                    sigma_pv=2.35*1000*math.sqrt(pow(sigmarp,2)+pow(sigma_y,2))
-                    sigma_ph=2.35*1000*math.sqrt(pow(sigmarp,2)+pow(sigma_x,2))
-                    #Calculate beam sizes - these are in mcrions
-                    hsiz[nsols] = math.sqrt(pow(sigma_h,2) + pow(sigma_ph*dist,2))
-                    vsiz[nsols] = math.sqrt(pow(sigma_v,2) + pow(sigma_pv*dist,2))
-        if nsols == 0:
-            logging.info("Cannot CALCULATE GAPS")
-            return 0
-        return g[1]
+    def calc_gaps_series(self, energies):
+        """
+        Gaps of all undulators for an array of energies (keV), e.g. the
+        energies of a MAD collection. Maximal gap if there is no solution
+        """
+        table = self._get_undulator_table()
+        gaps = table.calc_gaps(energies)
+        for name, max_gap in zip(table.names, table.max_gaps):
+            gaps[name][gaps[name] == 0] = max_gap
+        return gaps
             
 if __name__ == '__main__' :
 
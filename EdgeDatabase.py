@@ -0,0 +1,264 @@
+"""
+Absorption edge and undulator tables used to set up energy scans.
+
+The tables are read once, kept as numpy arrays indexed by element/edge
+(or undulator) and shared by all the hardware objects. File based tables
+are read again only when the file has been modified.
+
+- StaticParametersTable: ESRF static parameters file (EdgeScan.dat),
+  one row per element and edge family (K or L) with the edge energies
+  and the fluorescence region of interest.
+- UndulatorTable: ESRF undulators.dat, gaps of all undulators for an
+  array of energies (e.g. the MAD energies of a collection).
+- McMasterTable: edge energies of the SOLEIL xabs_lib McMaster
+  compilation, imported only when first needed.
+
+Example:
+    table = EdgeDatabase.get_static_parameters_table(config_file)
+    pars = table.get_static_parameters("Se", "K")
+    gaps = EdgeDatabase.get_undulator_table(und_file).calc_gaps(energies)
+"""
+
+import os
+import math
+import logging
+
+import numpy
+
+
+# Columns of the static parameters file
+STATIC_PARS_ATOMIC_NB_COLUMN = 0
+STATIC_PARS_ELEMENT_COLUMN = 1
+STATIC_PARS_EDGE_COLUMN = 2
+STATIC_PARS_EDGE_ENERGY_COLUMNS = {"K": 3, "L1": 6, "L2": 7, "L3": 8}
+STATIC_PARS_EROI_COLUMNS = (11, 12)
+
+# Undulator gaps: ESRF storage ring, first odd harmonics
+UND_HARMONICS = numpy.arange(1, 19, 2)
+UND_ELECTRON_ENERGY = 6.04
+H_OVER_E = 12.3984
+
+_file_tables = {}
+
+
+def _get_file_table(table_class, file_name):
+    """
+    Descript. : returns table_class(file_name), shared between the users
+                and created again only if the file has been modified
+    """
+    mtime = os.path.getmtime(file_name)
+    key = (table_class, file_name)
+    cached = _file_tables.get(key)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, table_class(file_name))
+        _file_tables[key] = cached
+    return cached[1]
+
+
+def _read_columns(file_name):
+    rows = []
+    table_file = open(file_name)
+    try:
+        for line in table_file:
+            if not line.startswith('#') and line.strip():
+                rows.append(line.split())
+    finally:
+        table_file.close()
+    return rows
+
+
+def get_edge_name(edge):
+    """
+    Descript. : edge name used in the static parameters file for the edge
+                given by the user (K, L1, L2, L3; L and unknown: L3)
+    """
+    if edge == "K":
+        return "K"
+    try:
+        return {1: "L1", 2: "L2"}.get(int(edge[1]), "L3")
+    except:
+        return "L3"
+
+
+class StaticParametersTable(object):
+    """
+    Descript. : static parameters file, columns: atomic number, element,
+                edge family (K or L), K, ... L1, L2, L3 edge energies (eV),
+                ..., eroi min, eroi max
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        rows = _read_columns(file_name)
+        num_columns = max(STATIC_PARS_EDGE_ENERGY_COLUMNS.values() + \
+                          list(STATIC_PARS_EROI_COLUMNS)) + 1
+        self.atomic_numbers = numpy.zeros(len(rows), dtype=int)
+        self.values = numpy.zeros((len(rows), num_columns))
+        self.index = {}
+        for row_index, row in enumerate(rows):
+            try:
+                self.atomic_numbers[row_index] = int(row[STATIC_PARS_ATOMIC_NB_COLUMN])
+                for column in STATIC_PARS_EDGE_ENERGY_COLUMNS.values() + \
+                        list(STATIC_PARS_EROI_COLUMNS):
+                    self.values[row_index, column] = float(row[column])
+            except (ValueError, IndexError):
+                logging.getLogger("HWR").warning("%s: invalid line %s" % \
+                     (file_name, " ".join(row)))
+                continue
+            # Last row of an element and edge family is used
+            self.index[(row[STATIC_PARS_ELEMENT_COLUMN],
+                        row[STATIC_PARS_EDGE_COLUMN])] = row_index
+
+    def get_row_index(self, element, edge):
+        try:
+            return self.index[(element, edge[0])]
+        except KeyError:
+            raise KeyError("%s edge %s not in %s" % (element, edge, self.file_name))
+
+    def get_static_parameters(self, element, edge):
+        """
+        Descript. : energy scan parameters of the element edge, energies
+                    in keV
+        Return    : dict
+        """
+        row_index = self.get_row_index(element, edge)
+        edge_energy = self.values[row_index,
+             STATIC_PARS_EDGE_ENERGY_COLUMNS[get_edge_name(edge)]] / 1000
+        static_pars = {}
+        static_pars["atomic_nb"] = int(self.atomic_numbers[row_index])
+        static_pars["edgeEnergy"] = edge_energy
+        static_pars["startEnergy"] = edge_energy - 0.05
+        static_pars["endEnergy"] = edge_energy + 0.05
+        static_pars["findattEnergy"] = edge_energy + 0.03
+        static_pars["remoteEnergy"] = edge_energy + 1
+        static_pars["eroi_min"] = self.values[row_index, STATIC_PARS_EROI_COLUMNS[0]]
+        static_pars["eroi_max"] = self.values[row_index, STATIC_PARS_EROI_COLUMNS[1]]
+        return static_pars
+
+    def get_edge_energies(self, elements, edges):
+        """
+        Descript. : edge energies (keV) of lists of elements and edges
+        Return    : numpy array
+        """
+        rows = [self.get_row_index(element, edge) for element, edge in \
+                zip(elements, edges)]
+        columns = [STATIC_PARS_EDGE_ENERGY_COLUMNS[get_edge_name(edge)] \
+                   for edge in edges]
+        return self.values[rows, columns] / 1000
+
+
+class UndulatorTable(object):
+    """
+    Descript. : undulators file, columns: name, maximal gap and the
+                undulator parameters (number of periods, period, field,
+                ..., minimal gap, gap correction)
+    """
+    def __init__(self, file_name):
+        self.file_name = file_name
+        rows = _read_columns(file_name)
+        self.names = [row[0] for row in rows]
+        self.max_gaps = [int(row[1].strip(".")) for row in rows]
+        num_params = min(len(row) for row in rows) - 2 if rows else 0
+        self.params = numpy.array([map(float, row[2:2 + num_params]) \
+                                   for row in rows]).reshape(len(rows), num_params)
+
+    def calc_undulator_gaps(self, und_index, energies):
+        """
+        Descript. : gap of the lowest harmonic that can reach each energy
+                    (keV) with a gap larger than the minimal gap, 0 if there
+                    is no solution
+        Return    : numpy array with the shape of energies
+        """
+        arr = self.params[und_index]
+        energies = numpy.asarray(energies, dtype=float)
+        const = 13.056 * arr[1] * 100 / pow(UND_ELECTRON_ENERGY, 2)
+        k2 = (math.pi / arr[1]) / 1000
+        target = (H_OVER_E / energies.reshape(-1, 1)) / const
+        targ = (target * UND_HARMONICS - 1) * 2
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            bo = numpy.sqrt(targ) / (arr[1] * 93.4)
+            gaps = -1 * numpy.log(bo / arr[2]) / k2 + arr[5]
+            valid = (targ > 0) & (gaps > arr[4])
+        first = numpy.argmax(valid, axis=1)
+        rows = numpy.arange(len(first))
+        result = numpy.where(valid[rows, first], gaps[rows, first], 0)
+        return result.reshape(energies.shape)
+
+    def calc_gaps(self, energies):
+        """
+        Descript. : gaps of all undulators for an array of energies (keV)
+        Return    : dict undulator name: numpy array of gaps (0: no solution)
+        """
+        gaps = {}
+        for und_index, name in enumerate(self.names):
+            gaps[name] = self.calc_undulator_gaps(und_index, energies)
+        return gaps
+
+
+class McMasterTable(object):
+    """
+    Descript. : edge energies (keV) of the McMaster compilation as an
+                element x edge array
+    """
+    def __init__(self, mcmaster):
+        self.elements = sorted(mcmaster.keys(),
+             key=lambda element: mcmaster[element]['element']['Z'])
+        self.edges = sorted(set(edge for element in self.elements for \
+             edge in mcmaster[element]['edgeEnergies']))
+        self.element_index = dict((element, index) for index, element in \
+                                  enumerate(self.elements))
+        self.edge_index = dict((edge, index) for index, edge in \
+                               enumerate(self.edges))
+        self.atomic_numbers = numpy.array([mcmaster[element]['element']['Z'] \
+             for element in self.elements], dtype=int)
+        self.edge_energies = numpy.zeros((len(self.elements), len(self.edges)))
+        self.edge_energies.fill(numpy.nan)
+        for element_index, element in enumerate(self.elements):
+            for edge, energy in mcmaster[element]['edgeEnergies'].iteritems():
+                self.edge_energies[element_index, self.edge_index[edge]] = energy
+
+    def get_edge_energy(self, element, edge):
+        energy = self.edge_energies[self.element_index[element],
+                                    self.edge_index[edge]]
+        if numpy.isnan(energy):
+            raise KeyError("%s edge %s not known" % (element, edge))
+        return float(energy)
+
+    def get_edge_energies(self, elements, edges):
+        """
+        Descript. : edge energies of lists of elements and edges (nan if
+                    unknown)
+        Return    : numpy array
+        """
+        return self.edge_energies[[self.element_index[element] for element in elements],
+                                  [self.edge_index[edge] for edge in edges]]
+
+    def get_scan_edge(self, element, edge):
+        """
+        Descript. : edge energy and fluorescence line (roi center) used by
+                    the SOLEIL energy scans. Edge L means L3
+        Return    : (edge energy, roi center)
+        """
+        edge = edge.upper()
+        roi_center = self.get_edge_energy(element, edge + '-alpha')
+        if edge == 'L':
+            edge = 'L3'
+        return self.get_edge_energy(element, edge), roi_center
+
+
+def get_static_parameters_table(file_name):
+    return _get_file_table(StaticParametersTable, file_name)
+
+
+def get_undulator_table(file_name):
+    return _get_file_table(UndulatorTable, file_name)
+
+
+_mcmaster_table = None
+
+
+def get_mcmaster_table():
+    global _mcmaster_table
+    if _mcmaster_table is None:
+        from xabs_lib import McMaster
+        _mcmaster_table = McMasterTable(McMaster)
+    return _mcmaster_table
@@ -0,0 +1,188 @@
+"""
+Calibration tables used to convert diode counts to photon flux.
+
+A FluxCalibration keeps the calibration energies sorted in a numpy array
+and one coefficient array per counter (diode), so a coefficient is
+interpolated with a binary search and whole arrays of energies (flux time
+series) are interpolated at once.
+
+Calibrations are built from the calibration channel dictionary
+({key: {"energy": .., counter: ..}}, see PhotonFlux) or from the
+calibrated diodes files (see ESRF/calc_flux.py). FluxCalibrationCache
+rebuilds the calibration only when the channel emits an update and
+get_file_calibration shares the calibration of a file between all users.
+"""
+
+import os
+import bisect
+import logging
+
+import numpy
+
+
+class FluxCalibration(object):
+    """
+    Descript. : sorted calibration table, energies in eV
+    """
+    def __init__(self, energies, coefficients):
+        """
+        Descript. : energies (sequence), coefficients (dict counter name:
+                    sequence of coefficients with the same length)
+        """
+        energies = numpy.asarray(energies, dtype=float)
+        order = numpy.argsort(energies, kind="mergesort")
+        self.energies = energies[order]
+        self.coefficients = {}
+        for counter, values in coefficients.iteritems():
+            self.coefficients[counter] = numpy.asarray(values, dtype=float)[order]
+        self.__energy_list = self.energies.tolist()
+        self.__coefficient_lists = {}
+
+    @staticmethod
+    def from_channel_value(calib_dict):
+        """
+        Descript. : creates calibration from the value of the calibration
+                    channel: dictionary of {"energy": .., counter: ..} dicts
+        """
+        energies = []
+        coefficients = {}
+        for calib in calib_dict.itervalues():
+            energies.append(float(calib["energy"]))
+            for counter, value in calib.iteritems():
+                if counter != "energy":
+                    coefficients.setdefault(counter, []).append(float(value))
+        for counter in coefficients.keys():
+            if len(coefficients[counter]) != len(energies):
+                # Counter not calibrated at all energies
+                del coefficients[counter]
+        return FluxCalibration(energies, coefficients)
+
+    @staticmethod
+    def from_file(file_name):
+        """
+        Descript. : reads calibrated diodes file. Header line starting with
+                    # gives the column labels, first column is the energy
+        Return    : FluxCalibration, labels (lower case) of all columns
+        """
+        labels = []
+        rows = []
+        calib_file = open(file_name)
+        try:
+            for line in calib_file:
+                if line.startswith('#'):
+                    labels = [label.lower() for label in line[1:].split()]
+                elif line.strip():
+                    rows.append(map(float, line.split()))
+        finally:
+            calib_file.close()
+        table = numpy.array(rows, dtype=float).reshape(len(rows), -1)
+        coefficients = {}
+        for index, label in enumerate(labels[1:table.shape[1]]):
+            coefficients[label] = table[:, index + 1]
+        return FluxCalibration(table[:, 0], coefficients), labels
+
+    def get_counters(self):
+        return self.coefficients.keys()
+
+    def get_energy_range(self):
+        return self.__energy_list[0], self.__energy_list[-1]
+
+    def get_coefficient(self, energy, counter, tolerance=None):
+        """
+        Descript. : interpolates the coefficient of counter at energy (eV).
+                    Outside of the table the first/last value is returned
+                    (as numpy.interp). If tolerance is given and
+                    calibration energies are closer than tolerance, the
+                    coefficient of the highest one is returned without
+                    interpolation
+        """
+        energies = self.__energy_list
+        values = self.__coefficient_lists.get(counter)
+        if values is None:
+            values = self.coefficients[counter].tolist()
+            self.__coefficient_lists[counter] = values
+        if tolerance is not None:
+            index = bisect.bisect_left(energies, energy + tolerance) - 1
+            if index >= 0 and energies[index] > energy - tolerance:
+                return values[index]
+        index = bisect.bisect_left(energies, energy)
+        if index == 0:
+            return values[0]
+        if index == len(energies):
+            return values[-1]
+        ratio = (energy - energies[index - 1]) / \
+                (energies[index] - energies[index - 1])
+        return values[index - 1] + ratio * (values[index] - values[index - 1])
+
+    def get_coefficients(self, energies, counter, tolerance=None):
+        """
+        Descript. : vectorized get_coefficient for an array of energies
+        """
+        energies = numpy.asarray(energies, dtype=float)
+        values = self.coefficients[counter]
+        result = numpy.interp(energies, self.energies, values)
+        if tolerance is not None:
+            index = numpy.searchsorted(self.energies, energies + tolerance) - 1
+            closest = numpy.maximum(index, 0)
+            snap = (index >= 0) & (self.energies[closest] > energies - tolerance)
+            result = numpy.where(snap, values[closest], result)
+        return result
+
+    def get_flux(self, counts, energies, counter, aperture_coef=1):
+        """
+        Descript. : flux time series: counts and energies are arrays (or
+                    a scalar energy) of the same length, e.g. counter
+                    readings and energies of each image of a collection
+        Return    : numpy array counts * coefficient * aperture_coef
+        """
+        return numpy.asarray(counts, dtype=float) * aperture_coef * \
+               self.get_coefficients(energies, counter)
+
+
+class FluxCalibrationCache(object):
+    """
+    Descript. : calibration read from the calibration channel. It is
+                rebuilt only when the channel emits an update
+    """
+    def __init__(self, channel, name="flux"):
+        self.channel = channel
+        self.name = name
+        self.calibration = None
+        self.__valid = False
+        channel.connectSignal("update", self.calibration_changed)
+
+    def calibration_changed(self, calib_dict=None):
+        self.__valid = False
+        self.calibration = None
+        if calib_dict is None:
+            return
+        try:
+            self.calibration = FluxCalibration.from_channel_value(calib_dict)
+        except:
+            logging.getLogger("HWR").exception("%s: could not read calibration",
+                                               self.name)
+        self.__valid = True
+
+    def get_calibration(self):
+        """
+        Return    : FluxCalibration or None if calibration is not available
+        """
+        if not self.__valid:
+            self.calibration_changed(self.channel.getValue())
+        return self.calibration
+
+
+_file_calibrations = {}
+
+
+def get_file_calibration(file_name):
+    """
+    Descript. : returns (FluxCalibration, labels) of the calibrated diodes
+                file. File is read again only if it has been modified
+    """
+    mtime = os.path.getmtime(file_name)
+    cached = _file_calibrations.get(file_name)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, FluxCalibration.from_file(file_name))
+        _file_calibrations[file_name] = cached
+    return cached[1]
@@ -524,6 +524,17 @@ class GenericDiffractometer(HardwareObject):
     def motor_positions_to_screen(self, centred_positions_dict):
         raise NotImplementedError
 
+    def motor_positions_to_screen_list(self, centred_positions_list):
+        """
+        Descript. : projects a list of centred positions (dicts) to screen
+                    coordinates. Diffractometers that can snapshot motor
+                    positions and calibration once for the whole list
+                    should reimplement it.
+        Return    : list of (x, y)
+        """
+        return [self.motor_positions_to_screen(centred_positions_dict) for \
+                centred_positions_dict in centred_positions_list]
+
     def move_to_centred_position(self, centred_position):
         self.move_motors(centred_position) 
 
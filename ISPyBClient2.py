@@ -8,8 +8,22 @@ import suds; logging.getLogger("suds").setLevel(logging.INFO)
 import os
 import itertools
 import time
-
+import errno
+import socket
+import hashlib
+import httplib
+import urllib2
+import urlparse
+
+from StringIO import StringIO
+try:
+   from gevent.lock import RLock
+except ImportError:
+   from gevent.coros import RLock
+
+from suds.transport import Reply, TransportError
 from suds.transport.http import HttpAuthenticated
+from suds.cache import ObjectCache
 from suds.client import Client
 from suds import WebFault
 from suds.sudsobject import asdict
@@ -18,6 +32,7 @@ from HardwareRepository.BaseHardwareObjects import HardwareObject
 from datetime import datetime
 from collections import namedtuple
 from pprint import pformat
+from SampleReconciliation import SampleReference, SampleReconciler
 
 
 # Production web-services:    http://160.103.210.1:8080/ispyb-ejb3/ispybWS/
@@ -38,10 +53,18 @@ _CONNECTION_ERROR_MSG = "Could not connect to ISPyB, please verify that " + \
                         "configuration is correct"
 
 
-SampleReference = namedtuple('SampleReference', ['code',
-                                                 'container_reference',
-                                                 'sample_reference',
-                                                 'container_code'])
+# Parsed web-service clients shared by the whole process, see get_ws_client.
+# Parsed WSDL documents are also kept in an on-disk cache, in a directory
+# per WSDL url and version (ETag or Last-Modified header), so a changed
+# WSDL is parsed again.
+_WS_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "mxcube", "suds")
+_WS_CACHE_DAYS = 30
+_WS_KEEP_ALIVE = True
+_WS_CLIENTS = {}
+# gevent lock: held while the WSDL is downloaded, other greenlets
+# waiting for it must not block the hub
+_WS_CLIENTS_LOCK = RLock()
+
 
 def trace(fun):
     def _trace(*args):
@@ -86,6 +109,156 @@ def in_greenlet(fun):
     return _in_greenlet
 
 
+class KeepAliveHttpAuthenticated(HttpAuthenticated):
+    """
+    Authenticated http transport that keeps the connection to the
+    web-service open between requests. The request is sent again on a
+    new connection only if the server had already closed the reused one
+    (nothing read, see _is_stale_connection_error): the storeOrUpdate
+    calls are not idempotent, so any other error is raised. Requests of
+    the greenlets sharing the transport are serialised with a gevent
+    lock, so a greenlet waiting for the connection does not block the hub.
+    """
+    def __init__(self, **kwargs):
+        HttpAuthenticated.__init__(self, **kwargs)
+        self.__connections = {}
+        self.__lock = RLock()
+
+    def send(self, request):
+        if self.options.proxy:
+            return HttpAuthenticated.send(self, request)
+
+        self.addcredentials(request)
+        url = urlparse.urlsplit(request.url)
+        path = url.path
+        if url.query:
+            path += "?" + url.query
+        headers = dict(request.headers)
+        headers["Connection"] = "keep-alive"
+
+        with self.__lock:
+            for attempt in (0, 1):
+                connection = self.__get_connection(url, attempt > 0)
+                reused = connection.sock is not None
+                try:
+                    connection.request("POST", path, request.message, headers)
+                    response = connection.getresponse()
+                except (httplib.HTTPException, socket.error), error:
+                    connection.close()
+                    if attempt or not reused or \
+                       not _is_stale_connection_error(error):
+                        raise
+                    continue
+                try:
+                    body = response.read()
+                except:
+                    connection.close()
+                    raise
+                break
+            if response.getheader("connection", "").lower() == "close":
+                connection.close()
+
+        if response.status in (202, 204):
+            return None
+        if response.status >= 300:
+            raise TransportError(body, response.status, StringIO(body))
+        return Reply(response.status, dict(response.getheaders()), body)
+
+    def __get_connection(self, url, reconnect=False):
+        key = (url.scheme, url.netloc)
+        connection = self.__connections.get(key)
+        if connection is None or reconnect:
+            if url.scheme == "https":
+                connection = httplib.HTTPSConnection(url.netloc,
+                     timeout=self.options.timeout)
+            else:
+                connection = httplib.HTTPConnection(url.netloc,
+                     timeout=self.options.timeout)
+            self.__connections[key] = connection
+        return connection
+
+
+def _is_stale_connection_error(error):
+    """
+    Returns True if error means that the server had closed the kept-alive
+    connection before the request: the request could not be written, or
+    the connection was closed without any byte of response. A timeout or
+    any error after the response has started is not stale
+    """
+    if isinstance(error, httplib.BadStatusLine):
+        return error.line in ("''", "No status line received - " + \
+                              "the server has closed the connection")
+    if isinstance(error, socket.error) and \
+       not isinstance(error, socket.timeout):
+        return error.errno in (errno.EPIPE, errno.ECONNRESET,
+                               errno.ECONNABORTED)
+    return False
+
+
+def _get_wsdl_version(url):
+    """
+    Returns ETag (or Last-Modified) of the WSDL document, empty string
+    if the server does not provide them.
+    """
+    try:
+        request = urllib2.Request(url)
+        request.get_method = lambda: "HEAD"
+        response = urllib2.urlopen(request, timeout=3)
+        headers = response.info()
+        response.close()
+        return headers.getheader("etag") or headers.getheader("last-modified") or ""
+    except Exception:
+        return ""
+
+
+def _get_ws_cache(url):
+    if not _WS_CACHE_DIR:
+        return None
+    cache_key = hashlib.md5(url + _get_wsdl_version(url)).hexdigest()
+    return ObjectCache(location=os.path.join(_WS_CACHE_DIR, cache_key),
+                       days=_WS_CACHE_DAYS)
+
+
+def get_ws_client(url, username=None, password=None, timeout=3):
+    """
+    Returns a web-service client for url. WSDL is downloaded and parsed
+    once per process (and cached on disk). Clients with credentials are
+    clones sharing the parsed WSDL, each with its own (keep-alive)
+    transport, and are reused for the same url and username.
+    """
+    with _WS_CLIENTS_LOCK:
+        client = _WS_CLIENTS.get((url, None))
+        if client is None:
+            client = Client(url, timeout=timeout, cache=_get_ws_cache(url))
+            _WS_CLIENTS[(url, None)] = client
+        if username is None:
+            return client
+
+        auth_client = _WS_CLIENTS.get((url, username))
+        if auth_client is None:
+            # timeout given to the transport: set on the client before
+            # the transport, it would stay on the transport replaced
+            if _WS_KEEP_ALIVE:
+                transport = KeepAliveHttpAuthenticated(username=username,
+                                                       password=password,
+                                                       timeout=timeout)
+            else:
+                transport = HttpAuthenticated(username=username,
+                                              password=password,
+                                              timeout=timeout)
+            auth_client = client.clone()
+            auth_client.set_options(transport=transport)
+            _WS_CLIENTS[(url, username)] = auth_client
+        return auth_client
+
+
+def get_ws_factory(url):
+    """
+    Returns factory used to create value objects of the web-service
+    """
+    return get_ws_client(url).factory
+
+
 def utf_encode(res_d):
     for key in res_d.iterkeys():
         if isinstance(res_d[key], dict):
@@ -114,6 +287,8 @@ class ISPyBClient2(HardwareObject):
         self.__tools_ws = None
         self.__translations = {}
         self.__disabled = False
+        self.__sample_reconciler = SampleReconciler(\
+            lambda sample: utf_encode(asdict(sample)))
 
         self.authServerType = None
         self.loginType = None
@@ -154,6 +329,8 @@ class ISPyBClient2(HardwareObject):
                 global _WS_COLLECTION_URL
                 global _WS_SCREENING_URL
                 global _WS_AUTOPROC_URL
+                global _WS_CACHE_DIR
+                global _WS_KEEP_ALIVE
 
                 _WSDL_ROOT = self.ws_root.strip()
                 _WS_BL_SAMPLE_URL = _WSDL_ROOT + \
@@ -165,33 +342,21 @@ class ISPyBClient2(HardwareObject):
                 _WS_AUTOPROC_URL = _WSDL_ROOT + \
                     'ToolsForAutoprocessingWebService?wsdl'
 
-                t1 = HttpAuthenticated(username = self.ws_username, 
-                                      password = self.ws_password)
-                
-                t2 = HttpAuthenticated(username = self.ws_username, 
-                                      password = self.ws_password)
-                
-                t3 = HttpAuthenticated(username = self.ws_username, 
-                                      password = self.ws_password)
-
-                t4 = HttpAuthenticated(username = self.ws_username,
-                                       password = self.ws_password)
-                
+                if self.getProperty("ws_cache_dir") is not None:
+                    _WS_CACHE_DIR = self.getProperty("ws_cache_dir")
+                if self.getProperty("ws_keep_alive") is not None:
+                    _WS_KEEP_ALIVE = self.getProperty("ws_keep_alive") in \
+                                     (True, "True", "true", "1")
+
                 try: 
-                    self.__shipping = Client(_WS_SHIPPING_URL, timeout = 3,
-                                             transport = t1, cache = None)
-                    self.__collection = Client(_WS_COLLECTION_URL, timeout = 3,
-                                               transport = t2, cache = None)
-                    self.__tools_ws = Client(_WS_BL_SAMPLE_URL, timeout = 3,
-                                             transport = t3, cache = None)
-                    self.__autoproc_ws = Client(_WS_AUTOPROC_URL, timeout = 3,
-                                             transport = t4, cache = None)
-                
-                    # ensure that suds do not create those files in tmp 
-                    self.__shipping.set_options(cache=None)
-                    self.__collection.set_options(cache=None)
-                    self.__tools_ws.set_options(cache=None)
-                    self.__autoproc_ws.set_options(cache=None)
+                    self.__shipping = get_ws_client(_WS_SHIPPING_URL,
+                         self.ws_username, self.ws_password)
+                    self.__collection = get_ws_client(_WS_COLLECTION_URL,
+                         self.ws_username, self.ws_password)
+                    self.__tools_ws = get_ws_client(_WS_BL_SAMPLE_URL,
+                         self.ws_username, self.ws_password)
+                    self.__autoproc_ws = get_ws_client(_WS_AUTOPROC_URL,
+                         self.ws_username, self.ws_password)
                 except URLError:
                     logging.getLogger("ispyb_client")\
                         .exception(_CONNECTION_ERROR_MSG)
@@ -888,40 +1053,38 @@ class ISPyBClient2(HardwareObject):
             logging.getLogger("ispyb_client").\
                 exception("Error in store_image: could not connect to server")
 
-
-    def __find_sample(self, sample_ref_list, code = None, location = None):
+    def store_images(self, image_dict_list):
         """
-        Returns the sample with the matching "search criteria" <code> and/or
-        <location> with-in the list sample_ref_list.
-
-        The sample_ref object is defined in the head of the file.
+        Stores a batch of images (image parameters). Stops at the first
+        connection error, the images not stored have a None id so the
+        caller can send them again (and only them).
 
-        :param sample_ref_list: The list of sample_refs to search.
-        :type sample_ref: list
+        :param image_dict_list: A list of dictonaries with image pramaters.
+        :type image_dict_list: list
 
-        :param code: The vial datamatrix code (or bar code)
-        :param type: str
-
-        :param location: A tuple (<basket>, <vial>) to search for.
-        :type location: tuple
+        :returns: list of image ids, None for the images not stored
         """
-        for sample_ref in sample_ref_list:
-
-            if code and location:
-                if sample_ref.code == code and \
-                        sample_ref.container_reference == location[0] and \
-                        sample_ref.sample_reference == location[1]:
-                    return sample_ref
-            elif code:
-                if sample_ref.code == code:
-                    return sample_ref
-            elif location:
-                if sample_ref.container_reference == location[0] and \
-                       sample_ref.sample_reference == location[1]:
-                    return sample_ref
+        image_ids = [None] * len(image_dict_list)
+        if self.__disabled:
+            return image_ids
 
-        return None
+        if not self.__collection:
+            logging.getLogger("ispyb_client").\
+                error("Error in store_images: could not connect to server")
+            return image_ids
 
+        for index, image_dict in enumerate(image_dict_list):
+            try:
+                image_ids[index] = self.__collection.service.\
+                     storeOrUpdateImage(image_dict)
+            except WebFault:
+                logging.getLogger("ispyb_client").\
+                    exception("ISPyBClient: exception in store_images")
+            except (URLError, TransportError, socket.error,
+                    httplib.HTTPException):
+                logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
+                break
+        return image_ids
 
     @trace
     def get_samples(self, proposal_id, session_id):
@@ -968,14 +1131,8 @@ class ISPyBClient2(HardwareObject):
         :rtype: list
         """
         if self.__tools_ws:
-            sample_references = []
-            session = self.get_session(session_id)
             response_samples = []
 
-            for sample_ref in sample_refs:
-                sample_reference = SampleReference(*sample_ref)
-                sample_references.append(sample_reference)
-
             try:
                 response_samples = self.__tools_ws.service.\
                     findSampleInfoLightForProposal(proposal_id,
@@ -986,105 +1143,11 @@ class ISPyBClient2(HardwareObject):
             except URLError:
                 logging.getLogger("ispyb_client").exception(_CONNECTION_ERROR_MSG)
 
-            samples = []
-            for sample in response_samples:
-                try:
-                    loc = [None, None]
-                    try:
-                      loc[0]=int(sample.containerSampleChangerLocation)
-                    except:
-                      pass
-                    try:
-                      loc[1]=int(sample.sampleLocation)
-                    except:
-                      pass
-
-                    # Unmatched sample, just catch and do nothing
-                    # (dont remove from sample_ref)
-                    if not sample.code and \
-                            not sample.sampleLocation:
-                        pass
-                    # Sample location and code was found in ISPyB and they match
-                    # with the sample changer.
-                    elif sample.code and sample.sampleLocation:
-                        sc_sample = \
-                            self.__find_sample(sample_references,
-                                               code = sample.code,
-                                               location = loc)
-
-                        # The sample codes dose not match
-                        if not sc_sample:
-                            sc_sample = self.__find_sample(sample_references,
-                                                           location = loc)
-
-                            if sc_sample.code != '':
-                                sample.code = sc_sample.code
-
-                        sample_references.remove(sc_sample)
-
-
-                    # Only location was found, update with the code
-                    # from sample changer if it exists.
-                    elif sample.sampleLocation:
-                        sc_sample = \
-                            self.__find_sample(sample_references,
-                                               location = loc)
-                        if sc_sample:
-                            sample.sampleCode = sc_sample.code
-                            sample_references.remove(sc_sample)
-
-                    # Sample code was found in ISPyB but dosent match with
-                    # the samplechanger at given location
-                    #
-                    # Use the information from the sample changer.
-                    else:
-                        #Use sample changer code for sample  ?
-                        sample.containerSampleChangerLocation = \
-                            sample_references.containter_referance
-                        sample.sampleLocation = \
-                            sample_references.sample_reference
-
-                        loc = (int(sample.containerSampleChangerLocation),
-                               int(sample.sampleLocation))
-
-                        sc_sample = \
-                            self.__find_sample(sample_references,
-                                               location = loc)
-                        if sc_sample:
-                            sample.code = sc_sample.code
-                            sample_references.remove(sc_sample)
-
-
-                    samples.append(utf_encode(asdict(sample)))
-
-#                         {'BLSample': utf_encode(asdict(sample.blSample)),
-#                          'Container': utf_encode(asdict(sample.container)),
-#                          'Crystal': utf_encode(asdict(sample.crystal)),
-#                          'DiffractionPlan_BLSample': \
-#                              utf_encode(asdict(sample.diffractionPlan)),
-#                          'Protein': utf_encode(asdict(sample.protein))})
-                except:
-                    pass
-
-
-            # Add the unmatched samples to the result from ISPyB
-            for sample_ref in sample_references:
-                samples.append(
-                    {'code': sample_ref.code,
-                     'location': sample_ref.sample_reference,
-                     'containerSampleChangerLocation': sample_ref.container_reference})
-                #  samples.append(
-#                     {'BLSample': {'code': sample_ref.code,
-#                                   'location': \
-#                                   sample_ref.sample_reference},
-#                      'Container': {'sampleChangerLocation': \
-#                                        sample_ref.container_reference},
-#                      'Crystal': {},
-#                      'DiffractionPlan_BLSample': {},
-#                      'Protein': {}})
-
+            samples, changes = self.__sample_reconciler.reconcile(\
+                response_samples, sample_refs)
 
             return {'loaded_sample': samples,
+                    'changes': changes,
                     'status': {'code':'ok'}}
         else:
             logging.getLogger("ispyb_client").\
@@ -1387,6 +1450,10 @@ class ISPyBClient2(HardwareObject):
         self.__disabled = False
 
 
+    def is_disabled(self):
+        return self.__disabled
+
+
     def isInhouseUser(self, proposal_code, proposal_number):
         """
         Returns True if the proposal is considered to be a
@@ -2168,16 +2235,7 @@ class ISPyBValueFactory():
         Ceates workflow3VO from worflow_info_dict.
         :rtype: workflow3VO
         """
-        ws_client = None
-        workflow_vo = None
-
-        try:
-            ws_client = Client(_WS_COLLECTION_URL,
-                               cache = None)
-            workflow_vo = \
-                ws_client.factory.create('workflow3VO')
-        except:
-            raise
+        workflow_vo = get_ws_factory(_WS_COLLECTION_URL).create('workflow3VO')
 
         try:
             if workflow_info_dict.get("workflow_id"):
@@ -2200,16 +2258,7 @@ class ISPyBValueFactory():
         Ceates workflowMesh3VO from worflow_info_dict.
         :rtype: workflowMesh3VO
         """
-        ws_client = None
-        workflow_mesh_vo = None
-
-        try:
-            ws_client = Client(_WS_COLLECTION_URL,
-                               cache = None)
-            workflow_mesh_vo = \
-                ws_client.factory.create('workflowMeshWS3VO')
-        except:
-            raise
+        workflow_mesh_vo = get_ws_factory(_WS_COLLECTION_URL).create('workflowMeshWS3VO')
 
         try:
             if workflow_info_dict.get("workflow_mesh_id"):
@@ -2233,16 +2282,7 @@ class ISPyBValueFactory():
         Ceates grid3VO from worflow_info_dict.
         :rtype: grid3VO
         """
-        ws_client = None
-        grid_info_vo = None
-
-        try:
-            ws_client = Client(_WS_COLLECTION_URL,
-                               cache = None)
-            grid_info_vo = \
-                ws_client.factory.create('gridInfoWS3VO')
-        except:
-            raise
+        grid_info_vo = get_ws_factory(_WS_COLLECTION_URL).create('gridInfoWS3VO')
 
         try:
             if workflow_info_dict.get("grid_info_id"):
@@ -2268,3 +2308,100 @@ class ISPyBArgumentError(Exception):
 
     def __str__(self):
         return repr(self.value)
+
+
+if __name__ == '__main__':
+    # Latency of creating a value object with a cold and a warm client,
+    # and of a web-service call with and without keep-alive.
+    # Usage: python ISPyBClient2.py [wsdl url, e.g. file:///tmp/ws.wsdl] [type]
+    # Without url the WSDL of ispyb_test_data is used.
+    import sys
+    import shutil
+    import tempfile
+    import threading
+    import BaseHTTPServer
+    from ispyb_test_data import ISPYB_COLLECTION_WSDL
+
+    _WS_CACHE_DIR = tempfile.mkdtemp()
+    if len(sys.argv) > 1:
+        wsdl_url = sys.argv[1]
+    else:
+        wsdl_path = os.path.join(_WS_CACHE_DIR, "collection.wsdl")
+        with open(wsdl_path, "w") as wsdl_file:
+            wsdl_file.write(ISPYB_COLLECTION_WSDL)
+        wsdl_url = "file://" + wsdl_path
+    type_name = sys.argv[2] if len(sys.argv) > 2 else "workflow3VO"
+    num_calls = 20
+
+    start_time = time.time()
+    for i in range(num_calls):
+        Client(wsdl_url, cache = None).factory.create(type_name)
+    print "New client per call     : %.2f ms" % ((time.time() - start_time) * 1000 / num_calls)
+
+    start_time = time.time()
+    get_ws_factory(wsdl_url).create(type_name)
+    print "Cold (empty disk cache) : %.2f ms" % ((time.time() - start_time) * 1000)
+
+    _WS_CLIENTS.clear()
+    start_time = time.time()
+    get_ws_factory(wsdl_url).create(type_name)
+    print "New process, disk cache : %.2f ms" % ((time.time() - start_time) * 1000)
+
+    start_time = time.time()
+    for i in range(num_calls):
+        get_ws_factory(wsdl_url).create(type_name)
+    print "Warm (process registry) : %.2f ms" % ((time.time() - start_time) * 1000 / num_calls)
+
+    if len(sys.argv) == 1:
+        # storeOrUpdateImage on a local server, which closes the kept-alive
+        # connections after 5 requests: the transport reconnects and each
+        # image is stored once
+        class ImageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # response written in one packet (Nagle and delayed ack)
+            wbufsize = -1
+            stored = []
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers["content-length"]))
+                self.stored.append(None)
+                body = '<?xml version="1.0"?><env:Envelope ' \
+                    'xmlns:env="http://schemas.xmlsoap.org/soap/envelope/">' \
+                    '<env:Body><ns1:storeOrUpdateImageResponse ' \
+                    'xmlns:ns1="http://ispyb.ejb3.webservices.collection/">' \
+                    '<return>%d</return></ns1:storeOrUpdateImageResponse>' \
+                    '</env:Body></env:Envelope>' % len(self.stored)
+                self.send_response(200)
+                self.send_header("Content-Type", "text/xml")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                self.requests = getattr(self, "requests", 0) + 1
+                if self.requests == 5:
+                    self.close_connection = 1
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), ImageHandler)
+        server_thread = threading.Thread(target=server.serve_forever)
+        server_thread.daemon = True
+        server_thread.start()
+        location = "http://127.0.0.1:%d/ToolsForCollectionWebService" % \
+                   server.server_port
+        num_calls = 200
+
+        for keep_alive in (False, True):
+            _WS_KEEP_ALIVE = keep_alive
+            client = get_ws_client(wsdl_url, "user%d" % keep_alive, "pass")
+            client.set_options(location=location)
+            del ImageHandler.stored[:]
+            start_time = time.time()
+            for i in range(num_calls):
+                client.service.storeOrUpdateImage({"imageNumber": i})
+            print "storeOrUpdateImage, keep-alive %-5s: %.2f ms (%d stored)" % \
+                (keep_alive, (time.time() - start_time) * 1000 / num_calls,
+                 len(ImageHandler.stored))
+        server.shutdown()
+
+    shutil.rmtree(_WS_CACHE_DIR)
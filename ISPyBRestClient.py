@@ -9,6 +9,7 @@ from requests import put, get, post
 
 from HardwareRepository import HardwareRepository
 from HardwareRepository.BaseHardwareObjects import HardwareObject
+from SampleReconciliation import SampleReconciler
 
 _CONNECTION_ERROR_MSG = "Could not connect to ISPyB, please verify that " + \
                         "the server is running and that your " + \
@@ -47,6 +48,7 @@ class ISPyBRestClient(HardwareObject):
         self.__rest_username = None
         self.__rest_token = None
         self.__rest_token_timestamp = None 
+        self.__sample_reconciler = SampleReconciler()
 
     def init(self):
         """
@@ -259,25 +261,6 @@ class ISPyBRestClient(HardwareObject):
         pass
 
     
-    def __find_sample(self, sample_ref_list, code = None, location = None):
-        """
-        Returns the sample with the matching "search criteria" <code> and/or
-        <location> with-in the list sample_ref_list.
-
-        The sample_ref object is defined in the head of the file.
-        
-        :param sample_ref_list: The list of sample_refs to search.
-        :type sample_ref: list
-        
-        :param code: The vial datamatrix code (or bar code)
-        :param type: str
-
-        :param location: A tuple (<basket>, <vial>) to search for.
-        :type location: tuple
-        """
-        pass
-
-
     def get_samples(self, proposal_id, session_id):
         pass
     
@@ -305,7 +288,12 @@ class ISPyBRestClient(HardwareObject):
         :returns: A list with sample_ref objects.
         :rtype: list
         """
-        pass
+        samples, changes = self.__sample_reconciler.reconcile(\
+            self.get_samples(proposal_id, session_id) or [], sample_refs)
+
+        return {'loaded_sample': samples,
+                'changes': changes,
+                'status': {'code':'ok'}}
 
     
     def get_bl_sample(self, bl_sample_id):
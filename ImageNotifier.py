@@ -0,0 +1,473 @@
+"""
+Image notification service: tells image viewers (adxv, Albula, ...) and
+image trackers which image has just been collected.
+
+The collect objects only publish (path, frame) events. Each subscriber
+keeps one persistent connection to its viewer and has its own greenlet,
+one slot buffer and minimal interval between two notifications. When the
+detector is faster than a subscriber, the pending image is replaced by
+the latest one, so a slow viewer always shows the last image and never
+delays the collection or the other subscribers. The images are only
+coalesced while the subscriber waits (min_interval, delay, file), a
+viewer that reads its socket faster than it displays the images needs a
+min_interval close to its display time.
+
+Protocols:
+    adxv    "load_image <path>\\n" text lines (adxv -socket)
+    albula  pickled {"type": "newimage", "path": <path>} and
+            {"type": "newcollection"} dictionaries
+
+Subscriber options:
+    min_interval  minimal time (s) between two notifications
+    delay         an image is sent at least delay (s) after it has been
+                  published, e.g. to let the detector write the file
+    file_timeout  if > 0, the image is sent once the file exists, or
+                  skipped after file_timeout (s)
+    persistent    False: one connection per notification
+
+Example of xml:
+    <object class="ImageNotifier">
+      <subscribers>
+        <subscriber>
+          <name>adxv</name>
+          <protocol>adxv</protocol>
+          <host>aelita.esrf.fr</host>
+          <port>8100</port>
+          <delay>1</delay>
+          <min_interval>3</min_interval>
+        </subscriber>
+      </subscribers>
+    </object>
+
+Example:
+    image_notifier_hwobj = self.getObjectByRole("image_notifier")
+    image_notifier_hwobj.new_collection()
+    image_notifier_hwobj.publish(image_path, frame_number)
+
+ImageSubscriber can also be used without the hardware object, as in
+ImageTracking.
+
+Run the module to compare the persistent notifications with one
+connection per image:
+    python ImageNotifier.py [num_images] [frame_rate]
+"""
+
+import os
+import sys
+import time
+import pickle
+import logging
+
+import gevent
+import gevent.event
+import gevent.select
+from gevent import socket
+
+from HardwareRepository.BaseHardwareObjects import HardwareObject
+from VideoFramePipeline import FrameRateCounter
+
+
+PROTOCOLS = ("adxv", "albula")
+NEW_IMAGE = "newimage"
+NEW_COLLECTION = "newcollection"
+
+
+class ImageEvent(object):
+    """
+    Descript. : image published by a collect object
+    """
+    __slots__ = ("type", "path", "frame", "time")
+
+    def __init__(self, event_type, path=None, frame=None):
+        self.type = event_type
+        self.path = path
+        self.frame = frame
+        self.time = time.time()
+
+
+def format_message(protocol, event):
+    """
+    Descript. : message sent to a viewer, None if the protocol has no
+                message for the event
+    """
+    if protocol == "adxv":
+        if event.type == NEW_IMAGE:
+            return "load_image %s\n" % event.path
+        return None
+    if event.type == NEW_IMAGE:
+        return pickle.dumps({"type": NEW_IMAGE, "path": event.path})
+    return pickle.dumps({"type": event.type})
+
+
+class ImageSubscriber(object):
+    """
+    Descript. : sends the latest published image to one viewer through
+                a persistent connection
+    """
+    def __init__(self, name, host, port, protocol="adxv", min_interval=0,
+                 delay=0, file_timeout=0, persistent=True,
+                 connect_timeout=1.0, reconnect_interval=5.0):
+        if protocol not in PROTOCOLS:
+            raise ValueError("Unknown image notification protocol %s" % protocol)
+        self.name = name
+        self.host = host
+        self.port = int(port)
+        self.protocol = protocol
+        self.min_interval = min_interval
+        self.delay = delay
+        self.file_timeout = file_timeout
+        self.persistent = persistent
+        self.connect_timeout = connect_timeout
+        self.reconnect_interval = reconnect_interval
+
+        self.images_coalesced = 0
+        self.images_skipped = 0
+        self.connections = 0
+        self.errors = 0
+        self.last_path = None
+        self.output_counter = FrameRateCounter()
+
+        self.__image = None
+        self.__new_collection = None
+        self.__socket = None
+        self.__connect_error_time = 0
+        self.__last_send_time = 0
+        self.__reconnect = False
+        self.__new_event = gevent.event.Event()
+        # publish can be called from other threads (e.g. DataCollectPX2),
+        # the async watcher wakes up the greenlet in the gevent thread
+        loop = gevent.get_hub().loop
+        self.__watcher = (getattr(loop, "async_", None) or getattr(loop, "async"))()
+        self.__watcher.start(self.__new_event.set)
+        self.__task = None
+
+    def start(self):
+        if self.__task is None:
+            self.__task = gevent.spawn(self.__send_events)
+
+    def stop(self):
+        if self.__task is not None:
+            self.__task.kill()
+            self.__task = None
+        self.__disconnect()
+
+    def reconnect(self):
+        """
+        Descript. : the next message is sent through a new connection
+                    (e.g. the viewer has been restarted). Can be called
+                    from other threads, the socket is closed by the
+                    greenlet of the subscriber
+        """
+        self.__reconnect = True
+        self.__watcher.send()
+
+    def put(self, event):
+        """
+        Descript. : puts event in the one slot buffer. An image that has not
+                    been sent yet is replaced, a new collection event is
+                    kept and sent before the image
+        """
+        if event.type == NEW_IMAGE:
+            if self.__image is not None:
+                self.images_coalesced += 1
+            self.__image = event
+        else:
+            self.__new_collection = event
+            self.__image = None
+        self.__watcher.send()
+
+    def get_statistics(self):
+        return {"name": self.name,
+                "host": self.host,
+                "port": self.port,
+                "protocol": self.protocol,
+                "connected": self.__socket is not None,
+                "rate": self.output_counter.get_fps(),
+                "images": self.output_counter.count,
+                "images_coalesced": self.images_coalesced,
+                "images_skipped": self.images_skipped,
+                "connections": self.connections,
+                "errors": self.errors,
+                "last_path": self.last_path}
+
+    def __send_events(self):
+        while True:
+            self.__new_event.wait()
+            self.__new_event.clear()
+            try:
+                self.__send_next_event()
+            except Exception:
+                self.errors += 1
+                self.__disconnect()
+                logging.getLogger("HWR").exception(\
+                    "ImageNotifier: %s failed to send image" % self.name)
+            if self.__image is not None or self.__new_collection is not None:
+                self.__new_event.set()
+
+    def __send_next_event(self):
+        self.__check_reconnect()
+        wait_time = self.__last_send_time + self.min_interval - time.time()
+        if wait_time > 0:
+            gevent.sleep(wait_time)
+
+        event = self.__new_collection
+        if event is not None:
+            self.__new_collection = None
+        else:
+            event = self.__image
+            self.__image = None
+            if event is None:
+                return
+            if self.delay:
+                gevent.sleep(max(0, event.time + self.delay - time.time()))
+            if self.file_timeout and not self.__wait_for_file(event.path):
+                self.images_skipped += 1
+                return
+
+        message = format_message(self.protocol, event)
+        if message is not None and self.__send(message):
+            self.__last_send_time = time.time()
+            if event.type == NEW_IMAGE:
+                self.last_path = event.path
+                self.output_counter.add()
+
+    def __wait_for_file(self, path):
+        end_time = time.time() + self.file_timeout
+        while not os.path.exists(path):
+            # A newer image replaces the one that is not written yet
+            if self.__image is not None or time.time() > end_time:
+                return False
+            gevent.sleep(0.1)
+        return True
+
+    def __connect(self):
+        if time.time() < self.__connect_error_time + self.reconnect_interval:
+            return False
+        try:
+            self.__socket = socket.create_connection((self.host, self.port),
+                                                     self.connect_timeout)
+        except (socket.error, socket.timeout) as ex:
+            self.errors += 1
+            self.__connect_error_time = time.time()
+            logging.getLogger("HWR").warning(\
+                "ImageNotifier: cannot connect to %s (%s:%d): %s, " \
+                "next attempt in %d s" % (self.name, self.host, self.port,
+                                           ex, self.reconnect_interval))
+            return False
+        self.__socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connections += 1
+        return True
+
+    def __is_closed(self):
+        # Viewer closed the connection (or sent something that is ignored)
+        try:
+            readable = gevent.select.select([self.__socket], [], [], 0)[0]
+            return bool(readable) and not self.__socket.recv(4096)
+        except (socket.error, socket.timeout):
+            return True
+
+    def __check_reconnect(self):
+        if self.__reconnect:
+            self.__reconnect = False
+            self.__connect_error_time = 0
+            self.__disconnect()
+
+    def __disconnect(self):
+        if self.__socket is not None:
+            try:
+                self.__socket.close()
+            except socket.error:
+                pass
+            self.__socket = None
+
+    def __send(self, message):
+        self.__check_reconnect()
+        if self.__socket is not None and self.__is_closed():
+            self.__disconnect()
+        # Second attempt with a new connection if the viewer was restarted
+        for attempt in range(2):
+            if self.__socket is None and not self.__connect():
+                return False
+            try:
+                self.__socket.sendall(message)
+            except (socket.error, socket.timeout):
+                self.errors += 1
+                self.__disconnect()
+                continue
+            if not self.persistent:
+                self.__disconnect()
+            return True
+        return False
+
+
+class ImageNotifier(HardwareObject):
+    """
+    Descript. : distributes the images published by the collect objects
+                to the configured subscribers
+    """
+    def __init__(self, name):
+        HardwareObject.__init__(self, name)
+        self.subscribers = []
+        self.images_published = 0
+
+    def init(self):
+        if self.hasObject("subscribers"):
+            subscribers = next(self.getObjects("subscribers"))
+            for subscriber in subscribers.getObjects("subscriber"):
+                kwargs = {}
+                for option in ("min_interval", "delay", "file_timeout",
+                               "connect_timeout", "reconnect_interval"):
+                    value = subscriber.getProperty(option)
+                    if value is not None:
+                        kwargs[option] = float(value)
+                for option in ("protocol", "persistent"):
+                    value = subscriber.getProperty(option)
+                    if value is not None:
+                        kwargs[option] = value
+                try:
+                    self.add_subscriber(subscriber.getProperty("name"),
+                                        subscriber.getProperty("host"),
+                                        subscriber.getProperty("port"),
+                                        **kwargs)
+                except (ValueError, TypeError):
+                    logging.getLogger("HWR").exception(\
+                        "ImageNotifier: invalid subscriber configuration")
+
+    def add_subscriber(self, name, host, port, **kwargs):
+        """
+        Descript. : adds and starts a subscriber, kwargs are the
+                    ImageSubscriber options
+        Return    : ImageSubscriber
+        """
+        subscriber = ImageSubscriber(name or "%s:%s" % (host, port),
+                                     host, port, **kwargs)
+        self.subscribers.append(subscriber)
+        subscriber.start()
+        return subscriber
+
+    def remove_subscriber(self, subscriber):
+        if subscriber in self.subscribers:
+            subscriber.stop()
+            self.subscribers.remove(subscriber)
+
+    def publish(self, path, frame=None):
+        """
+        Descript. : notifies the subscribers of a new image. Does not
+                    block, can be called for each frame
+        """
+        self.images_published += 1
+        event = ImageEvent(NEW_IMAGE, path, frame)
+        for subscriber in self.subscribers:
+            subscriber.put(event)
+
+    def new_collection(self):
+        event = ImageEvent(NEW_COLLECTION)
+        for subscriber in self.subscribers:
+            subscriber.put(event)
+
+    def get_statistics(self):
+        return {"images": self.images_published,
+                "subscribers": [subscriber.get_statistics() for \
+                                subscriber in self.subscribers]}
+
+
+def _notify_one_connection_per_image(host, port, path):
+    # Previous implementation of ImageTracking.load_image, for the benchmark
+    active_socket = socket.socket()
+    active_socket.connect((host, port))
+    active_socket.send("load_image %s\n" % path)
+    active_socket.close()
+
+
+class _ViewerServer(object):
+    """
+    Descript. : adxv like server taking processing_time (s) to display
+                each image it receives
+    """
+    def __init__(self, processing_time=0):
+        self.processing_time = processing_time
+        self.images = []
+        self.connections = 0
+        self.server_socket = socket.socket()
+        self.server_socket.bind(("127.0.0.1", 0))
+        self.server_socket.listen(128)
+        self.port = self.server_socket.getsockname()[1]
+        self.task = gevent.spawn(self.serve)
+
+    def serve(self):
+        while True:
+            connection = self.server_socket.accept()[0]
+            self.connections += 1
+            gevent.spawn(self.read_lines, connection)
+
+    def read_lines(self, connection):
+        for line in connection.makefile():
+            if self.processing_time:
+                gevent.sleep(self.processing_time)
+            self.images.append(line.split()[1])
+
+    def wait_for_image(self, path, timeout):
+        end_time = time.time() + timeout
+        while path not in self.images[-1:] and time.time() < end_time:
+            gevent.sleep(0.01)
+        return path in self.images[-1:]
+
+    def stop(self):
+        self.task.kill()
+        self.server_socket.close()
+
+
+if __name__ == '__main__':
+    num_images = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    frame_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 100.0
+    paths = ["/data/test/test_1_%05d.cbf" % index for index in range(1, num_images + 1)]
+
+    # Time spent by the collect object for each image
+    server = _ViewerServer()
+    start_time = time.time()
+    for path in paths:
+        _notify_one_connection_per_image("127.0.0.1", server.port, path)
+    old_time = time.time() - start_time
+    server.wait_for_image(paths[-1], 5)
+    print("%d images, one connection per image: %6.3f ms per image, " \
+          "%4d connections, %4d images received" % (num_images,
+          1000 * old_time / num_images, server.connections, len(server.images)))
+    server.stop()
+
+    server = _ViewerServer()
+    subscriber = ImageSubscriber("adxv", "127.0.0.1", server.port)
+    subscriber.start()
+    start_time = time.time()
+    for path in paths:
+        subscriber.put(ImageEvent(NEW_IMAGE, path))
+    new_time = time.time() - start_time
+    received = server.wait_for_image(paths[-1], 5)
+    print("%d images, persistent subscriber:    %6.3f ms per image, " \
+          "%4d connections, %4d images received, last image %s" % (num_images,
+          1000 * new_time / num_images, server.connections, len(server.images),
+          "ok" if received else "WRONG"))
+    subscriber.stop()
+    server.stop()
+
+    # Viewers taking 50 ms per image, images published at frame_rate
+    for min_interval in (0, 0.06):
+        server = _ViewerServer(processing_time=0.05)
+        subscriber = ImageSubscriber("viewer", "127.0.0.1", server.port,
+                                     min_interval=min_interval)
+        subscriber.start()
+        start_time = time.time()
+        for index, path in enumerate(paths):
+            subscriber.put(ImageEvent(NEW_IMAGE, path, index))
+            gevent.sleep(max(0, start_time + (index + 1) / frame_rate - time.time()))
+        end_time = time.time()
+        displayed = server.images[-1:]
+        behind = num_images - 1 - (paths.index(displayed[0]) if displayed else -1)
+        server.wait_for_image(paths[-1], num_images * 0.05 + 1)
+        stats = subscriber.get_statistics()
+        print("%d images at %.0f Hz, min_interval %.2f s: %4d sent, " \
+              "%4d coalesced, viewer %4d images behind at the end, " \
+              "last image shown %.2f s later" % (num_images, frame_rate,
+              min_interval, stats["images"], stats["images_coalesced"], behind,
+              time.time() - end_time))
+        subscriber.stop()
+        server.stop()
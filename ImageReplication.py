@@ -0,0 +1,522 @@
+"""
+Background replication of the collected images to another computer
+(see PX2Experiment).
+
+The collect object adds each image with add_file(path, destination) and
+continues. One worker thread does the rest:
+
+- file watch: the images waiting to be complete are checked with one
+  os.stat pass every poll_interval. An image is complete when it has the
+  expected size or, if no size is given, when its size and modification
+  time have not changed for settle_time. On NFS the attributes are cached
+  (acregmin, 3 s by default), so settle_time has to be longer than the
+  attribute cache. Images still incomplete after complete_timeout are
+  sent as they are.
+- batches: the complete images of the same directory and destination are
+  sent with one "rsync --files-from=-" command (at most max_batch_size
+  images). While a transfer is running the next images accumulate, so
+  the batches grow when the transfers are slower than the detector.
+- at most max_transfers rsync commands run at the same time. On a remote
+  host the commands go through one persistent ssh connection
+  (ControlMaster, see detectors.LimaCommon.RemoteDirectoryCache).
+
+The lag of each image (added to transferred) is kept in histograms,
+get_statistics returns them with the counters.
+
+At the end of a collection, reconcile sends all the images of the
+collection again with rsync: the copies that are identical are skipped,
+the ones that failed or were truncated are repaired.
+
+If host is the local computer, rsync is run locally, or the images are
+copied by the worker if rsync is not installed, so a local destination
+directory can be used for tests.
+
+Example:
+    replication = ImageReplication("p10", expected_size=18874880)
+    replication.start()
+    replication.makedirs(destination)
+    replication.add_file(image_path, destination)
+    ...
+    replication.wait(60)
+    replication.reconcile(directory, destination, "test_1_*.img")
+    replication.wait(60)
+
+Run the module to compare it with one thread and one process per image:
+    python ImageReplication.py [num_images] [frame_rate]
+"""
+
+import os
+import sys
+import time
+import Queue
+import pipes
+import fnmatch
+import shutil
+import logging
+import tempfile
+import threading
+import subprocess
+import collections
+from distutils.spawn import find_executable
+
+import gevent
+
+from QueueTimings import TimingHistogram
+from detectors.LimaCommon import RemoteDirectoryCache
+
+
+class ReplicatedFile(object):
+    """
+    Descript. : image to replicate and the times used for the lag
+    """
+    __slots__ = ("path", "destination", "reconcile", "queued_time",
+                 "ready_time", "size", "mtime", "stable_time", "attempts")
+
+    def __init__(self, path, destination, reconcile=False):
+        self.path = path
+        self.destination = destination
+        # Sent without waiting for the file to be complete
+        self.reconcile = reconcile
+        self.queued_time = time.time()
+        self.ready_time = None
+        self.size = None
+        self.mtime = None
+        self.stable_time = None
+        self.attempts = 0
+
+
+class ReplicationTransfer(object):
+    """
+    Descript. : one batch of images of the same directory and destination
+    """
+    def __init__(self, directory, destination, files):
+        self.directory = directory
+        self.destination = destination
+        self.files = files
+        self.start_time = time.time()
+        self.process = None
+        self.error_file = None
+        self.returncode = None
+
+    def poll(self):
+        if self.process is not None and self.returncode is None:
+            self.returncode = self.process.poll()
+        return self.returncode
+
+    def get_error(self):
+        if self.error_file is None:
+            return ""
+        self.error_file.seek(0)
+        return self.error_file.read().strip()
+
+    def close(self):
+        if self.error_file is not None:
+            self.error_file.close()
+            self.error_file = None
+
+
+class ImageReplication(object):
+    """
+    Descript. : replicates images with batched rsync transfers from one
+                worker thread
+    """
+    def __init__(self, host=None, user=None, expected_size=None,
+                 settle_time=5.0, poll_interval=0.1, complete_timeout=60,
+                 max_transfers=1, max_batch_size=500, max_attempts=3,
+                 rsync_options=("-a",)):
+        self.directories = RemoteDirectoryCache(host, user)
+        self.host = host
+        self.expected_size = expected_size
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.complete_timeout = complete_timeout
+        self.max_transfers = max_transfers
+        self.max_batch_size = max_batch_size
+        self.max_attempts = max_attempts
+        self.rsync_options = list(rsync_options)
+        self.rsync = None
+        if not self.directories.is_local or find_executable("rsync"):
+            self.rsync = "rsync"
+
+        self.files_added = 0
+        self.files_transferred = 0
+        self.files_reconciled = 0
+        self.files_failed = 0
+        self.files_missing = 0
+        self.files_incomplete = 0
+        self.bytes_transferred = 0
+        self.transfers = 0
+        self.lag = TimingHistogram()
+        self.completion_lag = TimingHistogram()
+        self.transfer_lag = TimingHistogram()
+
+        self.__new_files = Queue.Queue()
+        # (path, destination): ReplicatedFile, in the order of the images
+        self.__waiting = collections.OrderedDict()
+        # (directory, destination): [ReplicatedFile]
+        self.__ready = collections.OrderedDict()
+        self.__running = []
+        self.__lock = threading.Lock()
+        self.__stopped = False
+        self.__thread = None
+
+    def start(self):
+        if self.__thread is None:
+            self.__stopped = False
+            self.__thread = threading.Thread(target=self.__replicate)
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Descript. : the worker finishes the images already added and stops
+        """
+        self.__stopped = True
+        if self.__thread is not None:
+            self.__thread.join(timeout)
+            self.__thread = None
+
+    def makedirs(self, directory):
+        self.directories.makedirs(directory)
+
+    def add_file(self, path, destination):
+        """
+        Descript. : replicates path to the destination directory once the
+                    file is complete. Does not block
+        """
+        self.files_added += 1
+        self.__new_files.put(ReplicatedFile(path, destination))
+
+    def reconcile(self, directory, destination, pattern="*"):
+        """
+        Descript. : sends again the files of directory matching pattern
+                    (e.g. the images of a collection). rsync only
+                    transfers the files that differ from their copy
+        Return    : number of files
+        """
+        try:
+            names = fnmatch.filter(os.listdir(directory), pattern)
+        except OSError:
+            logging.getLogger("HWR").exception(\
+                "ImageReplication: cannot list %s" % directory)
+            return 0
+        for name in sorted(names):
+            self.files_added += 1
+            self.__new_files.put(ReplicatedFile(os.path.join(directory, name),
+                                                destination, reconcile=True))
+        return len(names)
+
+    def is_idle(self):
+        return self.files_added == self.files_transferred + \
+               self.files_reconciled + self.files_failed + self.files_missing
+
+    def wait(self, timeout=None):
+        """
+        Descript. : waits until all the images added have been replicated
+                    (or have failed). Sleeps with gevent.sleep, so other
+                    greenlets run meanwhile
+        Return    : True if all the images were processed before timeout
+        """
+        end_time = None if timeout is None else time.time() + timeout
+        while not self.is_idle():
+            if end_time is not None and time.time() > end_time:
+                return False
+            gevent.sleep(self.poll_interval)
+        return True
+
+    def get_statistics(self):
+        now = time.time()
+        with self.__lock:
+            pending = list(self.__waiting.values())
+            for files in self.__ready.values():
+                pending.extend(files)
+            for transfer in self.__running:
+                pending.extend(transfer.files)
+            transfers = self.transfers
+            return {"added": self.files_added,
+                    "waiting": len(self.__waiting),
+                    "ready": sum(len(files) for files in self.__ready.values()),
+                    "transferring": sum(len(transfer.files) for \
+                                        transfer in self.__running),
+                    "transferred": self.files_transferred,
+                    "reconciled": self.files_reconciled,
+                    "failed": self.files_failed,
+                    "missing": self.files_missing,
+                    "incomplete": self.files_incomplete,
+                    "bytes": self.bytes_transferred,
+                    "transfers": transfers,
+                    "mean_batch_size": (self.files_transferred + \
+                         self.files_reconciled) / float(transfers) if transfers else 0.0,
+                    "oldest_pending_age": max([now - replicated_file.queued_time \
+                                               for replicated_file in pending] or [0.0]),
+                    "lag": self.lag.as_dict(),
+                    "completion_lag": self.completion_lag.as_dict(),
+                    "transfer_lag": self.transfer_lag.as_dict()}
+
+    def __replicate(self):
+        while True:
+            busy = bool(self.__waiting or self.__ready or self.__running)
+            if self.__stopped and not busy and self.__new_files.empty():
+                return
+            try:
+                # Sleeps poll_interval while images are in progress
+                new_file = self.__new_files.get(timeout=self.poll_interval \
+                                                if busy else 1.0)
+            except Queue.Empty:
+                new_file = None
+
+            with self.__lock:
+                while new_file is not None:
+                    if new_file.reconcile:
+                        new_file.ready_time = time.time()
+                        key = (os.path.dirname(new_file.path), new_file.destination)
+                        self.__ready.setdefault(key, []).append(new_file)
+                    else:
+                        self.__waiting[(new_file.path, new_file.destination)] = new_file
+                    try:
+                        new_file = self.__new_files.get_nowait()
+                    except Queue.Empty:
+                        new_file = None
+                if self.__waiting or self.__ready or self.__running:
+                    self.__check_files()
+                    self.__check_transfers()
+                    self.__start_transfers()
+
+    def __check_files(self):
+        now = time.time()
+        for waiting_key, replicated_file in self.__waiting.items():
+            path = replicated_file.path
+            timed_out = now - replicated_file.queued_time > self.complete_timeout
+            try:
+                stat = os.stat(path)
+            except OSError:
+                if timed_out:
+                    logging.getLogger("HWR").error(\
+                        "ImageReplication: %s not found" % path)
+                    self.files_missing += 1
+                    del self.__waiting[waiting_key]
+                continue
+
+            if self.expected_size is not None:
+                complete = stat.st_size >= self.expected_size
+            else:
+                if (stat.st_size, stat.st_mtime) != \
+                   (replicated_file.size, replicated_file.mtime):
+                    replicated_file.stable_time = now
+                complete = now - replicated_file.stable_time >= self.settle_time
+            replicated_file.size = stat.st_size
+            replicated_file.mtime = stat.st_mtime
+
+            if not complete and timed_out:
+                logging.getLogger("HWR").warning(\
+                    "ImageReplication: %s not complete (%d bytes) after %d s" % \
+                    (path, stat.st_size, self.complete_timeout))
+                self.files_incomplete += 1
+                complete = True
+            if complete:
+                replicated_file.ready_time = now
+                self.completion_lag.add(now - replicated_file.queued_time)
+                del self.__waiting[waiting_key]
+                key = (os.path.dirname(path), replicated_file.destination)
+                self.__ready.setdefault(key, []).append(replicated_file)
+
+    def __start_transfers(self):
+        while self.__ready and len(self.__running) < self.max_transfers:
+            key, files = next(self.__ready.iteritems())
+            batch = files[:self.max_batch_size]
+            if len(files) > len(batch):
+                self.__ready[key] = files[len(batch):]
+            else:
+                del self.__ready[key]
+
+            transfer = ReplicationTransfer(key[0], key[1], batch)
+            self.transfers += 1
+            try:
+                if self.rsync is None:
+                    self.__copy(transfer)
+                else:
+                    self.__start_rsync(transfer)
+            except (OSError, IOError) as ex:
+                transfer.returncode = -1
+                transfer.error_file = tempfile.TemporaryFile()
+                transfer.error_file.write(str(ex))
+            self.__running.append(transfer)
+
+    def __get_rsync_command(self, transfer):
+        source = transfer.directory.rstrip("/") + "/"
+        destination = transfer.destination.rstrip("/") + "/"
+        rsync_args = [self.rsync] + self.rsync_options + \
+                     ["--files-from=-", source, destination]
+        if self.directories.is_local:
+            return rsync_args
+        # rsync runs on the host, as "ssh host rsync ..." did
+        return ["ssh",
+                "-o", "ControlMaster=auto",
+                "-o", "ControlPath=%s" % self.directories.control_path,
+                "-o", "ControlPersist=%d" % self.directories.control_persist,
+                "%s@%s" % (self.directories.user, self.host),
+                " ".join(pipes.quote(arg) for arg in rsync_args)]
+
+    def __start_rsync(self, transfer):
+        transfer.error_file = tempfile.TemporaryFile()
+        transfer.process = subprocess.Popen(self.__get_rsync_command(transfer),
+             stdin=subprocess.PIPE, stdout=transfer.error_file,
+             stderr=subprocess.STDOUT, close_fds=True)
+        transfer.process.stdin.write("".join(os.path.basename(replicated_file.path) + \
+             "\n" for replicated_file in transfer.files))
+        transfer.process.stdin.close()
+
+    def __copy(self, transfer):
+        if not os.path.isdir(transfer.destination):
+            os.makedirs(transfer.destination)
+        for replicated_file in transfer.files:
+            # Same quick check as rsync: size and modification time
+            stat = os.stat(replicated_file.path)
+            copy_path = os.path.join(transfer.destination,
+                                     os.path.basename(replicated_file.path))
+            try:
+                copy_stat = os.stat(copy_path)
+                if (copy_stat.st_size, int(copy_stat.st_mtime)) == \
+                   (stat.st_size, int(stat.st_mtime)):
+                    continue
+            except OSError:
+                pass
+            shutil.copy2(replicated_file.path, copy_path)
+        transfer.returncode = 0
+
+    def __check_transfers(self):
+        now = time.time()
+        for transfer in self.__running[:]:
+            if transfer.poll() is None:
+                continue
+            self.__running.remove(transfer)
+            if transfer.returncode == 0:
+                for replicated_file in transfer.files:
+                    if replicated_file.reconcile:
+                        self.files_reconciled += 1
+                        continue
+                    self.files_transferred += 1
+                    self.bytes_transferred += replicated_file.size or 0
+                    self.lag.add(now - replicated_file.queued_time)
+                    self.transfer_lag.add(now - replicated_file.ready_time)
+            else:
+                logging.getLogger("HWR").error(\
+                    "ImageReplication: transfer of %d images from %s to %s " \
+                    "failed (%s): %s" % (len(transfer.files), transfer.directory,
+                    transfer.destination, transfer.returncode, transfer.get_error()))
+                key = (transfer.directory, transfer.destination)
+                for replicated_file in transfer.files:
+                    replicated_file.attempts += 1
+                    if replicated_file.attempts < self.max_attempts:
+                        self.__ready.setdefault(key, []).append(replicated_file)
+                    else:
+                        self.files_failed += 1
+            transfer.close()
+
+
+def _synchronize_image_per_thread(filename, destination, expected_size, processes):
+    # Previous implementation of PX2Experiment.synchronize_image, for the
+    # benchmark. "cp" stands for 'ssh p10 "rsync -av ..."'
+    while not os.path.exists(filename):
+        time.sleep(0.05)
+    time.sleep(0.2)
+    while os.path.getsize(filename) != expected_size:
+        time.sleep(0.05)
+    processes.append(filename)
+    os.system("cp %s %s" % (filename, destination))
+
+
+def _write_images(directory, num_images, image_size, frame_rate, on_image):
+    # Detector writing the images in two parts, 1/frame_rate apart
+    data = "\0" * (image_size // 2)
+    start_time = time.time()
+    paths = []
+    for index in range(num_images):
+        path = os.path.join(directory, "test_1_%04d.img" % (index + 1))
+        paths.append(path)
+        on_image(path)
+        image_file = open(path, "wb")
+        image_file.write(data)
+        image_file.flush()
+        time.sleep(0.5 / frame_rate)
+        image_file.write("\0" * (image_size - len(data)))
+        image_file.close()
+        time.sleep(max(0, start_time + (index + 1) / frame_rate - time.time()))
+    return paths
+
+
+def _get_cpu_time():
+    times = os.times()
+    return times[0] + times[1] + times[2] + times[3]
+
+
+def _check_copies(paths, destination, image_size):
+    return all(os.path.getsize(os.path.join(destination, os.path.basename(path))) == \
+               image_size for path in paths)
+
+
+if __name__ == '__main__':
+    num_images = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    frame_rate = float(sys.argv[2]) if len(sys.argv) > 2 else 25.0
+    image_size = 1024 * 1024
+
+    directory = tempfile.mkdtemp()
+    for name in ("old", "new", "old_copy", "new_copy"):
+        os.mkdir(os.path.join(directory, name))
+
+    processes = []
+    threads = []
+    def start_thread(path):
+        thread = threading.Thread(target=_synchronize_image_per_thread,
+             args=(path, os.path.join(directory, "old_copy"), image_size, processes))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    start_time = time.time()
+    cpu_time = _get_cpu_time()
+    paths = _write_images(os.path.join(directory, "old"), num_images,
+                          image_size, frame_rate, start_thread)
+    for thread in threads:
+        thread.join()
+    old_time = time.time() - start_time
+    old_cpu_time = _get_cpu_time() - cpu_time
+    print("%d images at %.0f Hz, thread and process per image: %6.2f s until " \
+          "replicated, %4d threads, %4d processes, cpu %5.2f s, copies %s" % \
+          (num_images, frame_rate, old_time, len(threads), len(processes),
+           old_cpu_time, "ok" if _check_copies(paths, os.path.join(directory, "old_copy"),
+                                               image_size) else "WRONG"))
+
+    replication = ImageReplication(None, expected_size=image_size)
+    replication.start()
+    destination = os.path.join(directory, "new_copy")
+    start_time = time.time()
+    cpu_time = _get_cpu_time()
+    paths = _write_images(os.path.join(directory, "new"), num_images, image_size,
+                          frame_rate, lambda path: replication.add_file(path, destination))
+    replication.wait()
+    new_time = time.time() - start_time
+    new_cpu_time = _get_cpu_time() - cpu_time
+    stats = replication.get_statistics()
+    print("%d images at %.0f Hz, batched replication (%s):   %6.2f s until " \
+          "replicated, %4d threads, %4d transfers, cpu %5.2f s, copies %s" % \
+          (num_images, frame_rate, replication.rsync or "copy", new_time, 1,
+           stats["transfers"], new_cpu_time, "ok" if _check_copies(paths, destination,
+                                                                  image_size) else "WRONG"))
+    print("lag: mean %.3f s, max %.3f s (complete: mean %.3f s, transfer: " \
+          "mean %.3f s), mean batch size %.1f" % (stats["lag"]["mean"],
+          stats["lag"]["max"], stats["completion_lag"]["mean"],
+          stats["transfer_lag"]["mean"], stats["mean_batch_size"]))
+
+    # A truncated copy is repaired by the reconciling transfer
+    copy_file = open(os.path.join(destination, os.path.basename(paths[0])), "r+b")
+    copy_file.truncate(image_size // 2)
+    copy_file.close()
+    num_files = replication.reconcile(os.path.join(directory, "new"), destination,
+                                      "test_1_*.img")
+    replication.wait(60)
+    print("reconcile: %d images checked in %d transfers, truncated copy %s" % \
+          (num_files, replication.get_statistics()["transfers"] - stats["transfers"],
+           "repaired" if _check_copies(paths, destination, image_size) else "NOT REPAIRED"))
+    replication.stop()
+    shutil.rmtree(directory)
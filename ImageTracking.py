@@ -15,6 +15,7 @@ By default ADXV is used
 import socket
 import logging
 from HardwareRepository.BaseHardwareObjects import Device
+from ImageNotifier import ImageSubscriber, ImageEvent, NEW_IMAGE
 
 class ImageTracking(Device):
     """
@@ -33,6 +34,7 @@ class ImageTracking(Device):
 
         self.chan_state = None
         self.chan_enable_image_tracking = None
+        self.image_subscriber = None
 
     def init(self):
         """
@@ -44,9 +46,8 @@ class ImageTracking(Device):
         if self.chan_state is not None:
             self.chan_state.connectSignal("update", self.state_changed) 
         
-        try:
-           self.target_ip = self.getProperty("targetIP")
-        except:
+        self.target_ip = self.getProperty("targetIP")
+        if self.target_ip is None:
            self.target_ip = socket.gethostbyname(socket.gethostname())
         
         try:
@@ -54,6 +55,15 @@ class ImageTracking(Device):
         except:
            self.target_port = 8100 
 
+        # One persistent connection, images published faster than
+        # min_interval are coalesced to the latest one
+        min_interval = self.getProperty("min_interval")
+        if min_interval is None:
+            min_interval = 0
+        self.image_subscriber = ImageSubscriber(self.name(), self.target_ip,
+             self.target_port, min_interval=float(min_interval))
+        self.image_subscriber.start()
+
     def state_changed(self, state):
         if self.state != state:
             self.state = state
@@ -67,11 +77,8 @@ class ImageTracking(Device):
         if self.chan_enable_image_tracking is not None:
             self.chan_enable_image_tracking.setValue(state)  
 
-    def load_image(self, image_name):
-        active_socket = socket.socket()
-        active_socket.connect((self.target_ip, self.target_port))
-        active_socket.send("load_image %s\n" %image_name)
-        active_socket.close() 
+    def load_image(self, image_name, frame=None):
+        self.image_subscriber.put(ImageEvent(NEW_IMAGE, image_name, frame))
 
     def update_values(self):
         self.emit("stateChanged", (self.state, ))
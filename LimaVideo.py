@@ -8,6 +8,8 @@ Example xml:
    <scaleFactor>1.5</scaleFactor>
    <imageType>rgb</imageType>
    <interval>40</interval>
+   <!-- optional, max rate of imageReceived signals -->
+   <maxFps>25</maxFps>
 </device>
 """
 import os
@@ -19,6 +21,7 @@ from Lima import Core
 from Lima import Prosilica
 
 from Qub.CTools import pixmaptools
+from VideoFramePipeline import VideoFramePipeline
 from HardwareRepository.BaseHardwareObjects import Device
 from HardwareRepository.HardwareObjects.Camera import JpegType, BayerType, \
      MmapType, RawType, RGBType
@@ -54,6 +57,7 @@ class LimaVideo(Device):
         self.video = None 
 
         self.image_polling = None
+        self.frame_pipeline = None
 
     def init(self):
         """
@@ -83,6 +87,10 @@ class LimaVideo(Device):
         self.setImageTypeFromXml('imageType')
         self.setIsReady(True)
 
+        self.frame_pipeline = VideoFramePipeline(self.convert_frame, self.name())
+        self.frame_pipeline.add_consumer(self.emit_image,
+             self.getProperty("maxFps"), "imageReceived")
+
         if self.image_polling is None:
             self.video.startLive()
             self.change_owner()
@@ -262,9 +270,13 @@ class LimaVideo(Device):
         Descript. :
         """
         self.do_scaling = True 
+        self.frame_pipeline.start()
         while self.video.getLive():
-            self.get_new_image()
+            image = self.video.getLastImage()
+            self.frame_pipeline.put_frame(image.frameNumber(), image.buffer(),
+                                          image.width(), image.height())
             time.sleep(sleep_time)
+        self.frame_pipeline.stop()
 	     	
     def connectNotify(self, signal):
         """
@@ -281,25 +293,43 @@ class LimaVideo(Device):
         """
         self.do_scaling = True
 
-    def get_new_image(self):
+    def convert_frame(self, raw_buffer, width, height):
+        """
+        Descript. : converts raw frame to qimage. Called in the worker
+                    thread of the frame pipeline
+        """
+        if self.do_scaling:
+            self.scaling.autoscale_min_max(raw_buffer,
+                 width, height, self.scaling_type)
+            self.do_scaling = False
+        valid_flag, qimage = pixmaptools.LUT.raw_video_2_image(raw_buffer,
+                    width, height, self.scaling_type, self.scaling)
+        if valid_flag:
+            if self.cam_mirror is not None:
+                qimage = qimage.mirror(self.cam_mirror[0], self.cam_mirror[1])     
+            return qimage
+
+    def emit_image(self, qimage):
         """
         Descript. :
         """
+        self.emit("imageReceived", qimage, qimage.width(),
+                  qimage.height(), self.force_update)
+
+    def get_video_statistics(self):
+        """
+        Descript. : returns fps and frame counters of the video
+        """
+        return self.frame_pipeline.get_statistics()
+
+    def get_new_image(self):
+        """
+        Descript. : converts the last frame
+        """
         image = self.video.getLastImage()
         if image.frameNumber() > -1:
-            raw_buffer = image.buffer()	
-            if self.do_scaling:
-                self.scaling.autoscale_min_max(raw_buffer,
-                     image.width(), image.height(), self.scaling_type)
-                self.do_scaling = False
-            valid_flag, qimage = pixmaptools.LUT.raw_video_2_image(raw_buffer,
-                        image.width(),image.height(), self.scaling_type, self.scaling)
-            if valid_flag:
-                if self.cam_mirror is not None:
-                    qimage = qimage.mirror(self.cam_mirror[0], self.cam_mirror[1])     
-                self.emit("imageReceived", qimage, qimage.width(),
-                          qimage.height(), self.force_update)
-                return qimage
+            return self.convert_frame(image.buffer(), image.width(),
+                                      image.height())
 
     def take_snapshot(self, filename, bw=False):
         """
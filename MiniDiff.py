@@ -94,6 +94,8 @@ class MiniDiff(Equipment):
     MANUAL3CLICK_MODE = "Manual 3-click"
     C3D_MODE = "Computer automatic"
     #MOVE_TO_BEAM_MODE = "Move to Beam"
+    # Centred position keys of sampx, sampy, phiy and phiz motors
+    SCREEN_PROJECTION_KEYS = ("sampx", "sampy", "phiy", "phiz")
 
     def __init__(self, *args):
         Equipment.__init__(self, *args)
@@ -474,25 +476,38 @@ class MiniDiff(Equipment):
 
   
     def motor_positions_to_screen(self, centred_positions_dict):
+        x, y = self.motor_positions_to_screen_list([centred_positions_dict])[0]
+        return x, y
+
+    def motor_positions_to_screen_list(self, centred_positions_list):
+        """
+        Projects centred positions (dicts with SCREEN_PROJECTION_KEYS)
+        to screen coordinates. Zoom calibration and motor positions are
+        read once for the whole list.
+        Returns numpy array (N, 2) with x, y of each position
+        """
+        screen_coord = numpy.zeros((len(centred_positions_list), 2))
         self.pixelsPerMmY, self.pixelsPerMmZ = self.getCalibrationData(self.zoomMotor.getPosition())
-        if None in (self.pixelsPerMmY,self.pixelsPerMmZ):
-            return 0,0
+        if None in (self.pixelsPerMmY,self.pixelsPerMmZ) or not centred_positions_list:
+            return screen_coord
+
+        motors = (self.centringSamplex, self.centringSampley,
+                  self.centringPhiy, self.centringPhiz)
+        current_positions = numpy.array([motor.getPosition() for motor in motors])
+        directions = numpy.array([motor.direction for motor in motors])
+        positions = numpy.array([[centred_positions_dict[key] for key in \
+                                  self.SCREEN_PROJECTION_KEYS] for \
+                                 centred_positions_dict in centred_positions_list],
+                                dtype=float)
+        sampx, sampy, phiy, phiz = ((positions - current_positions) * directions).T
+
         phi_angle = math.radians(self.centringPhi.direction*self.centringPhi.getPosition()) 
-        sampx = self.centringSamplex.direction * (centred_positions_dict["sampx"]-self.centringSamplex.getPosition())
-        sampy = self.centringSampley.direction * (centred_positions_dict["sampy"]-self.centringSampley.getPosition())
-        phiy = self.centringPhiy.direction * (centred_positions_dict["phiy"]-self.centringPhiy.getPosition())
-        phiz = self.centringPhiz.direction * (centred_positions_dict["phiz"]-self.centringPhiz.getPosition())
-        rotMatrix = numpy.matrix([math.cos(phi_angle), -math.sin(phi_angle), math.sin(phi_angle), math.cos(phi_angle)])
-        rotMatrix.shape = (2, 2)
-        invRotMatrix = numpy.array(rotMatrix.I)
-        dx, dy = numpy.dot(numpy.array([sampx, sampy]), invRotMatrix)*self.pixelsPerMmY
-        beam_pos_x = self.getBeamPosX()
-        beam_pos_y = self.getBeamPosY()
-
-        x = (phiy * self.pixelsPerMmY) + beam_pos_x
-        y = dy + (phiz * self.pixelsPerMmZ) + beam_pos_y
+        # [sampx, sampy] multiplied by the inverse (transposed) rotation matrix
+        dy = (sampx * math.sin(phi_angle) + sampy * math.cos(phi_angle)) * self.pixelsPerMmY
 
-        return x, y
+        screen_coord[:, 0] = phiy * self.pixelsPerMmY + self.getBeamPosX()
+        screen_coord[:, 1] = dy + phiz * self.pixelsPerMmZ + self.getBeamPosY()
+        return screen_coord
  
     def manualCentringDone(self, manual_centring_procedure):
         try:
@@ -1,14 +1,23 @@
 # -*- coding: utf-8 -*-
 
+import json
 import jsonpickle
 import inspect
 import logging
 import queue_model_objects_v1 as queue_model_objects
 import queue_model_enumerables_v1 as queue_model_enumerables
+import queue_model_schema
 
 xmlrpc_prefix = ""
 
+# json: jsonpickle of the TaskNode objects (with their parents)
+# schema: flat node records, see queue_model_schema
+SERIALISATIONS = ("json", "schema")
+
 def queue_set_serialisation(self, backend):
+    # The serialisation is selected per call (serialisation argument of
+    # queue_add_node, queue_add_child and queue_get_node), the server wide
+    # default stays json for the clients that do not pass it.
     if backend.lower() == "json":
         return True
     else:
@@ -22,9 +31,82 @@ def queue_get_available_serialisations(self):
     Returns a tuple of the available serialisation methods for
     native queue objects
     """
-    return ("json",) 
+    return SERIALISATIONS
+
+def queue_get_schema(server_hwobj):
+    """
+    :returns: The types and attributes of the schema serialisation,
+              json {"schema_version": .., "types": {type: [attributes]}}
+    :rtype: str
+    """
+    return json.dumps(queue_model_schema.get_schema())
+
+def _decode_nodes(server_hwobj, message):
+    """
+    Decodes the node records of message (schema serialisation).
 
-def queue_add_node(server_hwobj, task_node, set_on=True):
+    :returns: list of (node, parent_id, parent) in the order of the
+              records, parent is the node of the record parent_id if it
+              is in message, otherwise None.
+    """
+    batch_nodes = {}
+
+    def get_node(node_id):
+        if node_id in batch_nodes:
+            return batch_nodes[node_id]
+        return server_hwobj.queue_model_hwobj.get_node(node_id)
+
+    nodes = []
+    for record in queue_model_schema.loads(message):
+        node = queue_model_schema.decode_object(record, get_node)
+        parent_id = record.get("parent_id")
+        nodes.append((node, parent_id, batch_nodes.get(parent_id)))
+        if record.get("node_id") is not None:
+            batch_nodes[record["node_id"]] = node
+    return nodes
+
+def _decode_subtree(server_hwobj, message):
+    """
+    Decodes a TaskNode and its children (schema serialisation), the
+    first record is the TaskNode.
+    """
+    nodes = _decode_nodes(server_hwobj, message)
+    for node, parent_id, parent in nodes[1:]:
+        if parent is None:
+            raise ValueError("Parent %s of the node is not in the message" % \
+                             parent_id)
+        queue_model_schema.link_child(parent, node)
+    return nodes[0][0]
+
+def _get_serialisation(serialisation):
+    if serialisation is None:
+        return "json"
+    if serialisation.lower() in SERIALISATIONS:
+        return serialisation.lower()
+    raise ValueError("Unknown backend type '%s'" % serialisation)
+
+def _decode(server_hwobj, message, serialisation):
+    if _get_serialisation(serialisation) == "schema":
+        return _decode_subtree(server_hwobj, message)
+    return jsonpickle.decode(message)
+
+def _get_change_log(server_hwobj):
+    change_log = getattr(server_hwobj, "_queue_change_log", None)
+    if change_log is None:
+        change_log = queue_model_schema.QueueChangeLog()
+        server_hwobj._queue_change_log = change_log
+    return change_log
+
+def _mark_changed(server_hwobj, nodes):
+    # The nodes and their children
+    change_log = _get_change_log(server_hwobj)
+    for node in nodes:
+        change_log.mark_changed(node)
+        for child in queue_model_schema.iter_nodes(node):
+            change_log.mark_changed(child)
+
+def queue_add_node(server_hwobj, task_node, set_on=True,
+                   serialisation="json"):
     """
     Adds the TaskNode objects contained in the json seralized
     list of TaskNodes passed in <task_node>.
@@ -39,20 +121,76 @@ def queue_add_node(server_hwobj, task_node, set_on=True):
                    if false.
     :type set_on: bool
 
+    :param serialisation: "json" (jsonpickle) or "schema"
+    :type serialisation: str
+
     :returns: True on success otherwise False
     :rtype: bool
     """
 
     try:
-        task = jsonpickle.decode(task_node)
+        task = _decode(server_hwobj, task_node, serialisation)
     except Exception as ex:
         logging.getLogger('HWR').exception(str(ex))
         raise
 
     server_hwobj._add_to_queue(task, set_on)
+    _mark_changed(server_hwobj, [task])
     return True
 
-def queue_add_child(server_hwobj, parent_id, child):
+def queue_add_nodes(server_hwobj, nodes, set_on=True):
+    """
+    Adds several TaskNode objects in one call. <nodes> is a list of node
+    records (schema serialisation, see queue_model_schema), parents
+    before their children:
+
+    - parent_id None: the node and its children in <nodes> are added
+      to the queue as with queue_add_node.
+    - parent_id of another record: the node is added to the node of that
+      record.
+    - other parent_id: the node is added to the node of the model with
+      this id, as with queue_add_child.
+
+    Nodes added to a node of the model get a node id, the node ids of
+    the records are only used to find the parents in <nodes>.
+
+    :param nodes: json list of node records
+    :type nodes: str
+
+    :param set_on: Mark the TaskNodes as activated if True and as
+                   inactivated if false.
+    :type set_on: bool
+
+    :returns: The node ids of the added nodes (None for the nodes that
+              have none), in the order of the records
+    :rtype: list
+    """
+    try:
+        decoded_nodes = _decode_nodes(server_hwobj, nodes)
+    except Exception as ex:
+        logging.getLogger('HWR').exception(str(ex))
+        raise
+
+    queue_nodes = []
+    for node, parent_id, parent in decoded_nodes:
+        if parent_id is None:
+            queue_nodes.append(node)
+        elif parent is None:
+            server_hwobj._model_add_child(parent_id, node)
+        elif parent._node_id is not None:
+            server_hwobj._model_add_child(parent._node_id, node)
+        else:
+            # Added with its parent
+            queue_model_schema.link_child(parent, node)
+
+    for node in queue_nodes:
+        server_hwobj._add_to_queue(node, set_on)
+    _mark_changed(server_hwobj,
+                  [node for node, parent_id, parent in decoded_nodes])
+
+    return [node._node_id for node, parent_id, parent in decoded_nodes]
+
+def queue_add_child(server_hwobj, parent_id, child, serialisation="json"):
     """
     Adds the model node task to parent_id.
 
@@ -62,33 +200,67 @@ def queue_add_child(server_hwobj, parent_id, child):
     :param child: The TaskNode object to add.
     :type child: TaskNode
 
+    :param serialisation: "json" (jsonpickle) or "schema"
+    :type serialisation: str
+
     :returns: The id of the added TaskNode object.
     :rtype: int
     """
 
     try:
-        task = jsonpickle.decode(child)
+        task = _decode(server_hwobj, child, serialisation)
     except Exception as ex:
         logging.getLogger('HWR').exception(str(ex))
         raise
 
     node_id = server_hwobj._model_add_child(parent_id, task)
+    _mark_changed(server_hwobj, [task])
     return node_id
 
-def queue_get_node(server_hwobj, node_id):
+def queue_get_node(server_hwobj, node_id, serialisation="json"):
     """
+    :param serialisation: "json" (jsonpickle) or "schema"
+    :type serialisation: str
+
     :returns the TaskNode object with the node id <node_id>
     :rtype: TaskNode
     """
     node = server_hwobj._model_get_node(node_id)
+    if _get_serialisation(serialisation) == "schema":
+        # The node and its children, the parents are given by id
+        return queue_model_schema.dumps(queue_model_schema.encode_subtree(node))
     return jsonpickle.encode(node)
 
+def queue_get_changes(server_hwobj, since_version=0):
+    """
+    Returns the nodes of the queue model added or changed and the ids of
+    the nodes removed since <since_version> (schema serialisation).
+    Nodes added, moved, renamed, enabled, disabled, executed or with a
+    new result (queue_update_result) are reported. The nodes added through
+    queue_add_node, queue_add_nodes and queue_add_child are marked as
+    changed as well.
+
+    :param since_version: version returned by the previous call, 0 to
+                          get all nodes
+    :type since_version: int
+
+    :returns: json {"schema_version": .., "version": .., "reset": ..,
+              "nodes": [node records], "removed": [node ids]}. reset is
+              True if all the nodes are returned (since_version 0 or too
+              old)
+    :rtype: str
+    """
+    root = server_hwobj.queue_model_hwobj.get_model_root()
+    changes = _get_change_log(server_hwobj).get_changes(root, since_version)
+    return json.dumps(changes, separators=(",", ":"))
+
 def queue_update_result(server_hwobj, node_id, html_report):
     result = False
     node = server_hwobj._model_get_node(node_id)
 
     if isinstance(node, queue_model_objects.DataCollection):
         node.html_report = str(html_report)
+        _mark_changed(server_hwobj, [node])
         result = True
 
     return result
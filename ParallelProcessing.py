@@ -1,21 +1,27 @@
 import os
 import glob
 import time
+import shutil
 import logging
 import gevent
+import gevent.select
 import numpy
+import struct
 import subprocess
+import ctypes
+import ctypes.util
 
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
+import XSDataParser
 import SimpleHTML as simpleHtml
 import queue_model_enumerables_v1 as qme
 
 from HardwareRepository.BaseHardwareObjects import HardwareObject
 
 from XSDataControlDozorv1_1 import XSDataInputControlDozor
-from XSDataControlDozorv1_1 import XSDataResultControlDozor
 
 from XSDataCommon import XSDataBoolean
 from XSDataCommon import XSDataDouble
@@ -24,6 +30,191 @@ from XSDataCommon import XSDataInteger
 from XSDataCommon import XSDataString
 
 
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0x00000800
+INOTIFY_EVENT_HEADER = "iIII"
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    _libc.inotify_init1
+    _libc.inotify_add_watch
+except (OSError, AttributeError, TypeError):
+    _libc = None
+
+DOZOR_CHUNK_TEMPLATE = "ResultControlDozor_Chunk_%06d.xml"
+DOZOR_RESULT_END_TAG = "</XSDataResultControlDozor>"
+
+
+class DozorResultWatcher(object):
+    """
+    Descript. : Waits for dozor result chunks written in a directory.
+                On linux inotify is used to get notified when a file is
+                closed or moved in place. If inotify is not available (or
+                mode is "polling") directory is polled. In both cases a
+                chunk is considered complete when it ends with the closing
+                tag of the result document, so partially written files
+                are never parsed.
+    """
+    def __init__(self, directory, mode="auto", poll_interval=0.2,
+                 recheck_interval=1.0):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        self.recheck_interval = recheck_interval
+        self.inotify_fd = None
+
+        if mode in ("auto", "inotify") and _libc is not None:
+            fd = _libc.inotify_init1(IN_NONBLOCK)
+            if fd >= 0:
+                wd = _libc.inotify_add_watch(fd, directory,
+                     IN_CLOSE_WRITE | IN_MOVED_TO)
+                if wd >= 0:
+                    self.inotify_fd = fd
+                else:
+                    os.close(fd)
+        if self.inotify_fd is None and mode == "inotify":
+            logging.getLogger("HWR").warning("ParallelProcessing: inotify " + \
+                "not available, polling %s" % directory)
+        self.mode = "inotify" if self.inotify_fd is not None else "polling"
+
+    def close(self):
+        if self.inotify_fd is not None:
+            os.close(self.inotify_fd)
+            self.inotify_fd = None
+
+    def is_complete(self, filename):
+        """
+        Descript. : Returns True if file is fully written
+        """
+        path = os.path.join(self.directory, filename)
+        try:
+            size = os.stat(path).st_size
+            if size < len(DOZOR_RESULT_END_TAG):
+                return False
+            with open(path, "rb") as result_file:
+                result_file.seek(max(0, size - 256))
+                return DOZOR_RESULT_END_TAG in result_file.read()
+        except (OSError, IOError):
+            return False
+
+    def wait_for_file(self, filename, timeout):
+        """
+        Descript. : Waits until file is complete
+        Args.     : filename (str), timeout (in sec)
+        Return    : True if file is complete, False if timeout occurred
+        """
+        deadline = time.time() + timeout
+        while not self.is_complete(filename):
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            if self.mode == "inotify":
+                # Wakes up as soon as a file is closed. Files written by
+                # other nfs clients are not reported by inotify, so the
+                # file is also rechecked at a low rate
+                self._read_events(min(remaining, self.recheck_interval))
+            else:
+                # Listing the directory refreshes nfs attribute cache
+                os.listdir(self.directory)
+                gevent.sleep(min(remaining, self.poll_interval))
+        return True
+
+    def _read_events(self, timeout):
+        """
+        Descript. : Waits for inotify events and returns names of the
+                    closed or moved files
+        """
+        closed_files = []
+        readable = gevent.select.select([self.inotify_fd], [], [], timeout)[0]
+        if not readable:
+            return closed_files
+        header_size = struct.calcsize(INOTIFY_EVENT_HEADER)
+        buf = os.read(self.inotify_fd, 64 * 1024)
+        offset = 0
+        while offset + header_size <= len(buf):
+            wd, mask, cookie, name_len = struct.unpack_from(\
+                 INOTIFY_EVENT_HEADER, buf, offset)
+            offset += header_size
+            if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                closed_files.append(buf[offset:offset + name_len].rstrip("\0"))
+            offset += name_len
+        return closed_files
+
+
+def render_processing_result(score, best_positions, lines_num, title,
+                             plot_file, plot_archive_file, html_filename):
+    """
+    Descript. : Renders heat map (or line plot) and mesh scan html report.
+                Executed in a worker thread, so the figure and canvas are
+                used without pyplot (and its GUI backend). Figure is
+                rendered once and linked (or copied) to the archive
+                directory.
+    Return    : list of error messages
+    """
+    errors = []
+
+    if html_filename:
+        try:
+            simpleHtml.generate_mesh_scan_report(\
+                 {"best_positions": best_positions}, {}, html_filename)
+        except:
+            errors.append("Could not create result html %s" % html_filename)
+
+    fig = Figure()
+    canvas = FigureCanvasAgg(fig)
+    ax = fig.add_subplot(111)
+    if lines_num > 1: 
+        #If mesh scan then a 2D plot
+        im = ax.imshow(score, interpolation = 'none', aspect='auto',
+                       extent = [0, score.shape[1], 0, score.shape[0]])
+        if len(best_positions) > 0:
+            ax.axvline(x = best_positions[0]["col"] - 0.5, linewidth=0.5)
+            ax.axhline(y = best_positions[0]["row"] - 0.5, linewidth=0.5)
+
+        divider = make_axes_locatable(ax)
+        cax = divider.append_axes("right", size=0.1, pad=0.05)
+        cax.tick_params(axis='x', labelsize=8)
+        cax.tick_params(axis='y', labelsize=8)
+        fig.colorbar(im, cax=cax)
+        im.set_cmap('hot')
+    else:
+        #if helical line then a line plot
+        ax.plot(score)
+        ylim = ax.get_ylim()
+        ax.set_ylim((-1, ylim[1]))
+
+    ax.tick_params(axis='x', labelsize=8)
+    ax.tick_params(axis='y', labelsize=8)
+    ax.set_title(title, fontsize=8)
+
+    ax.grid(True)
+    ax.spines['left'].set_position(('outward', 10))
+    ax.spines['bottom'].set_position(('outward', 10))
+
+    try:
+        if not os.path.exists(os.path.dirname(plot_file)):
+            os.makedirs(os.path.dirname(plot_file))
+        canvas.print_figure(plot_file, dpi = 150, bbox_inches = 'tight')
+    except:
+        errors.append("Could not save figure %s" % plot_file)
+        plot_file = None
+
+    if plot_file:
+        try:
+            if not os.path.exists(os.path.dirname(plot_archive_file)):
+                os.makedirs(os.path.dirname(plot_archive_file))
+            if os.path.exists(plot_archive_file):
+                os.remove(plot_archive_file)
+            try:
+                os.link(plot_file, plot_archive_file)
+            except OSError:
+                # Archive is on another file system
+                shutil.copyfile(plot_file, plot_archive_file)
+        except:
+            errors.append("Could not save figure for ISPyB %s" % plot_archive_file)
+    return errors
+
+
 class ParallelProcessing(HardwareObject):
     def __init__(self, name):
         HardwareObject.__init__(self, name)
@@ -38,6 +229,7 @@ class ParallelProcessing(HardwareObject):
         self.processing_start_command = None
         self.processing_results = None
         self.processing_done_event = None
+        self.result_watch_mode = None
 
     def init(self):
         self.processing_done_event = gevent.event.Event()
@@ -63,6 +255,10 @@ class ParallelProcessing(HardwareObject):
 
         self.processing_start_command = str(self.getProperty("processing_command"))        
 
+        self.result_watch_mode = self.getProperty("result_watch_mode")
+        if self.result_watch_mode is None:
+            self.result_watch_mode = "auto"
+
     def create_processing_input(self, data_collection, processing_params, grid_object):
         """
         Descript. : Creates dozor input file base on data collection parameters
@@ -218,26 +414,22 @@ class ParallelProcessing(HardwareObject):
 
         processing_input, processing_params = self.create_processing_input(\
              data_collection, processing_params, grid_object) 
-        """
-        processing_input_file = os.path.join(processing_directory, "dozor_input.xml")
-        processing_input.exportToFile(processing_input_file)
+        if os.path.isfile(self.processing_start_command):
+            processing_input_file = os.path.join(processing_directory, "dozor_input.xml")
+            processing_input.exportToFile(processing_input_file)
 
-        if not os.path.isfile(self.processing_start_command):
-            self.processing_done_event.set()
-            msg = "ParallelProcessing: Start command %s is not executable" % self.processing_start_command
-            logging.getLogger("queue_exec").error(msg)
-            self.emit("processingFailed")
-            return       
-        else:
             msg = "ParallelProcessing: Starting processing using xml file %s" % processing_input_file
             logging.getLogger("queue_exec").info(msg)
             line_to_execute = self.processing_start_command + ' ' + \
                               processing_input_file + ' ' + \
                               processing_directory
-        subprocess.Popen(str(line_to_execute), shell = True,
-                         stdin = None, stdout = None, stderr = None,
-                         close_fds = True)
-        """
+            subprocess.Popen(str(line_to_execute), shell = True,
+                             stdin = None, stdout = None, stderr = None,
+                             close_fds = True)
+        else:
+            msg = "ParallelProcessing: Start command %s is not executable, " % \
+                  self.processing_start_command + "test results will be used"
+            logging.getLogger("queue_exec").warning(msg)
 
         self.do_processing_result_polling(processing_params, file_wait_timeout, grid_object)
         
@@ -264,80 +456,20 @@ class ParallelProcessing(HardwareObject):
         processing_params["status"] = "Success"
         failed = False
 
-        """
-        do_polling = True
-        result_file_index = 0
-        _result_place = []
-        _first_frame_timout = 5 * 60 / 10
-        _time_out = _first_frame_timout
-        _start_time = time.time()
-       
-        while _result_place == [] and time.time() - _start_time < _time_out :
-           _result_place = glob.glob(os.path.join(processing_params["directory"],"EDApplication*/"))
-           gevent.sleep(0.2)
-        if _result_place == [] : 
-           msg = "ParallelProcessing: Failed to read dozor result directory %s" % processing_params["directory"]
-           logging.error(msg)
-           processing_params["status"] = "Failed"
-           processing_params["comments"] += "Failed: " + msg
-           self.emit("processingFailed")
-           self.processing_done_event.set()
-           failed = True
-
-        while do_polling and not failed:
-            file_appeared = False
-            result_file_name = os.path.join(_result_place[0],"ResultControlDozor_Chunk_%06d.xml" % result_file_index)
-            wait_file_start = time.time()
-            logging.debug('ParallelProcessing: Waiting for Dozor result file: %s' % result_file_name)
-            while not file_appeared and time.time() - wait_file_start < wait_timeout:
-                if os.path.exists(result_file_name) and os.stat(result_file_name).st_size > 0:
-                    file_appeared = True
-                    _time_out = wait_timeout
-                    logging.debug('ParallelProcessing: Dozor file is there, size={0}'.format(os.stat(result_file_name).st_size))
-                else:
-                    os.system("ls %s > /dev/null" %_result_place[0])
-                    gevent.sleep(0.2)
-            if not file_appeared:
-                failed = True
-                msg = 'ParallelProcessing: Dozor result file ({0}) failed to appear after {1} seconds'.\
-                      format(result_file_name, wait_timeout)
-                logging.error(msg)
-                processing_params["status"] = "Failed"
-                processing_params["comments"] += "Failed: " + msg
-                self.emit("processingFailed")
-                
-            # poll while the size increasing:
-            _oldsize = -1 
-            _newsize =  0
-            while _oldsize < _newsize :
-                _oldsize = _newsize
-                _newsize = os.stat(result_file_name).st_size
-                gevent.sleep(0.1)
-                                
-            dozor_output_file = XSDataResultControlDozor.parseFile(result_file_name)
-            #this method could be improved with xml parsing
-            for dozor_image in dozor_output_file.getImageDozor():
-                image_index = dozor_image.getNumber().getValue() - 1
-                processing_result["image_num"][image_index] = image_index
-                processing_result["spots_num"][image_index] = dozor_image.getSpots_num_of().getValue()
-                processing_result["spots_int_aver"][image_index] = dozor_image.getSpots_int_aver().getValue()   
-                processing_result["spots_resolution"][image_index] = dozor_image.getSpots_resolution().getValue()
-                processing_result["score"][image_index] = dozor_image.getScore().getValue()
-                image_index += 1
-                do_polling = (dozor_image.getNumber().getValue() != processing_params["images_num"])
-
-            aligned_result = self.align_processing_results(dozor_result, processing_params)
-            self.emit("processingSetResult", (aligned_result, processing_params, False))
-            result_file_index += 1
-        """
-
-        gevent.sleep(10)
-        #This is for test...
-
-        for key in processing_result.keys():
-            processing_result[key] = numpy.linspace(0, 
-                 processing_params["images_num"], 
-                 processing_params["images_num"]).astype('uint8')
+        if os.path.isfile(self.processing_start_command):
+            failed = self.ingest_dozor_results(processing_result,
+                 processing_params, wait_timeout, grid_object)
+        else:
+            gevent.sleep(10)
+            #This is for test...
+            for key in processing_result.keys():
+                processing_result[key] = numpy.linspace(0,
+                     processing_params["images_num"],
+                     processing_params["images_num"]).astype('uint8')
+
+        if failed:
+            self.processing_done_event.set()
+            return
 
         self.processing_results = self.align_processing_results(\
              processing_result, processing_params, grid_object)
@@ -397,66 +529,124 @@ class ParallelProcessing(HardwareObject):
             else:
                 logging.getLogger("HWR").info("ParallelProcessing: No best positions found during the scan")
 
-            try:
-                html_filename = os.path.join(processing_params["result_file_path"], "index.html")
-                logging.getLogger("HWR").info("ParallelProcessing: Generating results html %s" % html_filename)
-                simpleHtml.generate_mesh_scan_report(self.processing_results, processing_params, html_filename)
-            except:
-                logging.getLogger("HWR").exception("ParallelProcessing: Could not create result html %s" % html_filename)
-
-        # Heat map generation
-        fig, ax = plt.subplots(nrows=1, ncols=1 )
-        if processing_params["lines_num"] > 1: 
-            #If mesh scan then a 2D plot
-            im = ax.imshow(self.processing_results["score"], 
-                           interpolation = 'none', aspect='auto',
-                           extent = [0, self.processing_results["score"].shape[1], 0, 
-                                     self.processing_results["score"].shape[0]])
-            if len(best_positions) > 0:
-                plt.axvline(x = best_positions[0]["col"] - 0.5, linewidth=0.5)
-                plt.axhline(y = best_positions[0]["row"] - 0.5, linewidth=0.5)
-
-            divider = make_axes_locatable(ax)
-            cax = divider.append_axes("right", size=0.1, pad=0.05)
-            cax.tick_params(axis='x', labelsize=8)
-            cax.tick_params(axis='y', labelsize=8)
-            plt.colorbar(im, cax=cax)
-            im.set_cmap('hot')
-        else:
-            #if helical line then a line plot
-            plt.plot(self.processing_results["score"])
-            ylim = ax.get_ylim()
-            ax.set_ylim((-1, ylim[1]))
-
-        ax.tick_params(axis='x', labelsize=8)
-        ax.tick_params(axis='y', labelsize=8)
-        ax.set_title(processing_params["title"], fontsize=8)
-
-        ax.grid(True)
-        ax.spines['left'].set_position(('outward', 10))
-        ax.spines['bottom'].set_position(('outward', 10))
-
+        # Heat map and html report are rendered in a worker thread
+        html_filename = None
+        if processing_params["lines_num"] > 1:
+            html_filename = os.path.join(processing_params["result_file_path"], "index.html")
         processing_plot_file = os.path.join(processing_params\
              ["directory"], "parallel_processing_result.png")
         processing_plot_archive_file = os.path.join(processing_params\
              ["processing_archive_directory"], "parallel_processing_result.png")
+        logging.getLogger("HWR").info("ParallelProcessing: Rendering heat map " + \
+             "%s and results html %s" % (processing_plot_file, html_filename))
+        gevent.spawn(self.do_processing_result_rendering, processing_params,
+             (self.processing_results["score"],
+              [dict((key, value) for key, value in best_position.items() \
+                    if key != "cpos") for best_position in best_positions],
+              processing_params["lines_num"],
+              processing_params["title"],
+              processing_plot_file,
+              processing_plot_archive_file,
+              html_filename))
+        self.processing_done_event.set()
 
+    def do_processing_result_rendering(self, processing_params, render_args):
+        """
+        Descript. : Renders the heat map and html in a thread of the gevent
+                    threadpool (so gevent loop is not blocked).
+                    Emits processingResultRendered when done.
+        """
         try:
-            logging.getLogger("HWR").info("ParallelProcessing: Saving heat map figure %s" % processing_plot_file)
-            if not os.path.exists(os.path.dirname(processing_plot_file)):
-                os.makedirs(os.path.dirname(processing_plot_file))
-            fig.savefig(processing_plot_file, dpi = 150, bbox_inches = 'tight')
+            errors = gevent.get_hub().threadpool.apply(render_processing_result,
+                                                       render_args)
         except:
-            logging.getLogger("HWR").exception("ParallelProcessing: Could not save figure %s" % processing_plot_file)
+            logging.getLogger("HWR").exception("ParallelProcessing: " + \
+                 "Heat map and results html rendering failed")
+            return
+        for msg in errors:
+            logging.getLogger("HWR").error("ParallelProcessing: %s" % msg)
+        self.emit("processingResultRendered", (processing_params, ))
+
+    def ingest_dozor_results(self, processing_result, processing_params,
+                             wait_timeout, grid_object):
+        """
+        Descript. : Waits for dozor result chunks and parses each of them
+                    as soon as it is complete into the preallocated result
+                    arrays. After each chunk partial results are aligned
+                    and emitted, so the heat map is updated during the scan.
+        Args.     : processing_result (dict of numpy arrays),
+                    processing_params (dict), wait_timeout (in sec.)
+        Return    : True if processing failed
+        """
+        result_place = []
+        first_frame_timeout = 5 * 60 / 10
+        start_time = time.time()
+        while not result_place and time.time() - start_time < first_frame_timeout:
+            result_place = glob.glob(os.path.join(processing_params["directory"],
+                                                  "EDApplication*/"))
+            if not result_place:
+                gevent.sleep(0.2)
+        if not result_place:
+            msg = "ParallelProcessing: Failed to read dozor result directory %s" % \
+                  processing_params["directory"]
+            self.set_processing_failed(processing_params, msg)
+            return True
+
+        watcher = DozorResultWatcher(result_place[0], self.result_watch_mode)
+        logging.getLogger("HWR").debug("ParallelProcessing: Waiting for dozor " + \
+             "results in %s (%s)" % (result_place[0], watcher.mode))
+        images_num = processing_params["images_num"]
+        result_file_index = 0
         try:
-            logging.getLogger("HWR").info("ParallelProcessing: Saving heat map figure for ISPyB %s" % processing_plot_archive_file)
-            if not os.path.exists(os.path.dirname(processing_plot_archive_file)):
-                os.makedirs(os.path.dirname(processing_plot_archive_file))
-            fig.savefig(processing_plot_archive_file, dpi = 150, bbox_inches = 'tight')
-        except:
-            logging.getLogger("HWR").exception("ParallelProcessing: Could not save figure for ISPyB %s" % processing_plot_archive_file) 
-        plt.close(fig)
-        self.processing_done_event.set()
+            while True:
+                result_file_name = DOZOR_CHUNK_TEMPLATE % result_file_index
+                if not watcher.wait_for_file(result_file_name, wait_timeout):
+                    msg = "ParallelProcessing: Dozor result file (%s) failed " % \
+                          result_file_name + "to appear after %d seconds" % wait_timeout
+                    self.set_processing_failed(processing_params, msg)
+                    return True
+
+                last_image_num = self.parse_dozor_chunk(\
+                     os.path.join(result_place[0], result_file_name),
+                     processing_result)
+                result_file_index += 1
+
+                if last_image_num >= images_num:
+                    return False
+                aligned_result = self.align_processing_results(\
+                     processing_result, processing_params, grid_object)
+                self.emit("paralleProcessingResults",
+                          (aligned_result, processing_params, False))
+        finally:
+            watcher.close()
+
+    def parse_dozor_chunk(self, result_file_name, processing_result):
+        """
+        Descript. : Parses dozor result chunk and fills result arrays
+        Args.     : result_file_name (str), processing_result (dict)
+        Return    : last image number in the chunk
+        """
+        chunk = XSDataParser.parse_dozor_images(result_file_name,
+             ("number", "spots_num_of", "spots_int_aver",
+              "spots_resolution", "score"))
+        if not chunk.size:
+            return 0
+
+        image_index = chunk[:, 0].astype(int) - 1
+        valid = (image_index >= 0) & \
+                (image_index < processing_result["score"].size)
+        image_index = image_index[valid]
+        processing_result["image_num"][image_index] = image_index
+        for column, key in enumerate(("spots_num", "spots_int_aver",
+                                      "spots_resolution", "score"), 1):
+            processing_result[key][image_index] = chunk[valid, column]
+        return int(chunk[:, 0].max())
+
+    def set_processing_failed(self, processing_params, msg):
+        logging.getLogger("HWR").error(msg)
+        processing_params["status"] = "Failed"
+        processing_params["comments"] += "Failed: " + msg
+        self.emit("processingFailed")
 
     def is_running(self):
         return not self.processing_done_event.is_set()
@@ -470,75 +660,141 @@ class ParallelProcessing(HardwareObject):
         Args.     : resuld_dict contains 5 one dimensional numpy arrays
         Return    : Dictionary with realigned results and best positions         
         """
-        #Each result array is realigned
-        aligned_results = {}
-        for result_array_key in results_dict.iterkeys():
-            aligned_results[result_array_key] = self.align_result_array(\
-              results_dict[result_array_key], processing_params, grid_object)
+        #All result arrays are realigned at once
+        aligned_results = self.align_result_arrays(results_dict,
+             processing_params, grid_object)
         if processing_params['lines_num'] > 1:
             grid_object.set_score(results_dict['score'])       
 
         #Best positions are extracted
         best_positions_list = []
-        index_arr = (-results_dict["score"]).argsort()[:10]
-        if len(index_arr) > 0:
-           for index in index_arr:
-               if results_dict["score"][index] > 0:
-                   best_position = {}
-                   best_position["index"] = index
-                   best_position["index_serial"] = processing_params["first_image_num"] + index
-                   best_position["score"] = float(results_dict["score"][index])
-                   best_position["spots_num"] = int(results_dict["spots_num"][index])
-                   best_position["spots_int_aver"] = float(results_dict["spots_int_aver"][index])
-                   best_position["spots_resolution"] = float(results_dict["spots_resolution"][index])
-                   best_position["filename"] = os.path.basename(processing_params["template"] % \
-                        (processing_params["run_number"], processing_params["first_image_num"] + index))
-
-                   cpos = None
-                   if processing_params["lines_num"] > 1: 
-                       col, row = grid_object.get_col_row_from_image_serial(\
-                            index + processing_params["first_image_num"])  
-                       cpos = grid_object.get_motor_pos_from_col_row(\
-                            col, row, as_cpos = True)
-                       #entred_position = processing_params["associated_grid"].get_motor_pos_from_col_row(col, row)
-                   else:
-                       col = index
-                       row = 0
-                       #cpos = processing_params["associated_data_collection"].get_motor_pos(index, as_cpos=True)
-                       cpos = None
-                       #TODO Add best position for helical line
-                   best_position["col"] = col + 1
-                   best_position["row"] = processing_params["steps_y"] - row
-                   best_position['cpos'] = cpos
-                   best_positions_list.append(best_position) 
+        index_arr = self.get_best_indexes(results_dict["score"], 10)
+        if processing_params["lines_num"] > 1 and len(index_arr) > 0:
+            best_cols, best_rows = grid_object.get_col_row_from_image_serials(\
+                 processing_params["first_image_num"], results_dict["score"].size)
+        for index in index_arr:
+            best_position = {}
+            best_position["index"] = index
+            best_position["index_serial"] = processing_params["first_image_num"] + index
+            best_position["score"] = float(results_dict["score"][index])
+            best_position["spots_num"] = int(results_dict["spots_num"][index])
+            best_position["spots_int_aver"] = float(results_dict["spots_int_aver"][index])
+            best_position["spots_resolution"] = float(results_dict["spots_resolution"][index])
+            best_position["filename"] = os.path.basename(processing_params["template"] % \
+                 (processing_params["run_number"], processing_params["first_image_num"] + index))
+
+            cpos = None
+            if processing_params["lines_num"] > 1: 
+                col = int(best_cols[index])
+                row = int(best_rows[index])
+                cpos = grid_object.get_motor_pos_from_col_row(\
+                     col, row, as_cpos = True)
+            else:
+                col = index
+                row = 0
+                #TODO Add best position for helical line
+            best_position["col"] = col + 1
+            best_position["row"] = processing_params["steps_y"] - row
+            best_position['cpos'] = cpos
+            best_positions_list.append(best_position) 
         aligned_results["best_positions"] = best_positions_list
         return aligned_results
 
-    def align_result_array(self, result_array, processing_params, grid_object):
+    def get_best_indexes(self, score, num_best):
         """
-        Descript. : realigns result array based on the grid
-                    Result array is numpy 2d array
+        Descript. : returns indexes of num_best highest positive scores
+                    sorted by score. Uses partial sort, so only the best
+                    items are sorted.
+        """
+        if score.size > num_best:
+            index_arr = numpy.argpartition(-score, num_best - 1)[:num_best]
+        else:
+            index_arr = numpy.arange(score.size)
+        index_arr = index_arr[(-score[index_arr]).argsort()]
+        return index_arr[score[index_arr] > 0]
+
+    def align_result_arrays(self, results_dict, processing_params, grid_object):
+        """
+        Descript. : realigns all result arrays based on the grid with one
+                    scatter. Serial to col, row map is cached by the grid
+        Args.     : results_dict contains one dimensional numpy arrays
+        Return    : dict with realigned (2d numpy) arrays
         """
         num_lines = processing_params["lines_num"]
         if num_lines == 1:
-            return result_array
+            return dict(results_dict)
 
         num_images_per_line = processing_params["images_per_line"]
         num_colls = processing_params["steps_x"]
         num_rows = processing_params["steps_y"]
-        first_image_number = processing_params["first_image_num"]
+        num_cells = min(num_lines * num_images_per_line, num_colls * num_rows)
+
+        keys = list(results_dict.keys())
+        result_arrays = numpy.vstack([results_dict[key][:num_cells] for key in keys])
+        num_cells = result_arrays.shape[1]
 
-        aligned_result_array = numpy.zeros(num_lines * num_images_per_line).\
-                        reshape(num_colls, num_rows)        
+        cols, rows = grid_object.get_col_row_from_image_serials(\
+             processing_params["first_image_num"], num_cells)
+        valid = (cols >= 0) & (cols < num_colls) & (rows >= 0) & (rows < num_rows)
 
-        for cell_index in range(aligned_result_array.size):
-           
-            col, row = grid_object.get_col_row_from_image_serial(\
-                cell_index + first_image_number)
-            if (col < aligned_result_array.shape[0] and 
-                row < aligned_result_array.shape[1]):
-                aligned_result_array[col][row] = result_array[cell_index]
-        return numpy.transpose(aligned_result_array)
+        aligned_result_arrays = numpy.zeros((len(keys), num_rows, num_colls))
+        aligned_result_arrays[:, rows[valid], cols[valid]] = result_arrays[:, valid]
+        return dict(zip(keys, aligned_result_arrays))
+
+    def align_result_array(self, result_array, processing_params, grid_object):
+        """
+        Descript. : realigns result array based on the grid
+                    Result array is numpy 2d array
+        """
+        return self.align_result_arrays({"result": result_array},
+             processing_params, grid_object)["result"]
 
     def get_last_processing_results(self):
         return self.processing_results 
+
+
+if __name__ == '__main__':
+    # Benchmark of the grid realignment: per cell loop vs cached index map
+    import Qt4_GraphicsLib
+
+    Qt4_GraphicsLib.GraphicsItemGrid.set_grid_direction(\
+         {"fast": (0, 1), "slow": (1, 0), "omega_ref": 0})
+    processing_hwobj = ParallelProcessing("parallel-processing")
+
+    for grid_size in (100, 200, 400):
+        grid = Qt4_GraphicsLib.GraphicsItemGrid(None,
+             {"size_x": 0.01, "size_y": 0.01, "shape": "rectangular"},
+             [0, 0], [100, 100])
+        grid.set_col_row_num(grid_size, grid_size)
+        num_images = grid_size * grid_size
+        params = {"lines_num": grid_size,
+                  "images_per_line": grid_size,
+                  "steps_x": grid_size,
+                  "steps_y": grid_size,
+                  "first_image_num": 1}
+        results = {}
+        for key in ("image_num", "spots_num", "spots_int_aver",
+                    "spots_resolution", "score"):
+            results[key] = numpy.random.random(num_images)
+
+        start_time = time.time()
+        loop_results = {}
+        for key in results:
+            aligned = numpy.zeros((grid_size, grid_size))
+            for cell_index in range(num_images):
+                col, row = grid.get_col_row_from_image_serial(cell_index + 1)
+                aligned[col][row] = results[key][cell_index]
+            loop_results[key] = numpy.transpose(aligned)
+        best_loop = (-results["score"]).argsort()[:10]
+        loop_time = time.time() - start_time
+
+        start_time = time.time()
+        map_results = processing_hwobj.align_result_arrays(results, params, grid)
+        best_map = processing_hwobj.get_best_indexes(results["score"], 10)
+        map_time = time.time() - start_time
+
+        for key in results:
+            assert numpy.array_equal(loop_results[key], map_results[key])
+        assert numpy.array_equal(best_loop, best_map)
+        print "%d cells: loop %.3f s, index map %.4f s (x%.0f)" % \
+              (num_images, loop_time, map_time, loop_time / max(map_time, 1e-6))
@@ -1,6 +1,7 @@
 from HardwareRepository.BaseHardwareObjects import Equipment
 import numpy
 import logging
+from FluxCalibration import FluxCalibrationCache
 
 class PhotonFlux(Equipment):
     def __init__(self, *args, **kwargs):
@@ -10,6 +11,7 @@ class PhotonFlux(Equipment):
         self.read_counts_chan = self.getChannelObject("counts")
         self.gain = 1e6
         self.calibration_chan = self.getChannelObject("calibration")
+        self.calibration_cache = FluxCalibrationCache(self.calibration_chan, self.name())
         try:
             self.aperture = self.getObjectByRole("aperture")
         except:
@@ -56,29 +58,42 @@ class PhotonFlux(Equipment):
           logging.getLogger("HWR").exception("%s: could not get energy", self.name())
         else:
           try:
-            calib_dict = self.calibration_chan.getValue()
-            if calib_dict is None:
+            calibration = self.calibration_cache.get_calibration()
+            if calibration is None:
               logging.getLogger("HWR").error("%s: calibration is None", self.name())
-            else:
-              calibs = [(float(c["energy"]), float(c[self.counter])) for c in calib_dict.itervalues()]
-              calibs.sort()
-              print c
-              E = [c[0] for c in calibs]
-              C = [c[1] for c in calibs]
+              return
+            calib = calibration.get_coefficient(egy, self.counter)
           except:
             logging.getLogger("HWR").exception("%s: could not get calibration", self.name())
           else:
-            try:
-              aperture_coef = self.aperture.getApertureCoef()
-            except:
-              aperture_coef = 1
-            if aperture_coef <= 0:
-              aperture_coef = 1
-            calib = numpy.interp([egy], E, C)
-            flux = counts * calib * aperture_coef
+            flux = counts * calib * self.get_aperture_coef()
             #logging.getLogger("HWR").debug("%s: flux-> %f * %f=%f , calib_dict=%r", self.name(), counts, calib, counts*calib, calib_dict)
             self.emitValueChanged("%1.3g" % flux)
 
+    def get_aperture_coef(self):
+        try:
+          aperture_coef = self.aperture.getApertureCoef()
+        except:
+          aperture_coef = 1
+        if aperture_coef <= 0:
+          aperture_coef = 1
+        return aperture_coef
+
+    def get_flux_series(self, counts, energies):
+        """
+        Descript. : flux of a series of counter readings, e.g. to correct
+                    intensities after a collection. Uses current aperture
+        Args.     : counts (array of readings of the counter used by this
+                    object, before gain), energies (array or scalar, keV)
+        Return    : numpy array of flux values
+        """
+        calibration = self.calibration_cache.get_calibration()
+        if calibration is None:
+          raise ValueError("%s: calibration is not available" % self.name())
+        return calibration.get_flux(numpy.asarray(counts, dtype=float) * self.gain,
+                                    numpy.asarray(energies, dtype=float) * 1000.0,
+                                    self.counter, self.get_aperture_coef())
+
     def getCurrentFlux(self):
         return self.current_flux
 
@@ -40,6 +40,7 @@ Graphics item library:
 import copy
 import math
 import logging
+import numpy
 
 from PyQt4 import QtGui
 from PyQt4 import QtCore
@@ -477,7 +478,18 @@ class GraphicsItemGrid(GraphicsItem):
                4 corner points are motor position dict. When one or several 
                motors are moved corner_cord are updated and grid is painted
                in projection mode.              
+               Cells are rendered into a cached pixmap that is painted
+               with the grid (see get_overlay_pixmap).
     """
+    CELLS_LOD_MAX_CELLS = 1000
+    # Large grids are painted as a heat map image of one pixel per cell:
+    # about 0.25 s to render 2^22 cells, and QImage sides are limited
+    # to 32767 pixels
+    MAX_CELLS = pow(2, 22)
+    MAX_CELLS_PER_SIDE = 32767
+    CELLS_LOD_MIN_CELL_SIZE_PIX = 20
+    GRID_LINES_MIN_SPACING_PIX = 4
+
     def __init__(self, parent, beam_info, spacing_mm, pixels_per_mm):
         GraphicsItem.__init__(self, parent)
 
@@ -517,8 +529,12 @@ class GraphicsItemGrid(GraphicsItem):
         self.__automatic = False
         self.__fill_alpha = 120
         self.__display_overlay = True
-       
-        #self.__overlay_pixmap = None
+        self.__col_row_map = None
+        self.__col_row_map_key = None
+        self.__score_version = 0
+        self.__lod_mode = "auto"
+        self.__overlay_pixmap = None
+        self.__overlay_key = None
 
         self.update_item()
 
@@ -585,29 +601,38 @@ class GraphicsItemGrid(GraphicsItem):
         num_rows = int(abs((self.__corner_coord[3].y() - \
             self.__corner_coord[1].y()) / self.__cell_size_pix[1]))
 
-        if num_rows * num_cols > pow(2, 16):
-            msg_text = "Unable to draw grid containing more than %d cells!" % pow(2, 16)
+        if num_rows * num_cols > GraphicsItemGrid.MAX_CELLS:
+            msg_text = "Unable to draw grid containing more than %d cells!" % \
+                       GraphicsItemGrid.MAX_CELLS
+            logging.getLogger("user_level_log").info(msg_text)
+        elif max(num_rows, num_cols) > GraphicsItemGrid.MAX_CELLS_PER_SIDE:
+            msg_text = "Unable to draw grid with more than %d rows or columns!" % \
+                       GraphicsItemGrid.MAX_CELLS_PER_SIDE
             logging.getLogger("user_level_log").info(msg_text)
         else:
-            self.__num_cols = num_cols
-            self.__num_rows = num_rows
-
-            #Based on the grid directions estimates number of lines and 
-            #number of images per line
-            self.__num_lines =  abs(self.grid_direction['fast'][1] * \
-                 self.__num_cols) + abs(self.grid_direction['slow'][1] * \
-                 self.__num_rows)
-            self.__num_images_per_line = abs(self.grid_direction['fast'][0] * \
-                self.__num_cols) + abs(self.grid_direction['slow'][0] * \
-                self.__num_rows)
-
-            self.update_grid_draw_parameters()
+            self.set_col_row_num(num_cols, num_rows)
             self.__center_coord.setX(min(self.__corner_coord[0].x(),
                  self.__corner_coord[1].x()) + self.__grid_size_pix[0] / 2.0)
             self.__center_coord.setY(min(self.__corner_coord[0].y(),
                  self.__corner_coord[3].y()) + self.__grid_size_pix[1] / 2.0)
             self.scene().update() 
 
+    def set_col_row_num(self, num_cols, num_rows):
+        """
+        Descript. : Sets number of columns and rows. Based on the grid
+                    directions estimates number of lines and number of
+                    images per line
+        """
+        self.__num_cols = num_cols
+        self.__num_rows = num_rows
+        self.__num_lines =  abs(self.grid_direction['fast'][1] * \
+             self.__num_cols) + abs(self.grid_direction['slow'][1] * \
+             self.__num_rows)
+        self.__num_images_per_line = abs(self.grid_direction['fast'][0] * \
+            self.__num_cols) + abs(self.grid_direction['slow'][0] * \
+            self.__num_rows)
+        self.update_grid_draw_parameters()
+
     def update_grid_draw_parameters(self):
         self.__grid_size_pix = [self.__num_cols * self.__cell_size_pix[0],
                                 self.__num_rows * self.__cell_size_pix[1]]
@@ -677,19 +702,11 @@ class GraphicsItemGrid(GraphicsItem):
     def update_auto_grid(self, grid_size):
         """
         """
-        self.__num_cols = int(grid_size[0] / self.beam_size_mm[0])
-        self.__num_rows = int(grid_size[1] / self.beam_size_mm[1])
-
         self.set_center_coord(self.beam_position)    
 
         self.update_item()
-        self.__num_lines =  abs(self.grid_direction['fast'][1] * \
-            self.__num_cols) + abs(self.grid_direction['slow'][1] * \
-            self.__num_rows)
-        self.__num_images_per_line = abs(self.grid_direction['fast'][0] * \
-            self.__num_cols) + abs(self.grid_direction['slow'][0] * \
-            self.__num_rows)
-        self.update_grid_draw_parameters()
+        self.set_col_row_num(int(grid_size[0] / self.beam_size_mm[0]),
+                             int(grid_size[1] / self.beam_size_mm[1]))
 
         self.__automatic = True
         self.__draw_projection = False
@@ -737,6 +754,7 @@ class GraphicsItemGrid(GraphicsItem):
 
     def set_score(self, score):
         self.__score = score
+        self.__score_version += 1
 
     def get_snapshot(self):
         return self.__snapshot
@@ -772,70 +790,41 @@ class GraphicsItemGrid(GraphicsItem):
             draw_start_x = self.__center_coord.x() - self.__grid_size_pix[0] / 2.0
             draw_start_y = self.__center_coord.y() - self.__grid_size_pix[1] / 2.0
 
-            # Horizontal and vertical grid lines
-            for i in range(0, self.__num_cols + 1):
-                offset = i * self.__cell_size_pix[0]
-                painter.drawLine(draw_start_x + offset, draw_start_y,
-                                 draw_start_x + offset, draw_start_y + \
-                                 self.__num_rows * self.__cell_size_pix[1])
-            for i in range(0, self.__num_rows + 1):
-                offset = i * self.__cell_size_pix[1]
-                painter.drawLine(draw_start_x, draw_start_y + offset,
-                                 draw_start_x + self.__num_cols * self.__cell_size_pix[0],
-                                 draw_start_y + offset)    
-
-            #Draws beam shape and displays number of image if 
-            #less than 1000 cells and size is greater than 20px
-            cell_index = 0
-            if self.__num_cols * self.__num_rows < 1000 and \
-               self.__cell_size_pix[1] > 20:
-                for col in range(self.__num_cols):
-                    for row in range(self.__num_rows):
-                        #Estimate area where frame number or score will be displayed
-                        line, image = self.get_line_image_num(\
-                            cell_index + self.__first_image_num)
-                        pos_x, pos_y = self.get_coord_from_line_image(line, image)
-                        paint_rect = QtCore.QRect(\
-                            pos_x - self.__cell_size_pix[0] / 2, 
-                            pos_y - self.__cell_size_pix[1] / 2,
-                            self.__cell_size_pix[0], 
-                            self.__cell_size_pix[1])
-
-                        #If score exists overlay color may change
-                        cell_score = None
-                        if self.base_color:
-                            brush_color = self.base_color
-                            brush_color.setAlpha(self.__fill_alpha)
-                        else:
-                            brush_color = QtGui.QColor(70, 70, 165, self.__fill_alpha)
-                        #if self.__display_overlay and not self.__overlay_pixmap: 
-                        if self.__display_overlay:
-                            #painter.setBrush(QtGui.QColor(70, 70, 165))
-                            if self.__score is not None:
-                                cell_score = self.__score[cell_index]
-                                if self.__score.max() > 0:
-                                    cell_score = float(cell_score) / \
-                                                 self.__score.max()
-                                    brush_color.setHsv(0 + 60 * cell_score, 
-                                     255, 255 * cell_score, self.__fill_alpha)
-                            self.custom_brush.setColor(brush_color)
-                            painter.setBrush(self.custom_brush)
-                        else:
-                            painter.setBrush(QtCore.Qt.transparent)
-
-                        if self.beam_is_rectangle:
-                            painter.drawRect(pos_x - self.beam_size_pix[0] / 2,
-                                             pos_y - self.beam_size_pix[1] / 2,
-                                             self.beam_size_pix[0],
-                                             self.beam_size_pix[1])
-                        else:
-                            painter.drawEllipse(pos_x - self.beam_size_pix[0] / 2,
-                                                pos_y - self.beam_size_pix[1] / 2,
-                                                self.beam_size_pix[0],
-                                                self.beam_size_pix[1])
-                        painter.drawText(paint_rect, QtCore.Qt.AlignCenter, \
-                              str(cell_index + self.__first_image_num))
-                        cell_index += 1
+            overlay_pixmap, lod_mode = self.get_overlay_pixmap()
+            if overlay_pixmap is not None:
+                if lod_mode == "cells":
+                    painter.drawPixmap(QtCore.QPointF(draw_start_x, draw_start_y),
+                                       overlay_pixmap)
+                else:
+                    painter.drawPixmap(QtCore.QRectF(draw_start_x, draw_start_y,
+                                       self.__grid_size_pix[0],
+                                       self.__grid_size_pix[1]),
+                                       overlay_pixmap,
+                                       QtCore.QRectF(overlay_pixmap.rect()))
+
+            # Horizontal and vertical grid lines. If lines are too dense
+            # only the grid frame is drawn
+            if self.__cell_size_pix[0] < GraphicsItemGrid.GRID_LINES_MIN_SPACING_PIX or \
+               self.__cell_size_pix[1] < GraphicsItemGrid.GRID_LINES_MIN_SPACING_PIX:
+                painter.setBrush(QtCore.Qt.NoBrush)
+                painter.drawRect(QtCore.QRectF(draw_start_x, draw_start_y,
+                                               self.__grid_size_pix[0],
+                                               self.__grid_size_pix[1]))
+            else:
+                grid_lines = []
+                for i in range(0, self.__num_cols + 1):
+                    offset = i * self.__cell_size_pix[0]
+                    grid_lines.append(QtCore.QLineF(\
+                         draw_start_x + offset, draw_start_y,
+                         draw_start_x + offset,
+                         draw_start_y + self.__grid_size_pix[1]))
+                for i in range(0, self.__num_rows + 1):
+                    offset = i * self.__cell_size_pix[1]
+                    grid_lines.append(QtCore.QLineF(\
+                         draw_start_x, draw_start_y + offset,
+                         draw_start_x + self.__grid_size_pix[0],
+                         draw_start_y + offset))
+                painter.drawLines(grid_lines)
 
         """
         if self.__overlay_pixmap:
@@ -966,6 +955,240 @@ class GraphicsItemGrid(GraphicsItem):
         line, image = self.get_line_image_num(image_serial)
         return self.get_col_row_from_line_image(line, image)
 
+    def get_col_row_map(self):
+        """
+        Descript. : returns two numpy arrays with col and row of each
+                    frame in the scan order (index 0 is the first image).
+                    Map is computed once for the grid geometry and reused
+                    until number of cells, directions or rotation changes.
+        """
+        map_key = (self.__num_cols, self.__num_rows, self.__num_lines,
+                   self.__num_images_per_line, self.__reversing_rotation,
+                   tuple(self.grid_direction['fast']),
+                   tuple(self.grid_direction['slow']))
+        if self.__col_row_map_key != map_key:
+            self.__col_row_map = self.get_col_row_from_image_index(\
+                 numpy.arange(self.__num_lines * self.__num_images_per_line))
+            self.__col_row_map_key = map_key
+        return self.__col_row_map
+
+    def get_col_row_from_image_serials(self, first_image_serial, num_images):
+        """
+        Descript. : vectorized get_col_row_from_image_serial for
+                    num_images consecutive frames
+        Return    : two numpy arrays (cols, rows)
+        """
+        first_index = first_image_serial - self.__first_image_num
+        cols, rows = self.get_col_row_map()
+        if first_index >= 0 and first_index + num_images <= cols.size:
+            return (cols[first_index:first_index + num_images],
+                    rows[first_index:first_index + num_images])
+        return self.get_col_row_from_image_index(\
+             numpy.arange(first_index, first_index + num_images))
+
+    def get_col_row_from_image_index(self, image_index):
+        """
+        Descript. : numpy version of get_line_image_num and
+                    get_col_row_from_line_image. Image index is relative to
+                    the first image of the grid.
+        """
+        ref_fast, ref_slow = self.get_coord_ref_from_image_index(image_index)
+
+        cols = self.__num_cols / 2.0 + (self.__num_images_per_line - 1) * \
+               self.grid_direction['fast'][0] * ref_fast + \
+               (self.__num_lines - 1) * \
+               self.grid_direction['slow'][0] * ref_slow
+        rows = self.__num_rows / 2.0 + (self.__num_images_per_line - 1) * \
+               self.grid_direction['fast'][1] * ref_fast + \
+               (self.__num_lines - 1) * \
+               self.grid_direction['slow'][1] * ref_slow
+        return cols.astype(int), rows.astype(int)
+
+    def get_coord_ref_from_image_index(self, image_index):
+        """
+        Descript. : numpy version of get_coord_ref_from_line_image
+        """
+        line = image_index // self.__num_images_per_line
+        image = image_index - line * self.__num_images_per_line
+
+        ref_fast = numpy.full(image_index.shape, 0.5)
+        if self.__num_images_per_line > 1:
+            ref_fast = 0.5 - image.astype(float) / (self.__num_images_per_line - 1)
+        if self.__reversing_rotation:
+            ref_fast = numpy.where(line % 2, -ref_fast, ref_fast)
+        ref_slow = numpy.full(image_index.shape, 0.5)
+        if self.__num_lines > 1:
+            ref_slow = 0.5 - line.astype(float) / (self.__num_lines - 1)
+        return ref_fast, ref_slow
+
+    def get_cell_centres(self):
+        """
+        Descript. : returns two numpy arrays with the screen coordinates
+                    of the cell centres in the scan order, relative to the
+                    grid centre (numpy version of get_coord_from_line_image)
+        """
+        ref_fast, ref_slow = self.get_coord_ref_from_image_index(\
+             numpy.arange(self.__num_lines * self.__num_images_per_line))
+        coord_x = self.__grid_range_pix['fast'] * \
+                  self.grid_direction['fast'][0] * ref_fast + \
+                  self.__grid_range_pix['slow'] * \
+                  self.grid_direction['slow'][0] * ref_slow
+        coord_y = self.__grid_range_pix['fast'] * \
+                  self.grid_direction['fast'][1] * ref_fast + \
+                  self.__grid_range_pix['slow'] * \
+                  self.grid_direction['slow'][1] * ref_slow
+        return coord_x, coord_y
+
+    def get_cell_colors(self, num_cells):
+        """
+        Descript. : returns (num_cells, 4) numpy array with the rgba fill
+                    color of each cell. Color is estimated from the score
+                    (hue 0..60 and value 0..255 scaled by the max score)
+                    or the base color if there is no score.
+        """
+        colors = numpy.empty((num_cells, 4), dtype=numpy.int32)
+        if self.base_color:
+            colors[:] = (self.base_color.red(), self.base_color.green(),
+                         self.base_color.blue(), self.__fill_alpha)
+        else:
+            colors[:] = (70, 70, 165, self.__fill_alpha)
+
+        if self.__score is not None:
+            score = numpy.asarray(self.__score, dtype=float)[:num_cells]
+            max_score = score.max() if score.size else 0
+            if max_score > 0:
+                score = score / max_score
+                hue = (60 * score).astype(numpy.int32)
+                value = (255 * score).astype(numpy.int32)
+                # Saturation is 255 and hue below 60 degrees, so the
+                # hsv to rgb conversion reduces to r = v, g = v * h / 60
+                colors[:score.size, 0] = value
+                colors[:score.size, 1] = value * hue // 60
+                colors[:score.size, 2] = 0
+        return colors
+
+    def get_lod_mode(self):
+        """
+        Descript. : returns the level of detail used to paint the cells:
+                    "cells"  : beam shape, color and image number of each
+                               cell. Used for small grids with large cells
+                    "heatmap": one pixel per cell scaled to the grid size
+        """
+        if self.__lod_mode != "auto":
+            return self.__lod_mode
+        if self.__num_cols * self.__num_rows < GraphicsItemGrid.CELLS_LOD_MAX_CELLS and \
+           self.__cell_size_pix[1] > GraphicsItemGrid.CELLS_LOD_MIN_CELL_SIZE_PIX:
+            return "cells"
+        return "heatmap"
+
+    def set_lod_mode(self, lod_mode):
+        """
+        Descript. : sets level of detail: "auto", "cells" or "heatmap"
+        """
+        if lod_mode not in ("auto", "cells", "heatmap"):
+            raise ValueError("Unknown grid level of detail %s" % str(lod_mode))
+        self.__lod_mode = lod_mode
+
+    def get_overlay_pixmap(self):
+        """
+        Descript. : returns the rasterized cells as a QPixmap (None if
+                    there is nothing to display) and the level of detail.
+                    Pixmap is rendered again only if geometry, score,
+                    colors or level of detail have changed.
+        """
+        lod_mode = self.get_lod_mode()
+        base_color = None
+        if self.base_color:
+            base_color = self.base_color.rgb()
+        overlay_key = (lod_mode, self.__num_cols, self.__num_rows,
+                       self.__num_lines, self.__num_images_per_line,
+                       self.__first_image_num, self.__reversing_rotation,
+                       tuple(self.grid_direction['fast']),
+                       tuple(self.grid_direction['slow']),
+                       tuple(self.__cell_size_pix), tuple(self.beam_size_pix),
+                       self.beam_is_rectangle, self.__score_version,
+                       self.__fill_alpha, self.__display_overlay, base_color,
+                       self.custom_pen.color().rgb(), self.custom_pen.style())
+        if overlay_key != self.__overlay_key:
+            if lod_mode == "cells":
+                self.__overlay_pixmap = self.render_cells_pixmap()
+            else:
+                self.__overlay_pixmap = self.render_heatmap_pixmap()
+            self.__overlay_key = overlay_key
+        return self.__overlay_pixmap, lod_mode
+
+    def render_cells_pixmap(self):
+        """
+        Descript. : draws beam shape, color and image number of each cell
+                    into a pixmap of the grid size
+        """
+        num_cells = self.__num_cols * self.__num_rows
+        width = int(math.ceil(self.__grid_size_pix[0])) + 1
+        height = int(math.ceil(self.__grid_size_pix[1])) + 1
+        if num_cells == 0 or width < 2 or height < 2:
+            return None
+
+        coord_x, coord_y = self.get_cell_centres()
+        coord_x = (coord_x[:num_cells] + self.__grid_size_pix[0] / 2.0).tolist()
+        coord_y = (coord_y[:num_cells] + self.__grid_size_pix[1] / 2.0).tolist()
+        colors = self.get_cell_colors(num_cells).tolist()
+
+        pixmap = QtGui.QPixmap(width, height)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        painter.setPen(self.custom_pen)
+        if not self.__display_overlay:
+            painter.setBrush(QtCore.Qt.transparent)
+        brush = QtGui.QBrush(QtCore.Qt.SolidPattern)
+        if self.beam_is_rectangle:
+            draw_shape = painter.drawRect
+        else:
+            draw_shape = painter.drawEllipse
+
+        for cell_index in range(len(coord_x)):
+            pos_x = coord_x[cell_index]
+            pos_y = coord_y[cell_index]
+            if self.__display_overlay:
+                brush.setColor(QtGui.QColor(*colors[cell_index]))
+                painter.setBrush(brush)
+            draw_shape(QtCore.QRectF(pos_x - self.beam_size_pix[0] / 2.0,
+                                     pos_y - self.beam_size_pix[1] / 2.0,
+                                     self.beam_size_pix[0],
+                                     self.beam_size_pix[1]))
+            painter.drawText(QtCore.QRectF(pos_x - self.__cell_size_pix[0] / 2.0,
+                                           pos_y - self.__cell_size_pix[1] / 2.0,
+                                           self.__cell_size_pix[0],
+                                           self.__cell_size_pix[1]),
+                             QtCore.Qt.AlignCenter,
+                             str(cell_index + self.__first_image_num))
+        painter.end()
+        return pixmap
+
+    def render_heatmap_pixmap(self):
+        """
+        Descript. : draws score of each cell as one pixel. Pixmap is
+                    scaled to the grid size when painted
+        """
+        if self.__score is None or not self.__display_overlay or \
+           self.__num_cols * self.__num_rows == 0:
+            return None
+
+        cols, rows = self.get_col_row_map()
+        num_cells = min(cols.size, len(self.__score))
+        cols = numpy.clip(cols[:num_cells], 0, self.__num_cols - 1)
+        rows = numpy.clip(rows[:num_cells], 0, self.__num_rows - 1)
+        colors = self.get_cell_colors(num_cells).astype(numpy.uint32)
+
+        # QImage.Format_ARGB32 is stored as 0xAARRGGBB integers
+        image_data = numpy.zeros((self.__num_rows, self.__num_cols),
+                                 dtype=numpy.uint32)
+        image_data[rows, cols] = (colors[:, 3] << 24) | (colors[:, 0] << 16) | \
+                                 (colors[:, 1] << 8) | colors[:, 2]
+        image_str = image_data.tostring()
+        image = QtGui.QImage(image_str, self.__num_cols, self.__num_rows,
+                             self.__num_cols * 4, QtGui.QImage.Format_ARGB32)
+        return QtGui.QPixmap.fromImage(image)
+
     def get_col_row_from_line_image(self, line, image):
         """
         Descript. :  converts frame grid coordinates from scan grid 
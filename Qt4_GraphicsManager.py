@@ -341,42 +341,73 @@ class Qt4_GraphicsManager(HardwareObject):
            If diffractometer not ready then hides all shapes.
         """
         if self.diffractometer_hwobj.is_ready():
+            #All positions are projected to screen with one call
+            points = []
+            grids = []
+            motor_positions_list = []
             for shape in self.get_shapes():
                 if isinstance(shape, GraphicsLib.GraphicsItemPoint):
-                    cpos =  shape.get_centred_position()
-                    new_x, new_y = self.diffractometer_hwobj.\
-                        motor_positions_to_screen(cpos.as_dict())
-                    shape.set_start_position(new_x, new_y)
+                    points.append(shape)
+                    motor_positions_list.append(\
+                        shape.get_centred_position().as_dict())
                 elif isinstance(shape, GraphicsLib.GraphicsItemGrid):
-                    grid_cpos = shape.get_centred_position()
-                    current_cpos = queue_model_objects.CentredPosition(\
-                        self.diffractometer_hwobj.get_positions())
-
-                    current_cpos.set_motor_pos_delta(0.01)
-                    grid_cpos.set_motor_pos_delta(0.01)
-
-                    if hasattr(grid_cpos, "zoom"):
-                        current_cpos.zoom = grid_cpos.zoom
-
-                    shape.set_center_coord((self.diffractometer_hwobj.\
-                        motor_positions_to_screen(grid_cpos.as_dict())))
-
-                    corner_coord = []
-                    for motor_pos in shape.get_motor_pos_corner():
-                        corner_coord.append((self.diffractometer_hwobj.\
-                             motor_positions_to_screen(motor_pos)))
-                    shape.set_corner_coord(corner_coord)
+                    grids.append(shape)
+                    motor_positions_list.append(\
+                        shape.get_centred_position().as_dict())
+                    motor_positions_list.extend(shape.get_motor_pos_corner())
+            screen_coord = iter(self.motor_positions_to_screen_list(\
+                motor_positions_list))
+
+            for shape in points:
+                new_x, new_y = next(screen_coord)
+                shape.set_start_position(new_x, new_y)
+
+            if grids:
+                current_positions = self.diffractometer_hwobj.get_positions()
+            for shape in grids:
+                grid_cpos = shape.get_centred_position()
+                current_cpos = queue_model_objects.CentredPosition(\
+                    current_positions)
+
+                current_cpos.set_motor_pos_delta(0.01)
+                grid_cpos.set_motor_pos_delta(0.01)
+
+                if hasattr(grid_cpos, "zoom"):
+                    current_cpos.zoom = grid_cpos.zoom
+
+                shape.set_center_coord(tuple(next(screen_coord)))
+
+                corner_coord = []
+                for motor_pos in shape.get_motor_pos_corner():
+                    corner_coord.append(tuple(next(screen_coord)))
+                shape.set_corner_coord(corner_coord)
        
-                    if current_cpos == grid_cpos:
-                        shape.set_projection_mode(False)
-                    else:    
-                        shape.set_projection_mode(True)
+                if current_cpos == grid_cpos:
+                    shape.set_projection_mode(False)
+                else:    
+                    shape.set_projection_mode(True)
 
             self.show_all_items()
             self.graphics_view.graphics_scene.update()
         else:
             self.hide_all_items()
 
+    def motor_positions_to_screen_list(self, motor_positions_list):
+        """Projects list of motor positions to screen coordinates. Uses
+           the batched projection of the diffractometer if available
+
+        :param motor_positions_list: list of motor positions dicts
+        :type motor_positions_list: list
+        :returns: list of (x, y)
+        """
+        if not motor_positions_list:
+            return []
+        if hasattr(self.diffractometer_hwobj, "motor_positions_to_screen_list"):
+            return self.diffractometer_hwobj.motor_positions_to_screen_list(\
+                motor_positions_list)
+        return [self.diffractometer_hwobj.motor_positions_to_screen(\
+                motor_positions) for motor_positions in motor_positions_list]
+
     def diffractometer_centring_started(self, centring_method, flexible):
         """Method called when centring started as a reply from diffractometer
 
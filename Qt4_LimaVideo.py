@@ -30,6 +30,7 @@ from Lima import Core
 from Lima import Prosilica
 
 
+from VideoFramePipeline import VideoFramePipeline
 from HardwareRepository.BaseHardwareObjects import Device
 
 
@@ -63,6 +64,7 @@ class Qt4_LimaVideo(Device):
         self.video = None 
 
         self.image_polling = None
+        self.frame_pipeline = None
 
     def init(self):
         """
@@ -88,6 +90,10 @@ class Qt4_LimaVideo(Device):
      
         self.setIsReady(True)
 
+        self.frame_pipeline = VideoFramePipeline(self.convert_frame, self.name())
+        self.frame_pipeline.add_consumer(self.emit_image,
+             self.getProperty("maxFps"), "imageReceived")
+
         if self.image_polling is None:
             self.video.startLive()
             self.change_owner()
@@ -153,9 +159,13 @@ class Qt4_LimaVideo(Device):
         """
         Descript. :
         """
+        self.frame_pipeline.start()
         while self.video.getLive():
-            self.get_new_image()
+            image = self.video.getLastImage()
+            self.frame_pipeline.put_frame(image.frameNumber(), image.buffer(),
+                                          image.width(), image.height())
             time.sleep(sleep_time)
+        self.frame_pipeline.stop()
 	     	
     def connectNotify(self, signal):
         """
@@ -172,20 +182,38 @@ class Qt4_LimaVideo(Device):
         """
         pass
  
+    def convert_frame(self, raw_buffer, width, height):
+        """
+        Descript. : converts raw frame to qimage. Called in the worker
+                    thread of the frame pipeline. QImage does not copy
+                    raw_buffer, so a copy is made if image is not mirrored
+        """
+        qimage = QtGui.QImage(raw_buffer, width, height, 
+                              QtGui.QImage.Format_RGB888)
+        if self.cam_mirror is not None:
+            return qimage.mirrored(self.cam_mirror[0], self.cam_mirror[1])     
+        return qimage.copy()
+
+    def emit_image(self, qimage):
+        """
+        Descript. : QPixmap can be created only in the gui thread
+        """
+        self.emit("imageReceived", QtGui.QPixmap(qimage))
+
+    def get_video_statistics(self):
+        """
+        Descript. : returns fps and frame counters of the video
+        """
+        return self.frame_pipeline.get_statistics()
+
     def get_new_image(self):
         """
-        Descript. :
+        Descript. : converts the last frame
         """
         image = self.video.getLastImage()
         if image.frameNumber() > -1:
-            raw_buffer = image.buffer()	
-            qimage = QtGui.QImage(raw_buffer, image.width(), image.height(), 
-                                  QtGui.QImage.Format_RGB888)
-            if self.cam_mirror is not None:
-                qimage = qimage.mirrored(self.cam_mirror[0], self.cam_mirror[1])     
-            qpixmap = QtGui.QPixmap(qimage)
-            self.emit("imageReceived", qpixmap)
-            return qimage
+            return self.convert_frame(image.buffer(), image.width(),
+                                      image.height())
 
     def save_snapshot(self, filename, image_type='PNG'):
         qimage = self.get_new_image() 
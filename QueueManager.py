@@ -14,6 +14,8 @@ from logging.handlers import TimedRotatingFileHandler
 import gevent
 import queue_entry
 
+from QueueTimings import QueueTimings
+
 from HardwareRepository.BaseHardwareObjects import HardwareObject
 from queue_entry import QueueEntryContainer
 
@@ -51,16 +53,19 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         self._running = False
         self._disable_collect = False
         self._is_stopped = False
+        self._timings = QueueTimings()
 
     def __getstate__(self):
         d = dict(self.__dict__)
         d['_root_task'] = None
         d['_paused_event'] = None  
+        d['_timings'] = None
         return d      
 
     def __setstate__(self, d):
         self.__dict__.update(d)
         self._paused_event = gevent.event.Event()
+        self._timings = QueueTimings()
 
     def enqueue(self, queue_entry):
         """
@@ -142,35 +147,50 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         logging.getLogger('queue_exec').info('Calling execute on: ' + str(entry))
         logging.getLogger('queue_exec').info('Using model: ' + str(entry.get_data_model()))
 
-        if self.is_paused():
-            logging.getLogger('user_level_log').info('Queue paused, waiting ...')
-            entry.get_view().setText(1, 'Queue paused, waiting')
-
-        self.wait_for_pause_event()
+        entry_timing = self._timings.start_entry(entry)
 
         try:
-            # Procedure to be done before main implmentation
-            # of task.
-            entry.pre_execute()
-            entry.execute()
-
-            for child in entry._queue_entry_list:
-                self.__execute_entry(child)
-
-        except queue_entry.QueueSkippEntryException:
-            # Queue entry, failed, skipp.
-            pass
-        except (queue_entry.QueueAbortedException, Exception) as ex:
-            # Queue entry was aborted in a controlled, way.
-            # or in the exception case:
-            # Definetly not good state, but call post_execute
-            # in anyways, there might be code that cleans up things
-            # done in _pre_execute or before the exception in _execute.
-            entry.post_execute()
-            entry.handle_exception(ex)
-            raise ex
-        else:
-            entry.post_execute()
+            if self.is_paused():
+                logging.getLogger('user_level_log').info('Queue paused, waiting ...')
+                entry.get_view().setText(1, 'Queue paused, waiting')
+
+            with entry_timing.measure('pause_wait'):
+                self.wait_for_pause_event()
+
+            try:
+                # Procedure to be done before main implmentation
+                # of task.
+                with entry_timing.measure('pre_execute'):
+                    entry.pre_execute()
+                with entry_timing.measure('execute'):
+                    entry.execute()
+
+                with entry_timing.measure('children'):
+                    for child in entry._queue_entry_list:
+                        self.__execute_entry(child)
+
+            except queue_entry.QueueSkippEntryException:
+                # Queue entry, failed, skipp.
+                entry_timing.status = 'skipped'
+            except (queue_entry.QueueAbortedException, Exception) as ex:
+                # Queue entry was aborted in a controlled, way.
+                # or in the exception case:
+                # Definetly not good state, but call post_execute
+                # in anyways, there might be code that cleans up things
+                # done in _pre_execute or before the exception in _execute.
+                if isinstance(ex, queue_entry.QueueAbortedException):
+                    entry_timing.status = 'aborted'
+                else:
+                    entry_timing.status = 'failed'
+                with entry_timing.measure('post_execute'):
+                    entry.post_execute()
+                entry.handle_exception(ex)
+                raise ex
+            else:
+                with entry_timing.measure('post_execute'):
+                    entry.post_execute()
+        finally:
+            self._timings.end_entry(entry_timing)
 
         self._current_queue_entries.remove(entry)
 
@@ -327,6 +347,29 @@ class QueueManager(HardwareObject, QueueEntryContainer):
         """
         self.__execute_entry(entry)
 
+    def get_timing_statistics(self, reset=False):
+        """
+        Time spent in each phase of the queue entries (pause wait,
+        pre_execute, execute, children, post_execute, total) per entry
+        type, see QueueTimings.
+
+        :param reset: Reset the statistics after reading them
+        :type reset: bool
+
+        :returns: {'since': time, 'entries': {entry type: {phase: histogram}}}
+        :rtype: dict
+        """
+        statistics = self._timings.get_statistics()
+        if reset:
+            self._timings.reset()
+        return statistics
+
+    def reset_timing_statistics(self):
+        """
+        Resets the timing statistics, see get_timing_statistics().
+        """
+        self._timings.reset()
+
     def clear(self):
         """
         Clears the queue (removes all entries).
@@ -83,6 +83,7 @@ class QueueModel(HardwareObject):
         :returns: None
         :rtype: NoneType
         """
+        self._models[name].clear_path_template_index()
         self._models[name] = queue_model_objects.RootNode()
         self.queue_hwobj.clear()
 
@@ -127,10 +128,8 @@ class QueueModel(HardwareObject):
         """
         if isinstance(child, queue_model_objects.TaskNode):
             self._selected_model._total_node_count += 1
-            child._parent = parent
             child._node_id = self._selected_model._total_node_count
-            parent._children.append(child)
-            child._set_name(child._name)
+            parent._add_child(child)
             self.emit('child_added', (parent, child))
         else:
             raise TypeError("Expected type TaskNode, got %s "\
@@ -190,7 +189,7 @@ class QueueModel(HardwareObject):
         :rtype: None
         """
         if child in parent._children:
-            parent._children.remove(child)
+            parent._remove_child(child)
             self.emit('child_removed', (parent, child))
 
     def _detach_child(self, parent, child):
@@ -203,9 +202,17 @@ class QueueModel(HardwareObject):
         :returns: None
         :rtype: None
         """
-        child = parent._children.pop(child)
+        parent._remove_child(child)
         return child
 
+    def get_path_template_index(self):
+        """
+        :returns: The path template index of the selected model, built
+                  from the model on first use.
+        :rtype: PathTemplateIndex
+        """
+        return self.get_model_root().get_path_template_index()
+
     def set_parent(self, parent, child):
         """
         Sets the parent of the child <child> to <parent>
@@ -270,19 +277,8 @@ class QueueModel(HardwareObject):
         :returns: The next available run number for the given path_template.
         :rtype: int
         """
-        all_path_templates = self.get_path_templates()
-        conflicting_path_templates = [0]
-
-        for pt in all_path_templates:
-            if exclude_current:
-                if pt[1] is not new_path_template:
-                    if pt[1] == new_path_template:
-                        conflicting_path_templates.append(pt[1].run_number)
-            else:
-                if pt[1] == new_path_template:
-                    conflicting_path_templates.append(pt[1].run_number)
-
-        return max(conflicting_path_templates) + 1
+        return self.get_path_template_index().get_max_run_number(\
+             new_path_template, exclude_current) + 1
 
     def get_path_templates(self):
         """
@@ -316,15 +312,7 @@ class QueueModel(HardwareObject):
 
         :returns: True if there is a potential path collision.
         """
-        result = False
-        path_template_list = self.get_path_templates()
-        
-        for pt in path_template_list:
-            if pt[1] is not new_path_template:
-                if new_path_template.intersection(pt[1]):
-                    result = True
-
-        return result
+        return self.get_path_template_index().has_collision(new_path_template)
 
     def copy_node(self, node):
         """
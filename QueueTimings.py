@@ -0,0 +1,146 @@
+"""
+Timing instrumentation of the queue execution (see QueueManager).
+
+The time spent in each phase of a queue entry (pause wait, pre_execute,
+execute, children, post_execute and total) is accumulated per entry type
+(SampleQueueEntry, SampleCentringQueueEntry, DataCollectionQueueEntry,
+...) in histograms with fixed logarithmic bins. Recording a time is a
+dictionary lookup and a binary search, so the instrumentation can stay
+enabled in production.
+
+When an entry is finished, one JSON record with its phase times is
+written to the queue_exec log:
+
+    Queue entry timing: {"entry": "SampleQueueEntry", "status": "ok",
+                         "execute": 41.2, "total": 42.0, ...}
+
+QueueTimings.get_statistics returns the histograms as a dictionary that
+can be sent over XML-RPC (see XMLRPCServer.queue_get_timings).
+"""
+
+import json
+import time
+import bisect
+import logging
+import contextlib
+
+
+# time.monotonic is not available in Python 2
+clock = getattr(time, "monotonic", time.time)
+
+# Upper limits (s) of the histogram bins: 10 ms, 20 ms, ... ~2.9 h
+HISTOGRAM_BIN_LIMITS = tuple(0.01 * 2 ** index for index in range(21))
+
+
+class TimingHistogram(object):
+    """
+    Descript. : count, total, min, max and histogram of durations
+    """
+    __slots__ = ("count", "total", "min", "max", "bin_counts")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+        # Last bin: longer than the last limit
+        self.bin_counts = [0] * (len(HISTOGRAM_BIN_LIMITS) + 1)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if self.min is None or duration < self.min:
+            self.min = duration
+        if self.max is None or duration > self.max:
+            self.max = duration
+        self.bin_counts[bisect.bisect_left(HISTOGRAM_BIN_LIMITS, duration)] += 1
+
+    def as_dict(self):
+        return {"count": self.count,
+                "total": self.total,
+                "mean": self.total / self.count if self.count else 0.0,
+                "min": self.min or 0.0,
+                "max": self.max or 0.0,
+                "bin_limits": list(HISTOGRAM_BIN_LIMITS),
+                "bin_counts": list(self.bin_counts)}
+
+
+class EntryTiming(object):
+    """
+    Descript. : phase times of one execution of a queue entry
+    """
+    def __init__(self, entry_type, node_id=None):
+        self.entry_type = entry_type
+        self.node_id = node_id
+        self.status = "ok"
+        self.phases = {}
+        self.start_time = clock()
+
+    @contextlib.contextmanager
+    def measure(self, phase):
+        start_time = clock()
+        try:
+            yield
+        finally:
+            self.phases[phase] = self.phases.get(phase, 0.0) + clock() - start_time
+
+    def get_record(self):
+        record = {"entry": self.entry_type, "status": self.status}
+        if self.node_id is not None:
+            record["node_id"] = self.node_id
+        for phase, duration in self.phases.iteritems():
+            record[phase] = round(duration, 4)
+        return record
+
+
+class QueueTimings(object):
+    """
+    Descript. : histograms of the phase times per entry type
+    """
+    def __init__(self, log_name="queue_exec"):
+        self.log_name = log_name
+        self.enabled = True
+        self.histograms = {}
+        self.start_time = time.time()
+
+    def start_entry(self, entry):
+        try:
+            node_id = entry.get_data_model()._node_id
+        except AttributeError:
+            node_id = None
+        return EntryTiming(entry.__class__.__name__, node_id)
+
+    def end_entry(self, entry_timing):
+        """
+        Descript. : adds the phase times of the entry to the histograms
+                    and writes them to the log
+        """
+        entry_timing.phases["total"] = clock() - entry_timing.start_time
+        if not self.enabled:
+            return
+        for phase, duration in entry_timing.phases.iteritems():
+            self.record(entry_timing.entry_type, phase, duration)
+        logging.getLogger(self.log_name).info("Queue entry timing: %s" % \
+             json.dumps(entry_timing.get_record(), sort_keys=True))
+
+    def record(self, entry_type, phase, duration):
+        key = (entry_type, phase)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = TimingHistogram()
+            self.histograms[key] = histogram
+        histogram.add(duration)
+
+    def reset(self):
+        self.histograms = {}
+        self.start_time = time.time()
+
+    def get_statistics(self):
+        """
+        Descript. : {"since": time of the last reset,
+                     "entries": {entry type: {phase: histogram dict}}}
+        """
+        entries = {}
+        for (entry_type, phase), histogram in self.histograms.iteritems():
+            entries.setdefault(entry_type, {})[phase] = histogram.as_dict()
+        return {"since": self.start_time, "entries": entries}
@@ -10,6 +10,9 @@ import copy
 import gevent
 
 class Robodiff(MiniDiff.MiniDiff):      
+    # phiy and phiz are stored as y and z in the centred positions
+    SCREEN_PROJECTION_KEYS = ("sampx", "sampy", "y", "z")
+
     def __init__(self, name):
         MiniDiff.MiniDiff.__init__(self, name)
         qmo.CentredPosition.set_diffractometer_motor_names("phi",
@@ -89,12 +92,6 @@ class Robodiff(MiniDiff.MiniDiff):
         self.emitProgressMessage("Starting automatic centring procedure...")
 
 
-    def motor_positions_to_screen(self, centred_positions_dict):
-        centred_pos_dict = copy.deepcopy(centred_positions_dict)
-        centred_pos_dict["phiy"]=centred_positions_dict['y']
-        centred_pos_dict["phiz"]=centred_positions_dict['z']
-        return MiniDiff.MiniDiff.motor_positions_to_screen(self, centred_pos_dict) 
-
     def moveMotors(self, roles_positions_dict):
         motor = { "phi": self.phiMotor,
                   "focus": self.focusMotor,
@@ -161,7 +161,7 @@ import signal
 import xmlrpclib
 
 ## Added MS 
-import socket # for adxv visualisation
+from ImageNotifier import ImageSubscriber, ImageEvent, NEW_IMAGE # for adxv visualisation
 import pprint  # this was missing for some strange reason
 from HardwareRepository.Command.Tango import DeviceProxy
 import shlex 
@@ -342,9 +342,13 @@ class DataCollectPX2(Procedure):
                                     "abortRequested":None,
                                     "macroStarted":None,
                                     "logFile":None,
-                                    "arguments":{},
-                                    "adxv": None
+                                    "arguments":{}
                                 }
+        # adxv visualisation: persistent connection, the collect thread
+        # only publishes the images, each one sent once its file exists
+        self.adxvSubscriber = ImageSubscriber("adxv", '127.0.0.1', 9997,
+                                              file_timeout=5.)
+        self.adxvSubscriber.start()
         # Variable to get the datacollection ID into edna. It could be the persistent values arguments but these are always none when I tried to read them
         self.currentDataCollectionId = None
             
@@ -622,22 +626,8 @@ class DataCollectPX2(Procedure):
         if not adxv_socket_running():
             os.system(_cl)
             time.sleep(1.)
-        
-        adxv_host = '127.0.0.1'
-        adxv_port = 9997
-        
-        #res = socket.getaddrinfo(adxv_host, adxv_port, 0, socket.SOCK_STREAM)
-        #af, socktype, proto, canonname, sa = res[0]
-        #self.persistentValues["adxv"] = socket.socket(af, socktype, proto)
-        #self.persistentValues["adxv"].connect((adxv_host, adxv_port)) #(adxv_host, adxv_port))
-        try:
-            res = socket.getaddrinfo(adxv_host, adxv_port, 0, socket.SOCK_STREAM)
-            af, socktype, proto, canonname, sa = res[0]
-            self.persistentValues["adxv"] = socket.socket(af, socktype, proto)
-            self.persistentValues["adxv"].connect((adxv_host, adxv_port)) #(adxv_host, adxv_port))
-        except:
-            self.persistentValues["adxv"] = None
-            print "Warning: Can't connect to adxv for the following collect."
+            # adxv (re)started: connect again for the next image
+            self.adxvSubscriber.reconnect()
             
 
     """
@@ -2952,20 +2942,10 @@ class DataCollectPX2(Procedure):
         
         
         # For ADXV visu (PL 26_07_2011; MS 2013-06-24).
-        adxv_send_fmt = "\nload_image %s"#+ chr(32)
         try:
-            adxv_sender = self.persistentValues["adxv"]
-            if not adxv_sender:
-                raise Exception
-            # adxv_sender # test the connection ???
+            self.connectVisualisation()
         except:
-            try:
-                self.connectVisualisation()
-                time.sleep(1.)
-                adxv_sender = self.persistentValues["adxv"]
-            except:
-                adxv_sender = None
-                print "Warning: Can't connect to adxv for the following collect."
+            print "Warning: Can't start adxv for the following collect."
                 
         while self.collectObject.state() == "STANDBY":
             time.sleep(0.1)
@@ -2976,18 +2956,11 @@ class DataCollectPX2(Procedure):
         last_time_visu = 0
         _nerr = 0 
         
-        def tryToLoad(currentImageName):
+        def tryToLoad(currentImageName, imageNum):
+            # Does not wait, the image is sent by adxvSubscriber once
+            # its file exists (or replaced by the next one)
             currentImageName = os.path.join(self.collectObject.imagePath, currentImageName)
-            try:
-                print 'adxv_sender.send(adxv_send_fmt % currentImageName)'
-                while not os.path.exists(currentImageName):
-                    commands.getoutput('ls ' + self.collectObject.imagePath )
-                    time.sleep(0.2)
-                print 'command', adxv_send_fmt % currentImageName
-                adxv_sender.send(adxv_send_fmt % currentImageName)
-                adxv_sender.send('\n')
-            except Exception, e:
-                print e
+            self.adxvSubscriber.put(ImageEvent(NEW_IMAGE, currentImageName, imageNum))
         
         while self.collectObject.state() == "RUNNING":
             imageNum = self.collectObject.imageNum
@@ -2996,8 +2969,7 @@ class DataCollectPX2(Procedure):
                 currentImageName = self.collectObject.currentImageName
                 intensity = str(self.collectObject.xbpm.intensity)
                 
-                if adxv_sender:
-                    tryToLoad(currentImageName)
+                tryToLoad(currentImageName, imageNum)
                 
                 if self.collectObject.totalImages >= imageNum > 0:
                     self.imageCollectedUpdate("%d %s %s" % (imageNum, currentImageName, intensity))
@@ -3006,8 +2978,7 @@ class DataCollectPX2(Procedure):
         currentImageName = self.collectObject.currentImageName
         intensity = str(self.collectObject.xbpm.intensity)
         
-        if adxv_sender:
-            tryToLoad(currentImageName)
+        tryToLoad(currentImageName, imageNum)
         
         self.imageCollectedUpdate("%d %s %s" % (imageNum, currentImageName, intensity))
         
@@ -14,7 +14,7 @@ import os
 import time
 import types
 import math
-from xabs_lib import *
+import EdgeDatabase
 #from simple_scan_class import *
 import string
 #MS 05.03.2013
@@ -516,13 +516,8 @@ class EnergyScanPX1(Equipment):
         self.scanThread.start()
 
     def getEdgefromXabs(self, el, edge):
-        edge = string.upper(edge)
-        roi_center = McMaster[el]['edgeEnergies'][edge + '-alpha']
-        if edge == 'L':
-            edge = 'L3'
-        e_edge = McMaster[el]['edgeEnergies'][edge]
-        return (e_edge, roi_center)    
-        
+        return EdgeDatabase.get_mcmaster_table().get_scan_edge(el, edge)
+
     def newPoint(self, x, y):
         logging.getLogger("HWR").debug('EnergyScan:newPoint')
         print 'newPoint', x, y
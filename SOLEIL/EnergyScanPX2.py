@@ -10,7 +10,7 @@ import os
 import time
 import types
 import math
-from xabs_lib import *
+import EdgeDatabase
 import string
 from PyTango import DeviceProxy
 import numpy
@@ -694,13 +694,8 @@ class EnergyScanPX2(Equipment):
         self.scanThread.start()
 
     def getEdgefromXabs(self, el, edge):
-        edge = string.upper(edge)
-        roi_center = McMaster[el]['edgeEnergies'][edge + '-alpha']
-        if edge == 'L':
-            edge = 'L3'
-        e_edge = McMaster[el]['edgeEnergies'][edge]
-        return (e_edge, roi_center)    
-        
+        return EdgeDatabase.get_mcmaster_table().get_scan_edge(el, edge)
+
     def newPoint(self, x, y):
         logging.getLogger("HWR").debug('EnergyScan:newPoint')
         print 'newPoint', x, y
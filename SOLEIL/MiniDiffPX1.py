@@ -286,6 +286,10 @@ class MiniDiffPX1(MiniDiff):
 
        return x, y
 
+   def motor_positions_to_screen_list(self, centred_positions_list):
+       return numpy.array([self.motor_positions_to_screen(centred_positions_dict) \
+                           for centred_positions_dict in centred_positions_list]).reshape(-1, 2)
+
    def manualCentringDone(self, manual_centring_procedure):
         logging.info("manual centring DONE")
         try:
@@ -8,6 +8,7 @@ import re
 import math
 
 import experiment as Experiment
+from ImageReplication import ImageReplication
 
 class PX2MultiCollect(SOLEILMultiCollect):
     def __init__(self, name):
@@ -42,6 +43,23 @@ class PX2MultiCollect(SOLEILMultiCollect):
         self.lima_overhead = float(self.getProperty("lima_overhead"))
         logging.info("<PX2 MultiCollect> lima_overhead %s" % self.lima_overhead)
         self._detector.prepareHeader = self.prepareHeader
+
+        # Images are replicated to sync_host by one worker thread
+        sync_host = self.getProperty("sync_host")
+        if sync_host is None:
+            sync_host = "p10"
+        # Size of a complete ADSC image. 0: an image is complete when its
+        # size has not changed for settle_time (longer than the NFS
+        # attribute cache)
+        sync_image_size = self.getProperty("sync_image_size")
+        if sync_image_size is None:
+            sync_image_size = 18874880
+        self.sync_timeout = self.getProperty("sync_timeout")
+        if self.sync_timeout is None:
+            self.sync_timeout = 60
+        self.image_replication = ImageReplication(sync_host,
+             expected_size=int(sync_image_size) or None)
+        self.image_replication.start()
         SOLEILMultiCollect.init(self)
        
     def prepareHeader(self, X=None, Y=None, D=None):
@@ -573,38 +591,29 @@ class PX2MultiCollect(SOLEILMultiCollect):
         self.sync_destination = os.path.join(reference, directory[1:])
         sync_process = os.path.join(self.sync_destination, 'process')
         logging.info('get_sync_destination %s ' %self.sync_destination )
-        os.system('ssh p10 "mkdir -p %s"' % sync_process)
-        
-    def synchronize_thread(self, directory, filename):
-        logging.info('Starting Synchronize Thread')
-        logging.info('filename %s ' % filename)
-        self.sthread = threading.Thread(target=self.synchronize_image, args=(directory, filename))
-        self.sthread.daemon = True
-        self.sthread.start()
+        # Created once per directory, through the persistent ssh connection
+        self.image_replication.makedirs(sync_process)
         
     def synchronize_image(self, directory, filename):
-        logging.info('Synchronizing image %s' % filename)
-        filename = os.path.join(directory, filename)
-        while not os.path.exists(filename):
-            time.sleep(0.05)
-        logging.info('Size of the image after it came to existence %s' % os.path.getsize(filename))
-        time.sleep(0.2)
-        while os.path.getsize(filename) != 18874880:
-            time.sleep(0.05)
-        logging.info('Size of the image before sync %s' % os.path.getsize(filename))
-        logging.info('sync command %s' % ('ssh p10 "rsync -av %s %s"' % (filename, self.sync_destination)))
-        os.system('ssh p10 "rsync -av %s %s"' % (filename, self.sync_destination))
+        # Does not wait, the image is sent with the next batch once complete
+        self.image_replication.add_file(os.path.join(directory, filename), self.sync_destination)
     
     def sync_collect(self, file_location, last_file, image_file_template):
-        logging.info('sync_last_collect')
-        last_file = os.path.join(file_location, last_file)
-        start = time.time()
-        while (not os.path.exists(last_file)) and time.time() - start < 5.:
-            time.sleep(0.1)
-        source = os.path.join(file_location, image_file_template.replace('%04d', '*'))
-        print 'sync_collect'
-        print 'excuting command', 'ssh p10 "rsync -av %s %s"' % (source, self.sync_destination)
-        os.system('ssh p10 "rsync -av %s %s"' % (source, self.sync_destination))
+        logging.info('sync_collect')
+        if not self.image_replication.wait(self.sync_timeout):
+            logging.warning('sync_collect: images still pending after %s s' % self.sync_timeout)
+        # Last rsync of the whole collection, repairs the copies that
+        # failed or were truncated
+        self.image_replication.reconcile(file_location, self.sync_destination,
+                                         image_file_template.replace('%04d', '*'))
+        if not self.image_replication.wait(self.sync_timeout):
+            logging.warning('sync_collect: collection not synchronized after %s s' % self.sync_timeout)
+        stats = self.image_replication.get_statistics()
+        logging.info('sync_collect: %d images pending, %d replicated in %d transfers, '
+                     '%d failed, lag mean %.2f s max %.2f s' % \
+                     (stats["waiting"] + stats["ready"] + stats["transferring"],
+                      stats["transferred"], stats["transfers"], stats["failed"],
+                      stats["lag"]["mean"], stats["lag"]["max"]))
         
     def should_i_take_snapshots(self, data_collect_parameters):
         if data_collect_parameters['oscillation_sequence'][0]['start_image_number'] != 1:
@@ -667,7 +676,7 @@ class PX2MultiCollect(SOLEILMultiCollect):
                 self.logger.info(traceback.print_exc())
         
         if self.synchronize is True:
-            self.synchronize_thread(fileName)
+            self.synchronize_image(*os.path.split(fileName))
         self.analyze_thread(fileName)
         
     @task
@@ -1108,7 +1117,7 @@ class PX2MultiCollect(SOLEILMultiCollect):
                                                    data_collect_parameters.get("sample_reference", {}).get("spacegroup", ""),
                                                    data_collect_parameters.get("sample_reference", {}).get("cell", ""))
                 
-                self.synchronize_thread(file_location, filename)
+                self.synchronize_image(file_location, filename)
                 frame += 1
 
             self.sync_collect(file_location, filename, image_file_template)
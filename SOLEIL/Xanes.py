@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from xabs_lib import McMaster
+import EdgeDatabase
 import time
 import threading
 import logging
@@ -296,13 +296,7 @@ class xanes(object):
         self.wait(Attenuator)
 
     def getEdgefromXabs(self, element, edge):
-        edge = edge.upper()
-        roi_center = McMaster[element]['edgeEnergies'][edge + '-alpha']
-        if edge == 'L':
-            edge = 'L3'
-        e_edge = McMaster[element]['edgeEnergies'][edge]
-
-        return e_edge, roi_center
+        return EdgeDatabase.get_mcmaster_table().get_scan_edge(element, edge)
 
     def _pointsToStrings(self, points):
         return [str(e) for e in points] 
@@ -10,7 +10,7 @@ import numpy
 import os
 import pickle
 import math
-from xabs_lib import *
+import EdgeDatabase
 
 class XfeCollect(object):
     def __init__(self, integrationTime = .64, directory = '/tmp', prefix = 'test', sessionId = None, sampleId = None, test=False, optimize=False):
@@ -90,13 +90,8 @@ class XfeCollect(object):
         self.wait(self.ble)
             
     def getEdgefromXabs(self, el, edge):
-        edge = edge.upper()
-        roi_center = McMaster[el]['edgeEnergies'][edge + '-alpha']
-        if edge == 'L':
-            edge = 'L3'
-        e_edge = McMaster[el]['edgeEnergies'][edge]
-        return (e_edge, roi_center)    
-        
+        return EdgeDatabase.get_mcmaster_table().get_scan_edge(el, edge)
+
     def optimizeTransmission(self, element, edge):
         if self.test == True: return 0
         print 'Going to optimize transmission'
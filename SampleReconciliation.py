@@ -0,0 +1,165 @@
+"""
+Reconciliation of the samples stored in ISPyB with the samples present
+in the sample changer. Used by the lims clients (get_session_samples).
+
+Sample changer samples are indexed once by (code, basket, vial) and by
+(basket, vial), so all ISPyB samples are matched in a single pass. The
+merged list is also compared with the result of the previous
+reconciliation, so callers can update only what has changed.
+"""
+
+from collections import namedtuple
+
+
+SampleReference = namedtuple('SampleReference', ['code',
+                                                 'container_reference',
+                                                 'sample_reference',
+                                                 'container_code'])
+
+
+def _get_field(sample, name):
+    if isinstance(sample, dict):
+        return sample.get(name)
+    return getattr(sample, name, None)
+
+
+def _set_field(sample, name, value):
+    if isinstance(sample, dict):
+        sample[name] = value
+    else:
+        setattr(sample, name, value)
+
+
+def _to_int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _sample_key(sample_dict):
+    """
+    Location of a merged sample: (basket, vial)
+    """
+    location = sample_dict.get('sampleLocation')
+    if location is None:
+        location = sample_dict.get('location')
+    return (_to_int(sample_dict.get('containerSampleChangerLocation')),
+            _to_int(location))
+
+
+class SampleReconciler(object):
+    """
+    Matches ISPyB samples with sample changer samples.
+
+    The datamatrix code read by the sample changer is used in case
+    of conflict.
+    """
+    def __init__(self, sample_to_dict=None):
+        """
+        :param sample_to_dict: converts an ISPyB sample to the dictionary
+                               returned to the caller
+        :type sample_to_dict: callable
+        """
+        self.sample_to_dict = sample_to_dict or dict
+        self.last_samples = {}
+
+    def reconcile(self, lims_samples, sample_refs):
+        """
+        :param lims_samples: samples from ISPyB
+        :type lims_samples: list
+
+        :param sample_refs: The list of samples currently in the
+                            sample changer, as (code, basket, vial,
+                            basket code) tuples
+        :type sample_refs: list
+
+        :returns: merged list of sample dictionaries and a dictionary
+                  with the 'added', 'removed' and 'changed' samples since
+                  the last reconciliation
+        :rtype: tuple
+        """
+        sample_references = [SampleReference(*sample_ref) for sample_ref in sample_refs]
+        by_code_location = {}
+        by_location = {}
+        for index, sample_ref in enumerate(sample_references):
+            location = (sample_ref.container_reference, sample_ref.sample_reference)
+            by_code_location.setdefault((sample_ref.code, ) + location, []).append(index)
+            by_location.setdefault(location, []).append(index)
+        matched = set()
+
+        def find_sample(index_dict, key):
+            for index in index_dict.get(key, ()):
+                if index not in matched:
+                    return index
+            return None
+
+        samples = []
+        for sample in lims_samples:
+            code = _get_field(sample, 'code')
+            sample_location = _get_field(sample, 'sampleLocation')
+            loc = (_to_int(_get_field(sample, 'containerSampleChangerLocation')),
+                   _to_int(sample_location))
+
+            # Unmatched sample, keep it as it is
+            if not code and not sample_location:
+                pass
+            # Sample location and code was found in ISPyB. If the code does
+            # not match with the sample changer, sample changer code is used
+            elif code and sample_location:
+                index = find_sample(by_code_location, (code, ) + loc)
+                if index is None:
+                    index = find_sample(by_location, loc)
+                    if index is None:
+                        # Not in the sample changer
+                        continue
+                    if sample_references[index].code != '':
+                        _set_field(sample, 'code', sample_references[index].code)
+                matched.add(index)
+            # Only location was found, update with the code
+            # from sample changer if it exists.
+            elif sample_location:
+                index = find_sample(by_location, loc)
+                if index is not None:
+                    _set_field(sample, 'sampleCode', sample_references[index].code)
+                    matched.add(index)
+            # Only code was found in ISPyB, location is unknown
+            else:
+                continue
+
+            try:
+                samples.append(self.sample_to_dict(sample))
+            except:
+                pass
+
+        # Add the unmatched samples to the result from ISPyB
+        for index, sample_ref in enumerate(sample_references):
+            if index not in matched:
+                samples.append(
+                    {'code': sample_ref.code,
+                     'location': sample_ref.sample_reference,
+                     'containerSampleChangerLocation': sample_ref.container_reference})
+
+        return samples, self.get_changes(samples)
+
+    def get_changes(self, samples):
+        """
+        Compares samples (by location) with the previous reconciliation
+        """
+        current_samples = {}
+        for sample in samples:
+            current_samples[_sample_key(sample)] = sample
+
+        changes = {'added': [], 'removed': [], 'changed': []}
+        for key, sample in current_samples.iteritems():
+            last_sample = self.last_samples.get(key)
+            if last_sample is None:
+                changes['added'].append(sample)
+            elif last_sample != sample:
+                changes['changed'].append(sample)
+        for key, sample in self.last_samples.iteritems():
+            if key not in current_samples:
+                changes['removed'].append(sample)
+
+        self.last_samples = current_samples
+        return changes
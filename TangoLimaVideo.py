@@ -14,6 +14,7 @@ import PyTango
 from PyTango.gevent import DeviceProxy
 import numpy
 import struct
+from VideoFramePipeline import VideoFramePipeline
 
 class TangoLimaVideo(BaseHardwareObjects.Device):
     def __init__(self, name):
@@ -24,6 +25,8 @@ class TangoLimaVideo(BaseHardwareObjects.Device):
         self.__gammaExists = False
         self.__polling = None
         self.scaling = pixmaptools.LUT.Scaling()
+        self.do_scaling = True
+        self.frame_pipeline = None
         
     def init(self):
         self.device = None
@@ -42,29 +45,62 @@ class TangoLimaVideo(BaseHardwareObjects.Device):
             self.setExposure(self.getProperty("interval")/1000.0)
             self.device.video_mode = "BAYER_RG16"
 
+        self.frame_pipeline = VideoFramePipeline(self.convert_frame, self.name())
+        self.frame_pipeline.add_consumer(self.emit_image,
+             self.getProperty("maxFps"), "imageReceived")
         self.setIsReady(True)
 
     def imageType(self):
         return BayerType("RG16")
 
-    def _get_last_image(self):
+    def _read_last_frame(self):
+        """Returns frame number, raw buffer (view of the tango
+        attribute value, not copied), width and height of the last
+        image or None
+        """
         img_data = self.device.video_last_image
         if img_data[0]=="VIDEO_IMAGE":
             header_fmt = ">IHHqiiHHHH"
             _, ver, img_mode, frame_number, width, height, _, _, _, _ = struct.unpack(header_fmt, img_data[1][:struct.calcsize(header_fmt)])
-            raw_buffer = numpy.fromstring(img_data[1][32:], numpy.uint16)
+            raw_buffer = numpy.frombuffer(img_data[1], numpy.uint16, offset=32)
+            return frame_number, raw_buffer, width, height
+
+    def convert_frame(self, raw_buffer, width, height):
+        """Bayer to qimage conversion, called in the worker thread of
+        the frame pipeline. Levels are estimated on the first frame
+        and after refresh_video
+        """
+        if self.do_scaling:
             self.scaling.autoscale_min_max(raw_buffer, width, height, pixmaptools.LUT.Scaling.BAYER_RG16)
-            validFlag, qimage = pixmaptools.LUT.raw_video_2_image(raw_buffer,
-                                                                  width, height,
-                                                                  pixmaptools.LUT.Scaling.BAYER_RG16,
-                                                                  self.scaling)
-            if validFlag:
-                return qimage
+            self.do_scaling = False
+        validFlag, qimage = pixmaptools.LUT.raw_video_2_image(raw_buffer,
+                                                              width, height,
+                                                              pixmaptools.LUT.Scaling.BAYER_RG16,
+                                                              self.scaling)
+        if validFlag:
+            return qimage
+
+    def emit_image(self, qimage):
+        self.emit("imageReceived", qimage, qimage.width(), qimage.height(), False)
+
+    def refresh_video(self):
+        self.do_scaling = True
+
+    def get_video_statistics(self):
+        """Returns fps and frame counters of the video"""
+        return self.frame_pipeline.get_statistics()
+
+    def _get_last_image(self):
+        frame = self._read_last_frame()
+        if frame is not None:
+            return self.convert_frame(*frame[1:])
 
     def _do_polling(self, sleep_time):
+        self.frame_pipeline.start()
         while True:
-            qimage = self._get_last_image()
-   	    self.emit("imageReceived", qimage, qimage.width(), qimage.height(), False)
+            frame = self._read_last_frame()
+            if frame is not None:
+                self.frame_pipeline.put_frame(*frame)
 
             time.sleep(sleep_time)
 
@@ -0,0 +1,240 @@
+"""
+Video frame pipeline shared by the video hardware objects (LimaVideo,
+Qt4_LimaVideo, TangoLimaVideo).
+
+The polling greenlet of the hardware object passes the last camera frame
+to put_frame. Frames with a frame number that has not changed since the
+previous poll are skipped. The latest frame is kept in a one slot buffer
+and converted (bayer/LUT conversion, mirroring) in a worker thread of the
+gevent threadpool. If a new frame arrives before the previous one has been
+converted, the previous one is dropped.
+
+Converted frames are passed to the consumers. Each consumer has its own
+greenlet, one slot buffer and maximal output rate, so a slow consumer
+(for example the GUI) only drops frames and does not delay the polling,
+the conversion or the other consumers.
+
+Example:
+    pipeline = VideoFramePipeline(self.convert_frame, self.name())
+    pipeline.add_consumer(self.emit_image, max_fps=25)
+    pipeline.start()
+    ...
+    pipeline.put_frame(image.frameNumber(), image.buffer(),
+                       image.width(), image.height())
+"""
+
+import time
+import logging
+import collections
+
+import gevent
+import gevent.event
+
+
+class FrameRateCounter(object):
+    """
+    Descript. : counts events in a sliding time window
+    """
+    def __init__(self, window=2.0):
+        self.window = window
+        self.count = 0
+        self.__times = collections.deque()
+
+    def add(self):
+        now = time.time()
+        self.count += 1
+        self.__times.append(now)
+        while self.__times and self.__times[0] < now - self.window:
+            self.__times.popleft()
+
+    def get_fps(self):
+        now = time.time()
+        while self.__times and self.__times[0] < now - self.window:
+            self.__times.popleft()
+        if len(self.__times) < 2:
+            return 0.0
+        return (len(self.__times) - 1) / max(now - self.__times[0], 1e-6)
+
+
+class VideoFrameConsumer(object):
+    """
+    Descript. : receives converted frames with callback(image) at a rate
+                limited to max_fps (None: as fast as frames are converted)
+    """
+    def __init__(self, callback, max_fps=None, name="consumer"):
+        self.callback = callback
+        self.name = name
+        self.max_fps = max_fps
+        self.frames_dropped = 0
+        self.output_counter = FrameRateCounter()
+
+        self.__image = None
+        self.__new_image_event = gevent.event.Event()
+        self.__task = None
+
+    def set_max_fps(self, max_fps):
+        self.max_fps = max_fps
+
+    def start(self):
+        if self.__task is None:
+            self.__task = gevent.spawn(self.__output_images)
+
+    def stop(self):
+        if self.__task is not None:
+            self.__task.kill()
+            self.__task = None
+
+    def put(self, image):
+        """
+        Descript. : puts image in the one slot buffer. Image that has not
+                    been passed to the callback yet is dropped
+        """
+        if self.__image is not None:
+            self.frames_dropped += 1
+        self.__image = image
+        self.__new_image_event.set()
+
+    def get_statistics(self):
+        return {"name": self.name,
+                "max_fps": self.max_fps,
+                "fps": self.output_counter.get_fps(),
+                "frames": self.output_counter.count,
+                "frames_dropped": self.frames_dropped}
+
+    def __output_images(self):
+        while True:
+            self.__new_image_event.wait()
+            self.__new_image_event.clear()
+            image = self.__image
+            self.__image = None
+            if image is None:
+                continue
+
+            start_time = time.time()
+            try:
+                self.callback(image)
+            except Exception:
+                logging.getLogger("HWR").exception(\
+                    "VideoFramePipeline: %s failed to process frame" % self.name)
+            self.output_counter.add()
+
+            if self.max_fps:
+                gevent.sleep(max(0, 1.0 / self.max_fps - \
+                                 (time.time() - start_time)))
+
+
+class VideoFramePipeline(object):
+    """
+    Descript. : skips, converts and distributes video frames.
+                convert_func(raw_buffer, width, height) is called in
+                a worker thread and returns the converted image or None
+                if the frame is not valid.
+    """
+    def __init__(self, convert_func, name="video"):
+        self.convert_func = convert_func
+        self.name = name
+        self.consumers = []
+        self.last_frame_number = None
+        self.last_image = None
+        self.frames_skipped = 0
+        self.frames_dropped = 0
+        self.frames_invalid = 0
+        self.input_counter = FrameRateCounter()
+        self.convert_counter = FrameRateCounter()
+
+        self.__frame = None
+        self.__new_frame_event = gevent.event.Event()
+        self.__task = None
+
+    def start(self):
+        if self.__task is None:
+            self.__task = gevent.spawn(self.__convert_frames)
+        for consumer in self.consumers:
+            consumer.start()
+
+    def stop(self):
+        if self.__task is not None:
+            self.__task.kill()
+            self.__task = None
+        for consumer in self.consumers:
+            consumer.stop()
+
+    def is_running(self):
+        return self.__task is not None
+
+    def add_consumer(self, callback, max_fps=None, name=None):
+        """
+        Descript. : adds a consumer that receives converted images
+        Return    : VideoFrameConsumer
+        """
+        consumer = VideoFrameConsumer(callback, max_fps,
+             name or "consumer %d" % (len(self.consumers) + 1))
+        self.consumers.append(consumer)
+        if self.is_running():
+            consumer.start()
+        return consumer
+
+    def remove_consumer(self, consumer):
+        if consumer in self.consumers:
+            consumer.stop()
+            self.consumers.remove(consumer)
+
+    def put_frame(self, frame_number, raw_buffer, width, height):
+        """
+        Descript. : passes a new frame to the pipeline. raw_buffer is
+                    only referenced, not copied, until it is converted
+        Return    : False if frame was skipped because the frame number
+                    has not changed (or is negative: no frame yet)
+        """
+        if frame_number < 0 or frame_number == self.last_frame_number:
+            self.frames_skipped += 1
+            return False
+        self.last_frame_number = frame_number
+
+        if self.__frame is not None:
+            self.frames_dropped += 1
+        self.__frame = (raw_buffer, width, height)
+        self.input_counter.add()
+        self.__new_frame_event.set()
+        return True
+
+    def get_statistics(self):
+        """
+        Descript. : returns frame rates and frame counters of the pipeline
+                    and of each consumer
+        """
+        return {"name": self.name,
+                "input_fps": self.input_counter.get_fps(),
+                "convert_fps": self.convert_counter.get_fps(),
+                "frames": self.input_counter.count,
+                "frames_converted": self.convert_counter.count,
+                "frames_skipped": self.frames_skipped,
+                "frames_dropped": self.frames_dropped,
+                "frames_invalid": self.frames_invalid,
+                "consumers": [consumer.get_statistics() for \
+                              consumer in self.consumers]}
+
+    def __convert_frames(self):
+        threadpool = gevent.get_hub().threadpool
+        while True:
+            self.__new_frame_event.wait()
+            self.__new_frame_event.clear()
+            frame = self.__frame
+            self.__frame = None
+            if frame is None:
+                continue
+
+            try:
+                image = threadpool.apply(self.convert_func, frame)
+            except Exception:
+                logging.getLogger("HWR").exception(\
+                    "VideoFramePipeline: %s failed to convert frame" % self.name)
+                continue
+            if image is None:
+                self.frames_invalid += 1
+                continue
+
+            self.last_image = image
+            self.convert_counter.add()
+            for consumer in self.consumers:
+                consumer.put(image)
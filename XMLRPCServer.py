@@ -14,12 +14,21 @@ import gevent
 import socket
 import time
 import json
+import array
+import gevent.pool
+
+try:
+   from gevent.lock import RLock
+except ImportError:
+   from gevent.coros import RLock
 
 from HardwareRepository.BaseHardwareObjects import HardwareObject
 if sys.version_info > (3, 0):
    from xmlrpc.server import SimpleXMLRPCServer
+   from xmlrpc.client import Binary
 else:
    from SimpleXMLRPCServer import SimpleXMLRPCServer
+   from xmlrpclib import Binary
 
 
 __author__ = "Marcus Oskarsson, Matias Guijarro"
@@ -32,6 +41,86 @@ __email__ = "marcus.oscarsson@esrf.fr"
 __status__ = "Draft"
 
 
+# Methods that only read values, they can run while another request
+# (e.g. a motor move) is in progress
+CONCURRENT_METHODS = ("system.listMethods", "system.methodHelp",
+                      "system.methodSignature", "system.multicall",
+                      "log_message", "is_queue_executing",
+                      "shape_history_get_grid", "beamline_setup_read",
+                      "get_diffractometer_positions", "cryo_temperature",
+                      "flux", "get_aperture", "get_aperture_list", "get_cp",
+                      "get_state_snapshot", "queue_get_timings",
+                      "queue_get_changes", "queue_get_schema")
+
+
+def encode_array(values, typecode="d"):
+    """
+    Compact transport of numeric arrays: values as little endian binary
+    data (typecode "d": float64, "i": int32)
+    """
+    arr = array.array(typecode, values)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    if sys.version_info > (3, 0):
+        return Binary(arr.tobytes())
+    return Binary(arr.tostring())
+
+
+def decode_array(binary, typecode="d"):
+    """
+    Inverse of encode_array, returns a list
+    """
+    arr = array.array(typecode)
+    if sys.version_info > (3, 0):
+        arr.frombytes(binary.data)
+    else:
+        arr.fromstring(binary.data)
+    if sys.byteorder == "big":
+        arr.byteswap()
+    return arr.tolist()
+
+
+class GeventXMLRPCServer(SimpleXMLRPCServer):
+    """
+    XML-RPC server that handles each request in its own greenlet, so
+    a long call (move_diffractometer, save_snapshot, ...) does not block
+    the clients polling the beamline state.
+
+    All methods run in the gevent hub thread, like the rest of the hardware
+    objects. Methods that are not in concurrent_methods are executed one
+    at a time.
+    """
+    # Many pollers may connect at the same time
+    request_queue_size = 64
+
+    def __init__(self, addr, max_concurrent_requests=16,
+                 concurrent_methods=CONCURRENT_METHODS, **kwargs):
+        SimpleXMLRPCServer.__init__(self, addr, **kwargs)
+        self.request_pool = gevent.pool.Pool(max_concurrent_requests)
+        self.exclusive_lock = RLock()
+        self.concurrent_methods = set(concurrent_methods)
+
+    def process_request(self, request, client_address):
+        # Waits for a free greenlet if max_concurrent_requests are running
+        self.request_pool.spawn(self._process_request_greenlet,
+                                request, client_address)
+
+    def _process_request_greenlet(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def _dispatch(self, method, params):
+        # system.multicall dispatches each of its calls with _dispatch
+        if method in self.concurrent_methods:
+            return SimpleXMLRPCServer._dispatch(self, method, params)
+        with self.exclusive_lock:
+            return SimpleXMLRPCServer._dispatch(self, method, params)
+
+
 class XMLRPCServer(HardwareObject):
     def __init__(self, name):
         HardwareObject.__init__(self, name)
@@ -78,12 +167,27 @@ class XMLRPCServer(HardwareObject):
         if hasattr(self, "_server" ):
           return
         self.xmlrpc_prefixes = set()
-        self._server = SimpleXMLRPCServer((self.host, int(self.port)), logRequests = False, allow_none = True)
+
+        # <concurrent>True</concurrent>: requests are handled in parallel,
+        # see GeventXMLRPCServer
+        concurrent = self.getProperty("concurrent")
+        if concurrent:
+            max_concurrent_requests = self.getProperty("max_concurrent_requests")
+            if max_concurrent_requests is None:
+                max_concurrent_requests = 16
+            self._server = GeventXMLRPCServer((self.host, int(self.port)),
+                 max_concurrent_requests=int(max_concurrent_requests),
+                 logRequests = False, allow_none = True)
+        else:
+            self._server = SimpleXMLRPCServer((self.host, int(self.port)), logRequests = False, allow_none = True)
 
         msg = 'XML-RPC server listening on: %s:%s' % (self.host, self.port)
+        if concurrent:
+            msg += ' (concurrent requests)'
         logging.getLogger("HWR").info(msg)
 
         self._server.register_introspection_functions()
+        self._server.register_multicall_functions()
         self._server.register_function(self.start_queue)
         self._server.register_function(self.log_message)
         self._server.register_function(self.is_queue_executing)
@@ -102,6 +206,8 @@ class XMLRPCServer(HardwareObject):
         self._server.register_function(self.get_cp)
         self._server.register_function(self.save_current_pos)
         self._server.register_function(self.anneal) 
+        self._server.register_function(self.get_state_snapshot)
+        self._server.register_function(self.queue_get_timings)
 
         # Register functions from modules specified in <apis> element
         if self.hasObject("apis"):
@@ -276,6 +382,22 @@ class XMLRPCServer(HardwareObject):
     def queue_status(self):
         pass
 
+    def queue_get_timings(self, reset=False):
+        """
+        :param reset: Reset the statistics after reading them
+        :type reset: bool
+
+        :returns: Histograms of the time spent in each phase (pause_wait,
+                  pre_execute, execute, children, post_execute, total)
+                  per queue entry type, see QueueManager.get_timing_statistics
+        :rtype: dict
+        """
+        try:
+            return self.queue_hwobj.get_timing_statistics(reset)
+        except Exception as ex:
+            logging.getLogger('HWR').exception(str(ex))
+            raise
+
     def shape_history_get_grid(self):
         """
         :returns: The currently selected grid
@@ -298,10 +420,31 @@ class XMLRPCServer(HardwareObject):
         
         return grid_dict
 
-    def shape_history_set_grid_data(self, key, result_data):
+    def shape_history_set_grid_data(self, key, result_data, indexes=None):
+        """
+        Sets the results of the grid <key>.
+
+        :param result_data: {cell index: result} or, for large grids,
+                            the results encoded with encode_array
+                            (float64)
+        :type result_data: dict or Binary
+
+        :param indexes: cell indexes of the encoded results, encoded with
+                        encode_array(indexes, "i"). By default the results
+                        are the cells 0, 1, ...
+        :type indexes: Binary
+        """
         int_based_result = {}
-        for result in result_data.iteritems():
-            int_based_result[int(result[0])] = result[1]
+        if isinstance(result_data, Binary):
+            results = decode_array(result_data, "d")
+            if indexes is None:
+                indexes = range(len(results))
+            else:
+                indexes = decode_array(indexes, "i")
+            int_based_result = dict(zip(indexes, results))
+        else:
+            for result in result_data.iteritems():
+                int_based_result[int(result[0])] = result[1]
 
         self.shape_history_hwobj.set_grid_data(key, int_based_result)
         return True
@@ -361,11 +504,44 @@ class XMLRPCServer(HardwareObject):
             flux = 0
         return float(flux)
 
+    def get_state_snapshot(self):
+        """
+        :returns: the state polled by the clients in one call
+        :rtype: dict
+
+        Format of the returned dictionary:
+
+        {'time': float,
+         'diffractometer_positions': dict,
+         'queue_executing': bool,
+         'flux': float,
+         'cryo_temperature': float,
+         'aperture': str,
+         'errors': {key: message}}
+
+        Values that could not be read are None and the error is
+        given in 'errors'.
+        """
+        snapshot = {'time': time.time()}
+        errors = {}
+        for key, read_func in (('diffractometer_positions', self.get_diffractometer_positions),
+                               ('queue_executing', self.is_queue_executing),
+                               ('flux', self.flux),
+                               ('cryo_temperature', self.cryo_temperature),
+                               ('aperture', self.get_aperture)):
+            try:
+                snapshot[key] = read_func()
+            except Exception as ex:
+                snapshot[key] = None
+                errors[key] = str(ex)
+        snapshot['errors'] = errors
+        return snapshot
+
     def set_aperture(self,pos_name, timeout=20):
         self.diffractometer_hwobj.beam_info.aperture_hwobj.moveToPosition(pos_name)
         t0=time.time()
         while self.diffractometer_hwobj.beam_info.aperture_hwobj.getState() == 'MOVING':
-            time.sleep(0.1)
+            gevent.sleep(0.1)
             if time.time()-t0 > timeout:
                  raise RuntimeError("Timeout waiting for aperture to move")
         return True
@@ -424,3 +600,103 @@ class XMLRPCServer(HardwareObject):
                 except StopIteration:
                     pass
 
+
+
+def _load_test(concurrent, num_pollers=8, duration=3.0, move_time=0.5):
+    """
+    Load test with the mockup hardware objects: pollers call
+    get_diffractometer_positions, flux and is_queue_executing (or
+    get_state_snapshot) while a client moves the diffractometer (a move
+    of the mockup takes move_time).
+    """
+    if sys.version_info > (3, 0):
+        from xmlrpc.client import ServerProxy, MultiCall
+    else:
+        from xmlrpclib import ServerProxy, MultiCall
+    from DiffractometerMockup import DiffractometerMockup
+    from MultiCollectMockup import MultiCollectMockup
+    from QueueManager import QueueManager
+
+    diffractometer_hwobj = DiffractometerMockup("diffractometer")
+    diffractometer_hwobj.moveMotors = lambda roles_positions_dict: gevent.sleep(move_time)
+
+    class BeamlineSetup(object):
+        shape_history_hwobj = None
+        collect_hwobj = MultiCollectMockup("collect")
+
+    BeamlineSetup.diffractometer_hwobj = diffractometer_hwobj
+    roles = {"queue": QueueManager("queue"),
+             "queue_model": None,
+             "beamline_setup": BeamlineSetup()}
+    properties = {"concurrent": concurrent}
+
+    class LoadTestServer(XMLRPCServer):
+        def getObjectByRole(self, role):
+            return roles.get(role)
+
+        def hasObject(self, name):
+            return False
+
+        def getProperty(self, name):
+            return properties.get(name)
+
+    server = LoadTestServer("xmlrpc-server")
+    server.host = "localhost"
+    server.port = 0
+    server.open()
+    url = "http://localhost:%d" % server._server.server_address[1]
+
+    latencies = {"poll": [], "multicall": [], "snapshot": [], "move": []}
+    end_time = time.time() + duration
+
+    def call(kind, func):
+        while time.time() < end_time:
+            start_time = time.time()
+            func()
+            latencies[kind].append(time.time() - start_time)
+
+    def poll():
+        proxy = ServerProxy(url, allow_none=True)
+        proxy.get_diffractometer_positions()
+        proxy.flux()
+        proxy.is_queue_executing()
+
+    def multicall():
+        multi_call = MultiCall(ServerProxy(url, allow_none=True))
+        multi_call.get_diffractometer_positions()
+        multi_call.flux()
+        multi_call.is_queue_executing()
+        tuple(multi_call())
+
+    def snapshot():
+        ServerProxy(url, allow_none=True).get_state_snapshot()
+
+    def move():
+        ServerProxy(url, allow_none=True).move_diffractometer({"phi": 0})
+
+    clients = [gevent.spawn(call, "move", move)]
+    for index in range(num_pollers):
+        kind, func = (("poll", poll), ("multicall", multicall),
+                      ("snapshot", snapshot))[index % 3]
+        clients.append(gevent.spawn(call, kind, func))
+    gevent.joinall(clients, raise_error=True)
+    server.close()
+
+    print("%s server, %d pollers, move %.1f s:" % \
+          ("concurrent" if concurrent else "serial", num_pollers, move_time))
+    for kind in ("poll", "multicall", "snapshot", "move"):
+        values = sorted(latencies[kind])
+        if values:
+            print("  %-10s %6d calls  mean %7.1f ms  max %7.1f ms" % \
+                  (kind, len(values), 1000 * sum(values) / len(values),
+                   1000 * values[-1]))
+
+
+if __name__ == '__main__':
+    # The servers and clients of the load test run in greenlets
+    from gevent import monkey
+    monkey.patch_all(thread=False)
+    logging.basicConfig()
+
+    for concurrent in (False, True):
+        _load_test(concurrent)
@@ -0,0 +1,205 @@
+"""
+Post-processing of the XRF spectra (see AbstractXRFSpectrum).
+
+The MCA channels are calibrated with one numpy expression, the
+calibrated spectrum is formatted and written once and then hard-linked
+(or copied) to the second location. The PNG plot is rendered with the
+matplotlib Agg backend in a worker thread of the gevent threadpool, so
+the gevent loop keeps running.
+
+Example:
+    spectrum = XRFSpectrumProcessing.calibrate_spectrum(data, mca_calib)
+    XRFSpectrumProcessing.write_spectrum(spectrum, raw_file, archive_file)
+    XRFSpectrumProcessing.render_spectrum_png(spectrum, png_file, title)
+
+Run the module to compare it with the channel by channel processing:
+    python XRFSpectrumProcessing.py [num_channels]
+"""
+
+import os
+import sys
+import time
+import shutil
+
+import numpy
+import gevent
+
+
+# Channels with a higher energy (keV) are not used
+MAX_ENERGY = 13
+
+
+class CalibratedSpectrum(object):
+    """
+    Descript. : channels, calibrated energies (keV) and counts of the MCA
+                channels below max_energy
+    """
+    def __init__(self, channels, energies, values):
+        self.channels = channels
+        self.energies = energies
+        self.values = values
+
+    def get_mca_data(self):
+        """
+        Descript. : (channel / 1000, count) list sent with xrfSpectrumFinished
+        """
+        return zip((self.channels / 1000.0).tolist(), self.values.tolist())
+
+    def get_mca_range(self):
+        """
+        Descript. : "min" and "max" of the mca_config sent with
+                    xrfSpectrumFinished, computed as before: the count of
+                    the last channel whose energy was above the previous
+                    max (resp. below the previous min)
+        """
+        xmin = 0
+        xmax = 0
+        for energy, value in zip(self.energies.tolist(), self.values.tolist()):
+            if energy > xmax:
+                xmax = value
+            if energy < xmin:
+                xmin = value
+        return xmin, xmax
+
+
+def calibrate_spectrum(spectrum_data, mca_calib, max_energy=MAX_ENERGY):
+    """
+    Descript. : energy (keV) of channel n is
+                (mca_calib[2] + mca_calib[1] * n + mca_calib[0] * n * n) / 1000
+    Return    : CalibratedSpectrum
+    """
+    values = numpy.asarray(spectrum_data)
+    channels = numpy.arange(len(values))
+    energies = (float(mca_calib[2]) + float(mca_calib[1]) * channels + \
+                float(mca_calib[0]) * channels * channels) / 1000
+    mask = energies < max_energy
+    return CalibratedSpectrum(channels[mask], energies[mask], values[mask])
+
+
+def format_spectrum(spectrum):
+    """
+    Descript. : "energy,count" lines (\\r\\n separated) formatted in one call
+    """
+    rows = numpy.empty((len(spectrum.energies), 2))
+    rows[:, 0] = spectrum.energies
+    rows[:, 1] = spectrum.values
+    return ("%f,%f\r\n" * len(rows)) % tuple(rows.ravel().tolist())
+
+
+def write_spectrum(spectrum, file_name, *link_names):
+    """
+    Descript. : writes the spectrum file once. The other files are hard
+                links to it, or copies if a link cannot be created (e.g.
+                other file system)
+    """
+    spectrum_file = open(file_name, "w")
+    try:
+        spectrum_file.write(format_spectrum(spectrum))
+    finally:
+        spectrum_file.close()
+
+    for link_name in link_names:
+        if os.path.abspath(link_name) == os.path.abspath(file_name):
+            continue
+        if os.path.lexists(link_name):
+            os.remove(link_name)
+        try:
+            os.link(file_name, link_name)
+        except (OSError, AttributeError):
+            shutil.copyfile(file_name, link_name)
+
+
+def _render_png(energies, values, file_name, title, figsize, dpi):
+    # Figure and canvas are used without pyplot, so they can be
+    # created in a worker thread
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    fig = Figure(figsize=figsize)
+    ax = fig.add_subplot(111)
+    ax.set_title(title)
+    ax.grid(True)
+    ax.plot(energies, values, color="black")
+    ax.set_xlabel("Energy")
+    ax.set_ylabel("Counts")
+    canvas = FigureCanvasAgg(fig)
+    canvas.print_figure(file_name, dpi=dpi)
+
+
+def render_spectrum_png(spectrum, file_name, title, figsize=(15, 11), dpi=80):
+    """
+    Descript. : renders the spectrum plot in a worker thread, returns
+                when the file has been written
+    """
+    gevent.get_hub().threadpool.apply(_render_png,
+         (spectrum.energies, spectrum.values, file_name, title, figsize, dpi))
+
+
+def _process_channel_by_channel(spectrum_data, mca_calib, file_names):
+    # Previous implementation of AbstractXRFSpectrum, for the benchmark
+    mca_data = []
+    calibrated_data = []
+    files = [open(file_name, "w") for file_name in file_names]
+    for n, value in enumerate(spectrum_data):
+        energy = (mca_calib[2] + mca_calib[1] * n + mca_calib[0] * n * n) / 1000
+        if energy < MAX_ENERGY:
+            calibrated_data.append([energy, value])
+            mca_data.append((n / 1000.0, value))
+            for spectrum_file in files:
+                spectrum_file.write("%f,%f\r\n" % (energy, value))
+    for spectrum_file in files:
+        spectrum_file.close()
+    return numpy.array(calibrated_data), mca_data
+
+
+def _count_loop_ticks(ticks):
+    while True:
+        gevent.sleep(0.01)
+        ticks.append(time.time())
+
+
+def _time_call(func, *args):
+    start_time = time.time()
+    result = func(*args)
+    return result, time.time() - start_time
+
+
+if __name__ == '__main__':
+    import tempfile
+
+    channel_nums = [int(arg) for arg in sys.argv[1:]] or [4096, 16384]
+    directory = tempfile.mkdtemp()
+    old_files = [os.path.join(directory, name) for name in ("old.dat", "old_archive.dat")]
+    new_files = [os.path.join(directory, name) for name in ("new.dat", "new_archive.dat")]
+
+    for num_channels in channel_nums:
+        spectrum_data = numpy.random.poisson(100, num_channels).tolist()
+        # 13 keV at the last channel
+        mca_calib = (1e-6, 13e3 / num_channels - 1e-6 * num_channels, 5.0)
+
+        (old_array, old_mca_data), old_time = _time_call(\
+             _process_channel_by_channel, spectrum_data, mca_calib, old_files)
+
+        start_time = time.time()
+        spectrum = calibrate_spectrum(spectrum_data, mca_calib)
+        write_spectrum(spectrum, *new_files)
+        new_mca_data = spectrum.get_mca_data()
+        new_time = time.time() - start_time
+
+        identical = new_mca_data == old_mca_data and \
+                    open(old_files[0]).read() == open(new_files[0]).read() and \
+                    open(old_files[1]).read() == open(new_files[1]).read()
+        print("%6d channels  calibrate and write: loop %7.1f ms  numpy %7.1f ms  (x%.1f)  %s" % \
+              (num_channels, 1000 * old_time, 1000 * new_time,
+               old_time / max(new_time, 1e-9),
+               "identical" if identical else "DIFFERENT"))
+
+        png_file = os.path.join(directory, "spectrum.png")
+        ticks = []
+        ticker = gevent.spawn(_count_loop_ticks, ticks)
+        _, png_time = _time_call(render_spectrum_png, spectrum, png_file, png_file)
+        ticker.kill()
+        print("%6d channels  PNG rendering %7.1f ms, gevent loop ran %d times meanwhile" % \
+              (num_channels, 1000 * png_time, len(ticks)))
+
+    shutil.rmtree(directory)
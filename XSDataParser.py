@@ -0,0 +1,267 @@
+"""
+ElementTree based loader for the EDNA XSData documents.
+
+The generated XSData modules parse documents with xml.dom.minidom and
+fill the object graph with the build methods of each class. This module
+parses the document with (c)ElementTree and passes light weight, minidom
+compatible views of the elements to the same build methods, so the
+resulting objects are identical to the ones returned by parseFile and
+parseString:
+
+    from XSDataMXCuBEv1_3 import XSDataResultMXCuBE
+    result = XSDataParser.parse_file(XSDataResultMXCuBE, file_path)
+
+For the per image Dozor records no XSData objects are needed,
+parse_dozor_images extracts them directly to a numpy array with iterparse.
+
+Run the module to compare it with minidom:
+    python XSDataParser.py [num_images] [XSData result files]
+"""
+
+import sys
+import time
+
+from xml.dom import Node
+
+try:
+    import xml.etree.cElementTree as ElementTree
+except ImportError:
+    import xml.etree.ElementTree as ElementTree
+
+import numpy
+
+
+DOZOR_IMAGE_TAG = "imageDozor"
+DOZOR_IMAGE_FIELDS = ("number", "spots_num_of", "spots_int_aver",
+                      "spots_resolution", "score")
+
+
+def local_name(tag):
+    """
+    Descript. : removes namespace from the ElementTree tag ({uri}name)
+    """
+    if tag[0] == "{":
+        return tag[tag.index("}") + 1:]
+    return tag
+
+
+class TextNode(object):
+    """
+    Descript. : text node with the minidom attributes used by the
+                build methods
+    """
+    __slots__ = ("nodeValue", )
+    nodeType = Node.TEXT_NODE
+    nodeName = "#text"
+    childNodes = ()
+    firstChild = None
+
+    def __init__(self, value):
+        self.nodeValue = value
+
+    def toxml(self):
+        return self.nodeValue
+
+
+class ElementNode(object):
+    """
+    Descript. : view of an ElementTree element with the minidom
+                attributes used by the build methods. Child nodes are
+                created only when they are accessed
+    """
+    __slots__ = ("element", "nodeName", "__child_nodes")
+    nodeType = Node.ELEMENT_NODE
+    nodeValue = None
+
+    def __init__(self, element):
+        self.element = element
+        self.nodeName = local_name(element.tag)
+        self.__child_nodes = None
+
+    @property
+    def childNodes(self):
+        if self.__child_nodes is None:
+            child_nodes = []
+            if self.element.text:
+                child_nodes.append(TextNode(self.element.text))
+            for child in self.element:
+                child_nodes.append(ElementNode(child))
+                if child.tail:
+                    child_nodes.append(TextNode(child.tail))
+            self.__child_nodes = child_nodes
+        return self.__child_nodes
+
+    @property
+    def firstChild(self):
+        child_nodes = self.childNodes
+        if child_nodes:
+            return child_nodes[0]
+
+    def toxml(self):
+        return ElementTree.tostring(self.element)
+
+
+def build(xsdata_class, root_element):
+    """
+    Descript. : creates xsdata_class object and fills it from the element
+    """
+    root_obj = xsdata_class()
+    root_obj.build(ElementNode(root_element))
+    return root_obj
+
+
+def parse_file(xsdata_class, file_path):
+    """
+    Descript. : ElementTree version of xsdata_class.parseFile
+    Args.     : xsdata_class (XSData class of the root element),
+                file_path (str or file object)
+    Return    : xsdata_class object
+    """
+    return build(xsdata_class, ElementTree.parse(file_path).getroot())
+
+
+def parse_string(xsdata_class, xml_string):
+    """
+    Descript. : ElementTree version of xsdata_class.parseString
+    """
+    if isinstance(xml_string, unicode):
+        xml_string = xml_string.encode("utf-8")
+    return build(xsdata_class, ElementTree.fromstring(xml_string))
+
+
+def parse_dozor_images(file_path, fields=DOZOR_IMAGE_FIELDS, default=0.0):
+    """
+    Descript. : reads the imageDozor records of a XSDataResultControlDozor
+                document without building XSData objects. Elements are
+                released after each record, so memory does not grow with
+                the document size
+    Args.     : file_path (str or file object), fields (names of the
+                imageDozor children), default (value of missing fields)
+    Return    : numpy array with one row per image and one column per field
+    """
+    field_index = dict((field, index) for index, field in enumerate(fields))
+    records = []
+    root = None
+    for event, element in ElementTree.iterparse(file_path,
+                                                events=("start", "end")):
+        if root is None:
+            root = element
+        if event != "end" or local_name(element.tag) != DOZOR_IMAGE_TAG:
+            continue
+
+        record = [default] * len(fields)
+        for child in element:
+            index = field_index.get(local_name(child.tag))
+            if index is not None:
+                value = child.findtext("value")
+                if value is None:
+                    # Namespaced document
+                    for value_element in child:
+                        if local_name(value_element.tag) == "value":
+                            value = value_element.text
+                            break
+                if value:
+                    record[index] = float(value)
+        records.append(record)
+        root.clear()
+
+    return numpy.array(records, dtype=float).reshape(len(records), len(fields))
+
+
+def _create_dozor_result(num_images):
+    from XSDataCommon import XSDataDouble, XSDataInteger
+    from XSDataControlDozorv1_1 import XSDataControlImageDozor, \
+         XSDataResultControlDozor
+
+    dozor_result = XSDataResultControlDozor()
+    for index in range(num_images):
+        dozor_result.addImageDozor(XSDataControlImageDozor(\
+             number=XSDataInteger(index + 1),
+             spots_num_of=XSDataInteger(index % 50),
+             spots_int_aver=XSDataDouble(index * 0.5),
+             spots_resolution=XSDataDouble(2 + index % 7 * 0.25),
+             score=XSDataDouble(index % 97 * 0.125),
+             powder_wilson_scale=XSDataDouble(1.5),
+             powder_wilson_bfactor=XSDataDouble(20.0),
+             powder_wilson_resolution=XSDataDouble(3.0),
+             powder_wilson_correlation=XSDataDouble(0.9),
+             powder_wilson_rfactor=XSDataDouble(0.1)))
+    return dozor_result
+
+
+def _get_xsdata_class(file_path):
+    import XSDataCommon
+    import XSDataMXv1
+    import XSDataMXCuBEv1_3
+    import XSDataControlDozorv1_1
+    import XSDataAutoprocv1_0
+
+    root_tag = local_name(ElementTree.parse(file_path).getroot().tag)
+    for module in (XSDataMXCuBEv1_3, XSDataControlDozorv1_1, XSDataMXv1,
+                   XSDataAutoprocv1_0, XSDataCommon):
+        if hasattr(module, root_tag):
+            return getattr(module, root_tag)
+
+
+def _time_call(func, *args):
+    start_time = time.time()
+    result = func(*args)
+    return result, time.time() - start_time
+
+
+def _compare(label, xsdata_class, file_path):
+    minidom_obj, minidom_time = _time_call(xsdata_class.parseFile, file_path)
+    etree_obj, etree_time = _time_call(parse_file, xsdata_class, file_path)
+    print("%-32s minidom %8.3f s  ElementTree %8.3f s  (x%.1f)  %s" % \
+          (label, minidom_time, etree_time, minidom_time / max(etree_time, 1e-9),
+           "identical" if minidom_obj.marshal() == etree_obj.marshal() \
+           else "DIFFERENT"))
+
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+    from XSDataControlDozorv1_1 import XSDataResultControlDozor
+
+    image_nums = []
+    result_files = []
+    for arg in sys.argv[1:]:
+        if arg.isdigit():
+            image_nums.append(int(arg))
+        else:
+            result_files.append(arg)
+    if not image_nums:
+        image_nums = [1000, 10000]
+
+    for num_images in image_nums:
+        dozor_file = tempfile.NamedTemporaryFile(suffix=".xml", delete=False)
+        dozor_file.close()
+        _create_dozor_result(num_images).exportToFile(dozor_file.name)
+
+        _compare("Dozor %d images (objects)" % num_images,
+                 XSDataResultControlDozor, dozor_file.name)
+
+        start_time = time.time()
+        dozor_obj = XSDataResultControlDozor.parseFile(dozor_file.name)
+        minidom_arr = numpy.array([(image.getNumber().getValue(),
+                                    image.getSpots_num_of().getValue(),
+                                    image.getSpots_int_aver().getValue(),
+                                    image.getSpots_resolution().getValue(),
+                                    image.getScore().getValue()) \
+                                   for image in dozor_obj.getImageDozor()],
+                                  dtype=float)
+        minidom_time = time.time() - start_time
+        numpy_arr, numpy_time = _time_call(parse_dozor_images, dozor_file.name)
+        print("%-32s minidom %8.3f s  iterparse   %8.3f s  (x%.1f)  %s" % \
+              ("Dozor %d images (numpy)" % num_images, minidom_time, numpy_time,
+               minidom_time / max(numpy_time, 1e-9),
+               "identical" if numpy.array_equal(minidom_arr, numpy_arr) \
+               else "DIFFERENT"))
+        os.remove(dozor_file.name)
+
+    for result_file in result_files:
+        xsdata_class = _get_xsdata_class(result_file)
+        if xsdata_class is None:
+            print("%s: unknown XSData root element" % result_file)
+        else:
+            _compare(os.path.basename(result_file), xsdata_class, result_file)
@@ -0,0 +1,111 @@
+"""
+Helpers shared by the Lima detectors (LimaPilatus, LimaEiger).
+
+- CBFHeaderTemplate: mini CBF headers of all the images of an acquisition
+  for the Lima SetImageHeader command. The static header lines of each
+  image are rendered once, the date line is written at each call.
+- RemoteDirectoryCache: creates the saving directories on the detector
+  control computer. Directories already created are remembered and the
+  ssh commands go through one persistent (ControlMaster) connection.
+"""
+
+import os
+import time
+import socket
+import logging
+import tempfile
+import subprocess
+
+
+class CBFHeaderTemplate(object):
+    """
+    Descript. : header lines in the order of the header dictionary, the
+                value of image_key (start angle) is given for each image
+    """
+    def __init__(self, serial, sensor, header, image_key="Start_angle"):
+        """
+        Descript. : serial (detector serial line), sensor (sensor
+                    description line), header (dict key: value)
+        """
+        self.serial = serial
+        body = "# Pixel_size 172e-6 m x 172e-6 m\n# %s\n" % sensor
+        for key, value in header.iteritems():
+            if key == image_key:
+                body += "# %s \0\n" % key
+            else:
+                body += "# %s %s\n" % (key, value)
+        if "\0" not in body:
+            body += "# %s \0\n" % image_key
+        # Only the start angle is a format field
+        self.body_format = body.replace("%", "%%").replace("\0", "%s")
+        # Header lines after the date, for the last start angles
+        self.start_angles = None
+        self.bodies = []
+
+    def get_headers(self, start_angles, date=None):
+        """
+        Descript. : SetImageHeader argument for the start angles (strings)
+                    of the images, date is the current time by default
+        Return    : list of "index : array_data/header_contents|header;"
+        """
+        if date is None:
+            date = time.strftime("%Y/%b/%d %T")
+        start_angles = tuple(start_angles)
+        if start_angles != self.start_angles:
+            self.bodies = [self.body_format % start_angle + ";" for \
+                           start_angle in start_angles]
+            self.start_angles = start_angles
+        start = "|\n%s\n# %s\n" % (self.serial, date)
+        return ["%d : array_data/header_contents" % index + start + body \
+                for index, body in enumerate(self.bodies)]
+
+
+class RemoteDirectoryCache(object):
+    """
+    Descript. : creates directories (mkdir --parents) on the control
+                computer once. If host is the local computer (or None) the
+                directories are created with os.makedirs
+    """
+    def __init__(self, host, user=None, control_persist=600):
+        self.host = host
+        self.user = user or os.environ.get("USER")
+        self.control_persist = control_persist
+        self.created = set()
+        self.is_local = host in (None, "", "localhost", socket.gethostname())
+        self.control_path = os.path.join(tempfile.gettempdir(),
+                                          "lima_ssh_%r@%h:%p")
+
+    def clear(self):
+        """
+        Descript. : forgets the directories created, e.g. at the start of
+                    a collection, in case they were removed in between
+        """
+        self.created.clear()
+
+    def makedirs(self, directory):
+        directory = os.path.normpath(directory)
+        if directory in self.created:
+            return
+
+        if self.is_local:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+        else:
+            # The first command opens the master connection, it stays open
+            # control_persist seconds after the last command
+            returncode = subprocess.Popen(["ssh",
+                 "-o", "ControlMaster=auto",
+                 "-o", "ControlPath=%s" % self.control_path,
+                 "-o", "ControlPersist=%d" % self.control_persist,
+                 "%s@%s" % (self.user, self.host),
+                 "mkdir", "--parents", directory],
+                 stdin=None, stdout=None, stderr=None, close_fds=True).wait()
+            if returncode != 0:
+                logging.getLogger("HWR").warning("Could not create %s on %s" % \
+                                                 (directory, self.host))
+                return
+
+        while directory not in self.created and \
+              directory != os.path.dirname(directory):
+            self.created.add(directory)
+            directory = os.path.dirname(directory)
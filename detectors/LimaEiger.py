@@ -4,6 +4,7 @@ import subprocess
 import os
 import math
 from HardwareRepository.TaskUtils import task, cleanup, error_cleanup
+from detectors.LimaCommon import CBFHeaderTemplate, RemoteDirectoryCache
 import logging
 
 class Eiger:
@@ -12,6 +13,8 @@ class Eiger:
       self.config = config
       self.collect_obj = collect_obj
       self.header = dict()
+      self.header_template = None
+      self.remote_directories = RemoteDirectoryCache(config.getProperty("control"))
 
       lima_device = config.getProperty("lima_device")
       eiger_device = config.getProperty("eiger_device")
@@ -64,9 +67,7 @@ class Eiger:
   @task
   def prepare_acquisition(self, take_dark, start, osc_range, exptime, npass, number_of_images, comment, energy, still):
       diffractometer_positions = self.collect_obj.bl_control.diffractometer.getPositions()
-      self.start_angles = list()
-      for i in range(number_of_images):
-        self.start_angles.append("%0.4f deg." % (start+osc_range*i))
+      self.start_angles = ["%0.4f deg." % (start+osc_range*i) for i in range(number_of_images)]
       self.header["file_comments"]=comment
       self.header["N_oscillations"]=number_of_images
       self.header["Oscillation_axis"]="omega"
@@ -98,6 +99,10 @@ class Eiger:
       self.header["Tau"]="= 0 s"
       self.header["Exposure_period"]="%f s" % (exptime+self.get_deadtime())
       self.header["Exposure_time"]="%f s" % exptime
+      self.header["Start_angle"]=self.start_angles[0] if self.start_angles else ""
+      self.header_template = CBFHeaderTemplate(self.config.getProperty("serial"),
+                                               "Silicon sensor, thickness 0.000320 m", self.header)
+      self.remote_directories.clear()
 
       self.stop()
       self.wait_ready()
@@ -137,14 +142,7 @@ class Eiger:
         dirname = dirname[len(os.path.sep):]
      
       saving_directory = os.path.join(self.config.getProperty("buffer"), dirname)
-      """
-      subprocess.Popen("ssh %s@%s mkdir --parents %s" % (os.environ["USER"],
-                                                         self.config.getProperty("control"),
-                                                         saving_directory),
-                                                         shell=True, stdin=None, 
-                                                         stdout=None, stderr=None, 
-                                                         close_fds=True).wait()
-      """
+      #self.remote_directories.makedirs(saving_directory)
       self.wait_ready()  
    
       self.getChannelObject("saving_directory").setValue(saving_directory) 
@@ -155,17 +153,9 @@ class Eiger:
       self.getChannelObject("saving_format").setValue("HDF5")
       self.getChannelObject("saving_header_delimiter").setValue(["|", ";", ":"])
 
-      headers = list()
-      for i, start_angle in enumerate(self.start_angles):
-          header = "\n%s\n" % self.config.getProperty("serial")
-          header += "# %s\n" % time.strftime("%Y/%b/%d %T")
-          header += "# Pixel_size 172e-6 m x 172e-6 m\n"
-          header += "# Silicon sensor, thickness 0.000320 m\n"  
-          self.header["Start_angle"]=start_angle
-          for key, value in self.header.iteritems():
-              header += "# %s %s\n" % (key, value)
-          headers.append("%d : array_data/header_contents|%s;" % (i, header))    
-      
+      # Date of the frames, the rest of the headers is rendered once
+      headers = self.header_template.get_headers(self.start_angles)
+
       #self.getCommandObject("set_image_header")(headers)
 
   @task 
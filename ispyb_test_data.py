@@ -0,0 +1,123 @@
+"""
+Subset of the ISPyB ToolsForCollectionWebService WSDL (value objects of
+the workflows, grid info and images, storeOrUpdateImage operation).
+Used by the ISPyBClient2 benchmark when no WSDL url is given.
+"""
+
+ISPYB_COLLECTION_WSDL = """<?xml version="1.0" encoding="UTF-8"?>
+<definitions name="ToolsForCollectionWebServiceService"
+             targetNamespace="http://ispyb.ejb3.webservices.collection/"
+             xmlns="http://schemas.xmlsoap.org/wsdl/"
+             xmlns:soap="http://schemas.xmlsoap.org/wsdl/soap/"
+             xmlns:tns="http://ispyb.ejb3.webservices.collection/"
+             xmlns:xs="http://www.w3.org/2001/XMLSchema">
+  <types>
+    <xs:schema targetNamespace="http://ispyb.ejb3.webservices.collection/"
+               version="1.0">
+      <xs:element name="storeOrUpdateImage" type="tns:storeOrUpdateImage"/>
+      <xs:element name="storeOrUpdateImageResponse"
+                  type="tns:storeOrUpdateImageResponse"/>
+      <xs:complexType name="storeOrUpdateImage">
+        <xs:sequence>
+          <xs:element minOccurs="0" name="arg0" type="tns:imageWS3VO"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="storeOrUpdateImageResponse">
+        <xs:sequence>
+          <xs:element minOccurs="0" name="return" type="xs:int"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="imageWS3VO">
+        <xs:sequence>
+          <xs:element minOccurs="0" name="comments" type="xs:string"/>
+          <xs:element minOccurs="0" name="cumulativeIntensity" type="xs:double"/>
+          <xs:element minOccurs="0" name="dataCollectionId" type="xs:int"/>
+          <xs:element minOccurs="0" name="fileLocation" type="xs:string"/>
+          <xs:element minOccurs="0" name="fileName" type="xs:string"/>
+          <xs:element minOccurs="0" name="imageId" type="xs:int"/>
+          <xs:element minOccurs="0" name="imageNumber" type="xs:int"/>
+          <xs:element minOccurs="0" name="jpegFileFullPath" type="xs:string"/>
+          <xs:element minOccurs="0" name="jpegThumbnailFileFullPath" type="xs:string"/>
+          <xs:element minOccurs="0" name="machineMessage" type="xs:string"/>
+          <xs:element minOccurs="0" name="measuredIntensity" type="xs:float"/>
+          <xs:element minOccurs="0" name="synchrotronCurrent" type="xs:float"/>
+          <xs:element minOccurs="0" name="temperature" type="xs:float"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="workflow3VO">
+        <xs:sequence>
+          <xs:element minOccurs="0" name="comments" type="xs:string"/>
+          <xs:element minOccurs="0" name="logFilePath" type="xs:string"/>
+          <xs:element minOccurs="0" name="recordTimeStamp" type="xs:dateTime"/>
+          <xs:element minOccurs="0" name="resultFilePath" type="xs:string"/>
+          <xs:element minOccurs="0" name="status" type="xs:string"/>
+          <xs:element minOccurs="0" name="workflowId" type="xs:int"/>
+          <xs:element minOccurs="0" name="workflowTitle" type="xs:string"/>
+          <xs:element minOccurs="0" name="workflowType" type="xs:string"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="workflowMeshWS3VO">
+        <xs:sequence>
+          <xs:element minOccurs="0" name="bestImageId" type="xs:int"/>
+          <xs:element minOccurs="0" name="bestPositionId" type="xs:int"/>
+          <xs:element minOccurs="0" name="cartographyPath" type="xs:string"/>
+          <xs:element minOccurs="0" name="recordTimeStamp" type="xs:dateTime"/>
+          <xs:element minOccurs="0" name="value1" type="xs:double"/>
+          <xs:element minOccurs="0" name="value2" type="xs:double"/>
+          <xs:element minOccurs="0" name="value3" type="xs:double"/>
+          <xs:element minOccurs="0" name="value4" type="xs:double"/>
+          <xs:element minOccurs="0" name="workflowId" type="xs:int"/>
+          <xs:element minOccurs="0" name="workflowMeshId" type="xs:int"/>
+        </xs:sequence>
+      </xs:complexType>
+      <xs:complexType name="gridInfoWS3VO">
+        <xs:sequence>
+          <xs:element minOccurs="0" name="dx_mm" type="xs:double"/>
+          <xs:element minOccurs="0" name="dy_mm" type="xs:double"/>
+          <xs:element minOccurs="0" name="gridInfoId" type="xs:int"/>
+          <xs:element minOccurs="0" name="meshAngle" type="xs:double"/>
+          <xs:element minOccurs="0" name="recordTimeStamp" type="xs:dateTime"/>
+          <xs:element minOccurs="0" name="steps_x" type="xs:double"/>
+          <xs:element minOccurs="0" name="steps_y" type="xs:double"/>
+          <xs:element minOccurs="0" name="workflowMeshId" type="xs:int"/>
+          <xs:element minOccurs="0" name="xOffset" type="xs:double"/>
+          <xs:element minOccurs="0" name="yOffset" type="xs:double"/>
+        </xs:sequence>
+      </xs:complexType>
+    </xs:schema>
+  </types>
+  <message name="ToolsForCollectionWebService_storeOrUpdateImage">
+    <part element="tns:storeOrUpdateImage" name="storeOrUpdateImage"/>
+  </message>
+  <message name="ToolsForCollectionWebService_storeOrUpdateImageResponse">
+    <part element="tns:storeOrUpdateImageResponse"
+          name="storeOrUpdateImageResponse"/>
+  </message>
+  <portType name="ToolsForCollectionWebService">
+    <operation name="storeOrUpdateImage" parameterOrder="storeOrUpdateImage">
+      <input message="tns:ToolsForCollectionWebService_storeOrUpdateImage"/>
+      <output message="tns:ToolsForCollectionWebService_storeOrUpdateImageResponse"/>
+    </operation>
+  </portType>
+  <binding name="ToolsForCollectionWebServiceBinding"
+           type="tns:ToolsForCollectionWebService">
+    <soap:binding style="document"
+                  transport="http://schemas.xmlsoap.org/soap/http"/>
+    <operation name="storeOrUpdateImage">
+      <soap:operation soapAction=""/>
+      <input>
+        <soap:body use="literal"/>
+      </input>
+      <output>
+        <soap:body use="literal"/>
+      </output>
+    </operation>
+  </binding>
+  <service name="ToolsForCollectionWebServiceService">
+    <port binding="tns:ToolsForCollectionWebServiceBinding"
+          name="ToolsForCollectionWebServicePort">
+      <soap:address location="http://localhost:8080/ispyb/ispyb-ejb3/ispybWS/ToolsForCollectionWebService"/>
+    </port>
+  </service>
+</definitions>
+"""
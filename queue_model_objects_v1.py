@@ -5,14 +5,195 @@ the QueueModel.
 """
 import copy
 import os
+import bisect
 import logging
+import weakref
 import queue_model_enumerables_v1 as queue_model_enumerables
 
-class TaskNode(object):
+
+# Values of these types are shared between a node and its clone
+IMMUTABLE_TYPES = (type(None), bool, int, long, float, complex,
+                   str, unicode, frozenset)
+
+# Attributes holding images (QImage), copied with their copy method
+IMAGE_ATTRIBUTES = ("snapshot_image", )
+
+
+def clone_parameters(value):
+    """
+    Copy of a parameter object (Crystal, PathTemplate, ...), see
+    TaskNode.clone.
+    """
+    return _clone_value(value, {})
+
+
+def _clone_value(value, memo):
+    """
+    Copies value for TaskNode.clone. The objects of this module are
+    copied attribute by attribute, lists, dicts and tuples item by item
+    and other mutable objects with copy.deepcopy. memo maps the id of
+    the objects already copied to their copy.
+    """
+    if isinstance(value, IMMUTABLE_TYPES):
+        return value
+
+    if id(value) in memo:
+        return memo[id(value)]
+
+    if isinstance(value, TaskNode):
+        return value._clone(memo)
+
+    value_type = type(value)
+    if value_type is list:
+        clone = []
+        memo[id(value)] = clone
+        clone.extend([_clone_value(item, memo) for item in value])
+    elif value_type is dict:
+        clone = {}
+        memo[id(value)] = clone
+        for key, item in value.iteritems():
+            clone[key] = _clone_value(item, memo)
+    elif value_type is tuple:
+        clone = tuple([_clone_value(item, memo) for item in value])
+    elif getattr(value.__class__, '__module__', None) == __name__ and \
+         (isinstance(value, SlottedObject) or hasattr(value, '__dict__')):
+        clone = _clone_attributes(value, copy.copy(value), memo)
+    else:
+        clone = copy.deepcopy(value, memo)
+
+    return clone
+
+
+def _clone_attributes(value, clone, memo, skip=()):
+    # clone is a shallow copy of value, only the attributes that
+    # are not immutable (or in skip) are copied
+    memo[id(value)] = clone
+    for name, attribute in _get_attributes(value).iteritems():
+        if isinstance(attribute, IMMUTABLE_TYPES) or name in skip:
+            continue
+        if name in IMAGE_ATTRIBUTES and hasattr(attribute, 'copy'):
+            _set_attribute(clone, name, attribute.copy())
+        else:
+            _set_attribute(clone, name, _clone_value(attribute, memo))
+    return clone
+
+
+_slot_names = {}
+
+
+def _get_slot_names(cls):
+    # Names of the __slots__ of cls and of its base classes
+    names = _slot_names.get(cls)
+    if names is None:
+        names = frozenset(name for base in getattr(cls, '__mro__', (cls, )) \
+                          for name in base.__dict__.get('__slots__', ()) \
+                          if name not in ('__dict__', '__weakref__'))
+        _slot_names[cls] = names
+    return names
+
+
+def _get_attributes(obj):
+    if isinstance(obj, SlottedObject):
+        return obj.__getstate__()
+    return obj.__dict__
+
+
+def _set_attribute(obj, name, value):
+    # Sets the attribute without calling the __setattr__ of the class
+    # (PathTemplate change listeners)
+    if name in _get_slot_names(obj.__class__):
+        object.__setattr__(obj, name, value)
+    elif hasattr(obj, '__dict__'):
+        obj.__dict__[name] = value
+    else:
+        setattr(obj, name, value)
+
+
+def _watch_path_template_attribute(cls, name):
+    # Replaces the attribute name of cls (slot or instance attribute),
+    # which holds the path template of the object or an object holding
+    # it, by a property. When the attribute is set, the listeners of the
+    # path template replaced are notified, so the path template index
+    # reads the path template of the node again. Only the assignments of
+    # this attribute go through python code.
+    slot = cls.__dict__.get(name)
+    if slot is not None:
+        get_value = slot.__get__
+        set_value = slot.__set__
+    else:
+        def get_value(obj):
+            try:
+                return obj.__dict__[name]
+            except KeyError:
+                raise AttributeError(name)
+
+        def set_value(obj, value):
+            obj.__dict__[name] = value
+
+    def set_watched_value(obj, value):
+        path_template = None
+        try:
+            if isinstance(obj, TaskNode):
+                path_template = obj.get_path_template()
+            else:
+                path_template = obj.path_template
+        except (AttributeError, IndexError, TypeError):
+            # Attribute not set yet
+            pass
+        set_value(obj, value)
+        if isinstance(path_template, PathTemplate):
+            path_template._notify_change_listeners()
+
+    setattr(cls, name, property(get_value, set_watched_value))
+
+
+class SlottedObject(object):
+    """
+    Base class of the objects with __slots__ (TaskNode, Acquisition,
+    PathTemplate, AcquisitionParameters, CentredPosition). Thousands of
+    them are created for an unattended queue, the slots take a fraction
+    of the memory of an attribute dictionary.
+
+    The state used by pickle, jsonpickle ("py/state") and copy is the
+    dictionary of the attributes, so objects pickled before the
+    attributes were slots can still be loaded.
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = {}
+        for name in _get_slot_names(self.__class__):
+            try:
+                state[name] = object.__getattribute__(self, name)
+            except AttributeError:
+                # Slot not set
+                pass
+
+        instance_dict = getattr(self, '__dict__', None)
+        if instance_dict:
+            state.update(instance_dict)
+        elif instance_dict is not None:
+            # Reading __dict__ creates it, the object had none
+            del self.__dict__
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.iteritems():
+            if name in _get_slot_names(self.__class__) or \
+               hasattr(self, '__dict__'):
+                _set_attribute(self, name, value)
+            # Other attributes have been removed from the class
+
+
+class TaskNode(SlottedObject):
     """
     Objects that inherit TaskNode can be added to and handled by
     the QueueModel object.
     """
+    # __dict__: other attributes can be added to the nodes
+    __slots__ = ("_children", "_name", "_number", "_executed", "_parent",
+                 "_names", "_enabled", "_node_id", "_requires_centring",
+                 "__dict__", "__weakref__")
 
     def __init__(self):
         object.__init__(self)
@@ -22,11 +203,39 @@ class TaskNode(object):
         self._number = 0
         self._executed = False
         self._parent = None
-        self._names = {}
+        # Created when the first child is named (_get_names)
+        self._names = None
         self._enabled = True
         self._node_id = None
         self._requires_centring = True
 
+    def _add_child(self, child):
+        """
+        Attaches child to this node and adds the path templates of child
+        (and of its children) to the path template index of the model.
+        Nodes are attached with QueueModel.add_child.
+        """
+        child._parent = self
+        self._children.append(child)
+        child._set_name(child._name)
+        path_template_index = self._get_path_template_index()
+        if path_template_index is not None:
+            path_template_index.add_node(child)
+
+    def _remove_child(self, child):
+        """
+        Detaches child from this node and removes its path templates
+        from the path template index of the model.
+        """
+        self._children.remove(child)
+        path_template_index = self._get_path_template_index()
+        if path_template_index is not None:
+            path_template_index.remove_node(child)
+
+    def _get_path_template_index(self):
+        # Index of the model of this node, None if not built
+        return getattr(self.get_root(), "_path_template_index", None)
+
     def is_enabled(self):
         """
         :returns: True if enabled and False if disabled
@@ -84,17 +293,24 @@ class TaskNode(object):
 
         if self.get_parent():
             # Bumb the run number for nodes with this name
-            if self.get_parent()._names[self._name] < number:
-                self.get_parent()._names[self._name] = number
+            names = self.get_parent()._get_names()
+            if names[self._name] < number:
+                names[self._name] = number
+
+    def _get_names(self):
+        if self._names is None:
+            self._names = {}
+        return self._names
 
     def _set_name(self, name):
-        if name in self.get_parent()._names:
-            if self.get_parent()._names[name] < self._number:
-                self.get_parent()._names[name] = self._number
+        names = self.get_parent()._get_names()
+        if name in names:
+            if names[name] < self._number:
+                names[name] = self._number
             else:
-                self.get_parent()._names[name] += 1
+                names[name] += 1
         else:
-            self.get_parent()._names[name] = self._number
+            names[name] = self._number
 
         self._name = name
 
@@ -102,7 +318,7 @@ class TaskNode(object):
         return '%s - %i' % (self._name, self._number)
 
     def get_next_number_for_name(self, name):
-        num = self._names.get(name)
+        num = self._names and self._names.get(name)
 
         if num:
             num += 1
@@ -159,10 +375,33 @@ class TaskNode(object):
 
         return root
 
-    def copy(self):
-        new_node = copy.deepcopy(self)
+    def clone(self):
+        """
+        Copies this node and its children. Unlike copy.deepcopy the parent
+        nodes (sample, basket, ...) are not copied: the children of the
+        copy have the copied nodes as parents and the copy itself has no
+        parent until it is added to the queue model
+        (QueueModel.add_child).
+
+        Strings, numbers and other immutable values are shared with the
+        original node, parameter objects (Crystal, ProcessingParameters,
+        PathTemplate, ...) are copied attribute by attribute.
+
+        :returns: The copy of the node
+        :rtype: TaskNode
+        """
+        return self._clone({})
+
+    def _clone(self, memo):
+        new_node = _clone_attributes(self, copy.copy(self), memo,
+                                     skip=("_parent", ))
+        # None if the parent is not one of the copied nodes
+        new_node._parent = memo.get(id(self._parent))
         return new_node
 
+    def copy(self):
+        return self.clone()
+
     def __repr__(self):
         s = '<%s object at %s>' % (
              self.__class__.__name__,
@@ -176,15 +415,45 @@ class RootNode(TaskNode):
         TaskNode.__init__(self)
         self._name = 'root'
         self._total_node_count = 0
+        self._path_template_index = None
+
+    def __getstate__(self):
+        state = TaskNode.__getstate__(self)
+        state.pop("_path_template_index", None)
+        return state
+
+    def get_path_template_index(self):
+        """
+        :returns: The path template index of the model, built on first
+                  use and then updated when nodes are attached or
+                  detached (_add_child, _remove_child).
+        :rtype: PathTemplateIndex
+        """
+        if getattr(self, "_path_template_index", None) is None:
+            self._path_template_index = PathTemplateIndex()
+            self._path_template_index.add_node(self)
+        return self._path_template_index
+
+    def clear_path_template_index(self):
+        if getattr(self, "_path_template_index", None) is not None:
+            self._path_template_index.clear()
+            self._path_template_index = None
 
 
 class TaskGroup(TaskNode):
+    __slots__ = ("lims_group_id", "interleave_num_images")
+
     def __init__(self):
         TaskNode.__init__(self)
         self.lims_group_id = None
         self.interleave_num_images = None
 
 class Sample(TaskNode):
+    __slots__ = ("code", "lims_code", "holder_length", "lims_id", "name",
+                 "lims_sample_location", "lims_container_location",
+                 "free_pin_mode", "loc_str", "location", "lims_location",
+                 "crystals", "processing_parameters", "energy_scan_result")
+
     def __init__(self):
         TaskNode.__init__(self)
 
@@ -432,6 +701,11 @@ class DataCollection(TaskNode):
     :returns: None
     :rtype: None
     """
+    __slots__ = ("acquisitions", "crystal", "processing_parameters",
+                 "previous_acquisition", "experiment_type", "html_report",
+                 "id", "lims_group_id", "lims_start_pos_id",
+                 "lims_end_pos_id")
+
     def __init__(self, acquisition_list=None, crystal=None,
                  processing_parameters=None, name=''):
         TaskNode.__init__(self)
@@ -531,22 +805,6 @@ class DataCollection(TaskNode):
             hex(id(self)))
         return s
 
-    def copy(self):
-        new_node = copy.deepcopy(self)
-        cpos = self.acquisitions[0].acquisition_parameters.\
-               centred_position
-
-        if cpos:
-            snapshot_image = self.acquisitions[0].acquisition_parameters.\
-                             centred_position.snapshot_image
-
-            if snapshot_image:
-                snapshot_image_copy = snapshot_image.copy()
-                acq_parameters = new_node.acquisitions[0].acquisition_parameters
-                acq_parameters.centred_position.snapshot_image = snapshot_image_copy
-
-        return new_node
-
     def get_point_index(self):
         """
         Descript. : Returns point index associated to the data collection
@@ -661,12 +919,6 @@ class Characterisation(TaskNode):
         self.reference_image_collection.acquisitions[0].\
             acquisition_parameters.centred_position = cp
 
-    def copy(self):
-        new_node = copy.deepcopy(self)
-        new_node.reference_image_collection = self.reference_image_collection.copy()
-
-        return new_node
-
     def get_point_index(self):
         """
         Descript. : Returns point index associated to the data collection
@@ -831,16 +1083,6 @@ class EnergyScan(TaskNode):
         display_name = "%s (Point - %s)" %(self.get_name(), index)
         return display_name
 
-    def copy(self):
-        new_node = copy.deepcopy(self)
-        cpos = self.centred_position
-        if cpos:
-            snapshot_image = self.centred_position.snapshot_image
-            if snapshot_image:
-                snapshot_image_copy = snapshot_image.copy()
-                new_node.centred_position.snapshot_image = snapshot_image_copy
-        return new_node
-
 class EnergyScanResult(object):
     def __init__(self):
         object.__init__(self)
@@ -921,16 +1163,6 @@ class XRFSpectrum(TaskNode):
     def get_spectrum_result(self):
         return self.result
 
-    def copy(self):
-        new_node = copy.deepcopy(self)
-        cpos = self.centred_position
-        if cpos:
-            snapshot_image = self.centred_position.snapshot_image
-            if snapshot_image:
-                snapshot_image_copy = snapshot_image.copy()
-                new_node.centred_position.snapshot_image = snapshot_image_copy
-        return new_node
-
 class XRFSpectrumResult(object):
     def __init__(self):
         object.__init__(self)
@@ -1008,7 +1240,10 @@ class SampleCentring(TaskNode):
     def get_kappa_phi(self):
         return self.kappa_phi
 
-class Acquisition(object):
+class Acquisition(SlottedObject):
+    # __dict__: other attributes can be added (allocated when one is set)
+    __slots__ = ("path_template", "acquisition_parameters", "__dict__")
+
     def __init__(self):
         object.__init__(self)
 
@@ -1041,7 +1276,19 @@ class Acquisition(object):
         return paths
 
 
-class PathTemplate(object):
+class PathTemplate(SlottedObject):
+    # __dict__: other attributes can be added (allocated when one is set)
+    __slots__ = ("directory", "process_directory", "xds_dir", "base_prefix",
+                 "mad_prefix", "reference_image_prefix", "wedge_prefix",
+                 "run_number", "suffix", "precision", "start_num",
+                 "num_files", "_change_listeners", "__dict__")
+
+    # Attributes that define the files written, the change listeners
+    # are called when one of them is changed
+    FILE_ATTRIBUTES = frozenset(("directory", "base_prefix", "mad_prefix",
+                                 "reference_image_prefix", "wedge_prefix",
+                                 "run_number", "start_num", "num_files"))
+
     @staticmethod
     def set_data_base_path(base_directory):
         # os.path.abspath returns path without trailing slash, if any
@@ -1059,6 +1306,7 @@ class PathTemplate(object):
     def __init__(self):
         object.__init__(self)
 
+        object.__setattr__(self, "_change_listeners", None)
         self.directory = str()
         self.process_directory = str()
         self.xds_dir = str()
@@ -1072,6 +1320,40 @@ class PathTemplate(object):
         self.start_num = int()
         self.num_files = int()
 
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if self._change_listeners and name in PathTemplate.FILE_ATTRIBUTES:
+            self._notify_change_listeners()
+
+    def __getstate__(self):
+        state = SlottedObject.__getstate__(self)
+        state.pop("_change_listeners", None)
+        return state
+
+    def __setstate__(self, state):
+        SlottedObject.__setstate__(self, state)
+        object.__setattr__(self, "_change_listeners", None)
+
+    def add_change_listener(self, listener):
+        """
+        listener.path_template_changed(path_template) is called when one
+        of FILE_ATTRIBUTES is changed, or when the path template is
+        replaced in its Acquisition. Listeners are weak references, they
+        are not copied with the path template.
+        """
+        if self._change_listeners is None:
+            object.__setattr__(self, "_change_listeners", weakref.WeakSet())
+        self._change_listeners.add(listener)
+
+    def remove_change_listener(self, listener):
+        if self._change_listeners is not None:
+            self._change_listeners.discard(listener)
+
+    def _notify_change_listeners(self):
+        if self._change_listeners:
+            for listener in list(self._change_listeners):
+                listener.path_template_changed(self)
+
     def as_dict(self):
         return {"directory" : self.directory,
                 "process_directory" : self.process_directory,
@@ -1235,7 +1517,178 @@ class PathTemplate(object):
 
         return result
 
-class AcquisitionParameters(object):
+class PathTemplateIndex(object):
+    """
+    Index of the path templates of a model, keyed by normalized
+    directory and prefix (same criteria as PathTemplate.__eq__). For each
+    key and run number the frame intervals [start_num, start_num +
+    num_files) are kept sorted, so next run number and collision queries
+    do not walk the whole model.
+
+    The index is a change listener of the path templates it contains:
+    a changed (or replaced) path template is indexed again before the
+    next query.
+    """
+    def __init__(self):
+        self._buckets = {}
+        # id(node): (node, path template)
+        self._nodes = {}
+        # id(path template): [path template, ids of its nodes, location]
+        self._path_templates = {}
+        self._dirty = set()
+
+    @staticmethod
+    def get_key(path_template):
+        return (os.path.normpath(path_template.directory),
+                path_template.get_prefix())
+
+    def add_node(self, node):
+        """
+        Adds the path templates of node and all its children
+        """
+        path_template = node.get_path_template()
+        if path_template:
+            self._add_entry(node, path_template)
+        for child in node.get_children():
+            self.add_node(child)
+
+    def remove_node(self, node):
+        """
+        Removes the path templates of node and all its children
+        """
+        if id(node) in self._nodes:
+            self._remove_entry(id(node))
+        for child in node.get_children():
+            self.remove_node(child)
+
+    def clear(self):
+        for path_template, node_ids, location in self._path_templates.values():
+            path_template.remove_change_listener(self)
+        self._buckets.clear()
+        self._nodes.clear()
+        self._path_templates.clear()
+        self._dirty.clear()
+
+    def path_template_changed(self, path_template):
+        if id(path_template) in self._path_templates:
+            self._dirty.add(id(path_template))
+
+    def get_max_run_number(self, path_template, exclude_current=True):
+        """
+        :returns: Highest run number used with the same directory and
+                  prefix as path_template, 0 if none.
+        """
+        self._update_dirty()
+        max_run_number = 0
+        runs = self._buckets.get(self.get_key(path_template), {})
+        for run_number, intervals in runs.iteritems():
+            if run_number > max_run_number:
+                for interval in intervals:
+                    if not exclude_current or interval[2] != id(path_template):
+                        max_run_number = run_number
+                        break
+        return max_run_number
+
+    def has_collision(self, path_template):
+        """
+        :returns: True if another path template writes some of the
+                  files of path_template.
+        """
+        self._update_dirty()
+        intervals = self._buckets.get(self.get_key(path_template), {}).\
+                    get(path_template.run_number, [])
+        start = path_template.start_num
+        end = path_template.start_num + path_template.num_files
+        # Intervals starting before the end of path_template
+        index = bisect.bisect_left(intervals, (end, ))
+        while index > 0:
+            index -= 1
+            if intervals[index][1] > start and \
+               intervals[index][2] != id(path_template):
+                return True
+        return False
+
+    def _add_entry(self, node, path_template):
+        if id(node) in self._nodes:
+            self._remove_entry(id(node))
+        self._nodes[id(node)] = (node, path_template)
+        entry = self._path_templates.get(id(path_template))
+        if entry:
+            entry[1].add(id(node))
+        else:
+            self._path_templates[id(path_template)] = \
+                 [path_template, set((id(node), )), self._insert(path_template)]
+            path_template.add_change_listener(self)
+
+    def _remove_entry(self, node_id):
+        node, path_template = self._nodes.pop(node_id)
+        entry = self._path_templates[id(path_template)]
+        entry[1].discard(node_id)
+        if not entry[1]:
+            self._remove(entry[2])
+            del self._path_templates[id(path_template)]
+            self._dirty.discard(id(path_template))
+            path_template.remove_change_listener(self)
+
+    def _insert(self, path_template):
+        key = self.get_key(path_template)
+        run_number = path_template.run_number
+        interval = (path_template.start_num,
+                    path_template.start_num + path_template.num_files,
+                    id(path_template))
+        bisect.insort(self._buckets.setdefault(key, {}).\
+                      setdefault(run_number, []), interval)
+        return key, run_number, interval
+
+    def _remove(self, location):
+        key, run_number, interval = location
+        runs = self._buckets[key]
+        runs[run_number].remove(interval)
+        if not runs[run_number]:
+            del runs[run_number]
+            if not runs:
+                del self._buckets[key]
+
+    def _update_dirty(self):
+        dirty = self._dirty
+        self._dirty = set()
+        for path_template_id in dirty:
+            entry = self._path_templates.get(path_template_id)
+            if entry is None:
+                continue
+            # The path template may have been replaced in its nodes
+            for node_id in list(entry[1]):
+                node = self._nodes[node_id][0]
+                path_template = node.get_path_template()
+                if path_template is not entry[0]:
+                    self._remove_entry(node_id)
+                    if path_template:
+                        self._add_entry(node, path_template)
+            if path_template_id in self._path_templates:
+                self._remove(entry[2])
+                entry[2] = self._insert(entry[0])
+
+
+# The index is notified when these attributes replace a path template
+_watch_path_template_attribute(Acquisition, "path_template")
+_watch_path_template_attribute(DataCollection, "acquisitions")
+_watch_path_template_attribute(Characterisation, "reference_image_collection")
+_watch_path_template_attribute(EnergyScan, "path_template")
+_watch_path_template_attribute(XRFSpectrum, "path_template")
+_watch_path_template_attribute(Advanced, "reference_image_collection")
+
+
+class AcquisitionParameters(SlottedObject):
+    # screening_id and osc_end: set by dc_from_edna_output
+    __slots__ = ("first_image", "num_images", "osc_start", "osc_range",
+                 "overlap", "kappa", "kappa_phi", "exp_time", "num_passes",
+                 "num_lines", "energy", "centred_position", "resolution",
+                 "transmission", "inverse_beam", "shutterless",
+                 "take_snapshots", "take_dark_current",
+                 "skip_existing_images", "detector_mode", "induce_burn",
+                 "mesh_range", "mesh_snapshot", "comments", "in_queue",
+                 "in_interleave", "screening_id", "osc_end", "__dict__")
+
     def __init__(self):
         object.__init__(self)
 
@@ -1296,18 +1749,30 @@ class Crystal(object):
         self.energy_scan_result = EnergyScanResult()
 
 
-class CentredPosition(object):
+class CentredPosition(SlottedObject):
     """
     Class that represents a centred position.
     Can also be initialized with a mxcube motor dict
     which simply is a dictonary with the motornames and
     their corresponding values.
+
+    The motor positions are attributes, the positions of the
+    diffractometer motors are stored in a list (_positions) in the
+    order of DIFFRACTOMETER_MOTOR_NAMES, other motors (and any other
+    attribute added to the object) in a dictionary.
     """
+    __slots__ = ("snapshot_image", "centring_method", "index",
+                 "used_for_collection", "motor_pos_delta",
+                 "_positions", "_other_positions")
+
     MOTOR_POS_DELTA = 1E-4
     DIFFRACTOMETER_MOTOR_NAMES = []
+    MOTOR_INDEXES = {}
     @staticmethod
     def set_diffractometer_motor_names(*names):
         CentredPosition.DIFFRACTOMETER_MOTOR_NAMES = names[:]
+        CentredPosition.MOTOR_INDEXES = dict((motor_name, index) for \
+             index, motor_name in enumerate(names))
         
     def __init__(self, motor_dict=None):
         self.snapshot_image = None
@@ -1316,8 +1781,8 @@ class CentredPosition(object):
         self.used_for_collection = 0
         self.motor_pos_delta = CentredPosition.MOTOR_POS_DELTA
 
-        for motor_name in CentredPosition.DIFFRACTOMETER_MOTOR_NAMES:
-            setattr(self, motor_name, None)
+        self._positions = [None] * len(CentredPosition.DIFFRACTOMETER_MOTOR_NAMES)
+        self._other_positions = None
 
         if motor_dict is not None:
             #for motor_name, position in motor_dict.iteritems():
@@ -1325,6 +1790,56 @@ class CentredPosition(object):
             for motor_item in motor_dict.items():
                 setattr(self, motor_item[0], motor_item[1])
 
+    def __getattr__(self, name):
+        # Called only for the names that are not slots: motor positions
+        if name.startswith('__') or name in CentredPosition.__slots__:
+            raise AttributeError(name)
+        index = CentredPosition.MOTOR_INDEXES.get(name)
+        if index is not None:
+            if index < len(self._positions):
+                return self._positions[index]
+            return None
+        if self._other_positions and name in self._other_positions:
+            return self._other_positions[name]
+        raise AttributeError(name)
+
+    def __setattr__(self, name, value):
+        index = CentredPosition.MOTOR_INDEXES.get(name)
+        if index is not None:
+            try:
+                positions = self._positions
+            except AttributeError:
+                # Created without __init__ (jsonpickle)
+                positions = []
+                object.__setattr__(self, "_positions", positions)
+            if index >= len(positions):
+                # Motor names set after the object was created
+                positions.extend([None] * (index + 1 - len(positions)))
+            positions[index] = value
+        elif name in CentredPosition.__slots__:
+            object.__setattr__(self, name, value)
+        else:
+            other_positions = getattr(self, "_other_positions", None)
+            if other_positions is None:
+                other_positions = {}
+                object.__setattr__(self, "_other_positions", other_positions)
+            other_positions[name] = value
+
+    def __getstate__(self):
+        # Motor positions as attributes, as before they were in a list
+        state = SlottedObject.__getstate__(self)
+        state.update(zip(CentredPosition.DIFFRACTOMETER_MOTOR_NAMES,
+                         state.pop("_positions", ())))
+        state.update(state.pop("_other_positions", None) or {})
+        return state
+
+    def __setstate__(self, state):
+        object.__setattr__(self, "_positions",
+             [None] * len(CentredPosition.DIFFRACTOMETER_MOTOR_NAMES))
+        object.__setattr__(self, "_other_positions", None)
+        for name, value in state.iteritems():
+            setattr(self, name, value)
+
     def as_dict(self):
         return dict(zip(CentredPosition.DIFFRACTOMETER_MOTOR_NAMES,
                     [getattr(self, motor_name) for motor_name in CentredPosition.DIFFRACTOMETER_MOTOR_NAMES]))
@@ -1496,9 +2011,9 @@ def dc_from_edna_output(edna_result, reference_image_collection,
                         char_params = None):
     data_collections = []
 
-    crystal = copy.deepcopy(reference_image_collection.crystal)
+    crystal = clone_parameters(reference_image_collection.crystal)
     ref_proc_params = reference_image_collection.processing_parameters
-    processing_parameters = copy.deepcopy(ref_proc_params)
+    processing_parameters = clone_parameters(ref_proc_params)
 
     try:
         char_results = edna_result.getCharacterisationResult()
@@ -1548,7 +2063,7 @@ def dc_from_edna_output(edna_result, reference_image_collection,
             # and update the members the needs to be changed. Keeping
             # the directories of the reference collection.
             ref_pt= reference_image_collection.acquisitions[0].path_template
-            acq.path_template = copy.deepcopy(ref_pt)
+            acq.path_template = clone_parameters(ref_pt)
             acq.path_template.wedge_prefix = 'w' + str(i + 1)
             acq.path_template.reference_image_prefix = str()
             
@@ -1733,3 +2248,147 @@ def create_interleave_sw(interleave_list, num_images, sw_size):
         sw_first_image += sw_actual_size 
     return subwedges
             
+
+
+BENCHMARK_MOTOR_NAMES = ("phi", "phiz", "phiy", "sampx", "sampy", "kappa",
+                         "kappa_phi", "focus", "zoom")
+
+
+def _create_benchmark_queue(num_samples, num_groups, num_collections):
+    # Root node - samples - task groups - data collections, added as
+    # QueueModel.add_child does
+    root = RootNode()
+    for sample_index in range(num_samples):
+        nodes = [(root, Sample())]
+        for group_index in range(num_groups):
+            nodes.append((nodes[0][1], TaskGroup()))
+            for dc_index in range(num_collections):
+                dc = DataCollection(name="dc")
+                dc.acquisitions[0].path_template.run_number = dc_index
+                dc.acquisitions[0].acquisition_parameters.centred_position = \
+                    CentredPosition(dict((motor_name, 0.1 * dc_index) for \
+                                         motor_name in BENCHMARK_MOTOR_NAMES))
+                nodes.append((nodes[-1][1] if dc_index == 0 else \
+                              nodes[-1][0], dc))
+        for parent, child in nodes:
+            root._total_node_count += 1
+            child._node_id = root._total_node_count
+            parent._add_child(child)
+    return root
+
+
+def _get_memory_size(obj):
+    # Bytes used by obj and the objects it references (classes, modules
+    # and functions excepted), objects referenced several times are
+    # counted once
+    import gc
+    import sys
+    import types
+
+    size = 0
+    seen = set()
+    pending = [obj]
+    while pending:
+        obj = pending.pop()
+        if id(obj) in seen or isinstance(obj, (type, types.ClassType,
+             types.ModuleType, types.FunctionType)):
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        pending.extend(gc.get_referents(obj))
+    return size
+
+
+def _same_values(value, other, skip=("_parent", )):
+    # Compares the attributes of the copies, the parents excepted
+    if isinstance(value, (list, tuple)):
+        return type(value) is type(other) and len(value) == len(other) and \
+               all(_same_values(item, other_item) for item, other_item \
+                   in zip(value, other))
+    if isinstance(value, dict):
+        return isinstance(other, dict) and sorted(value) == sorted(other) and \
+               all(_same_values(value[key], other[key]) for key in value)
+    if (isinstance(value, SlottedObject) or hasattr(value, '__dict__')) and \
+       not isinstance(value, type):
+        return value.__class__ is other.__class__ and \
+               _same_values(dict((name, attribute) for name, attribute in \
+                                 _get_attributes(value).iteritems() \
+                                 if name not in skip),
+                            dict((name, attribute) for name, attribute in \
+                                 _get_attributes(other).iteritems() \
+                                 if name not in skip))
+    return value == other
+
+
+if __name__ == '__main__':
+    import gc
+    import sys
+    import time
+    import pickle
+
+    CentredPosition.set_diffractometer_motor_names(*BENCHMARK_MOTOR_NAMES)
+
+    # Memory and serialisation: 2000 samples, 10000 data collections
+    start_time = time.time()
+    root = _create_benchmark_queue(2000, 1, 5)
+    collections = [dc for sample in root.get_children() for group in \
+                   sample.get_children() for dc in group.get_children()]
+    print("%d samples, %d data collections created in %.2f s" % \
+          (len(root.get_children()), len(collections), time.time() - start_time))
+    memory_size = _get_memory_size(root)
+    print("memory %.1f MB, %d bytes per data collection" % \
+          (memory_size / 1e6, memory_size / len(collections)))
+
+    dc = collections[-1]
+    for protocol in (0, 2):
+        assert _same_values(pickle.loads(pickle.dumps(dc, protocol)), dc)
+    try:
+        import jsonpickle
+    except ImportError:
+        pass
+    else:
+        # Detached copy, otherwise the whole queue is encoded (_parent)
+        sample = root.get_children()[-1].clone()
+        start_time = time.time()
+        encoded = jsonpickle.encode(sample)
+        encode_time = time.time() - start_time
+        start_time = time.time()
+        decoded = jsonpickle.decode(encoded)
+        decode_time = time.time() - start_time
+        assert _same_values(decoded, sample)
+        assert decoded.get_children()[0].get_parent() is decoded
+        print("jsonpickle sample: %d bytes, encode %.2f ms, decode %.2f ms" % \
+              (len(encoded), 1000 * encode_time, 1000 * decode_time))
+
+    del root, collections, dc
+    gc.collect()
+
+    # Copy: 50 samples, 5000 data collections
+    num_copies = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    root = _create_benchmark_queue(50, 4, 25)
+    collections = [dc for sample in root.get_children() for group in \
+                   sample.get_children() for dc in group.get_children()]
+    print("%d data collections, copying %d of them" % (len(collections), num_copies))
+    for label, copy_function in (("clone", _clone_value),
+                                 ("deepcopy", copy.deepcopy)):
+        gc.collect()
+        num_objects = 0
+        start_time = time.time()
+        for dc in collections[:num_copies]:
+            memo = {}
+            copy_function(dc, memo)
+            num_objects += len(memo)
+        elapsed = time.time() - start_time
+        print("%-8s %8.2f ms per node, %6d objects copied per node" % \
+              (label, 1000 * elapsed / num_copies, num_objects / num_copies))
+
+    dc = collections[-1]
+    new_dc = dc.clone()
+    assert new_dc.get_parent() is None
+    assert _same_values(new_dc, dc)
+    assert new_dc.crystal is not dc.crystal
+    assert new_dc.acquisitions[0].acquisition_parameters is not \
+           dc.acquisitions[0].acquisition_parameters
+    new_group = dc.get_parent().clone()
+    assert all(child.get_parent() is new_group for child in new_group.get_children())
+    print("clone: same parameters, copies detached from the queue")
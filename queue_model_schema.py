@@ -0,0 +1,439 @@
+"""
+Schema based serialisation of the queue model (queue_model_objects_v1),
+used by the Native XML-RPC API when the "schema" serialisation is
+selected (serialisation argument of the Native queue functions).
+
+Each TaskNode is one flat record. Its parent and children are not
+included, the records refer to the parent by node id:
+
+    {"node_id": 12, "parent_id": 3, "__type__": "DataCollection",
+     "_name": "dc", "_number": 1, ..., "acquisitions": [...]}
+
+The other objects of the model (Acquisition, PathTemplate, ...) are
+embedded in the records as {"__type__": "PathTemplate", "directory": ...}
+and TaskNode objects that are referenced but are not children (e.g. the
+sample of an EnergyScan) as {"__node__": node id}.
+
+The attributes written for each type are listed in SCHEMA, only these
+types are created when records are read. Attributes missing from a
+record keep the default value of the type, so records written for an
+older SCHEMA_VERSION can still be read.
+
+Messages are JSON: {"schema_version": 1, "nodes": [record, ...]}.
+
+QueueChangeLog versions the nodes of the model, so clients can fetch the
+nodes added, changed or removed since their last call (see
+Native.queue_get_changes) instead of whole subtrees.
+"""
+
+import json
+import itertools
+
+import queue_model_objects_v1 as queue_model_objects
+
+
+SCHEMA_VERSION = 1
+
+# Attributes of all TaskNode objects. The links of the tree (_parent,
+# _children) are given by the node ids of the records
+TASK_NODE_FIELDS = ("_name", "_number", "_enabled", "_executed",
+                    "_requires_centring")
+
+# Attributes written for each type. Images (snapshot_image,
+# mesh_snapshot) and graphics items (grid_object) are not written
+SCHEMA = {
+    "RootNode": TASK_NODE_FIELDS,
+    "TaskGroup": TASK_NODE_FIELDS + ("lims_group_id", "interleave_num_images"),
+    "Sample": TASK_NODE_FIELDS + ("code", "lims_code", "holder_length",
+         "lims_id", "name", "lims_sample_location", "lims_container_location",
+         "free_pin_mode", "loc_str", "location", "lims_location", "crystals",
+         "processing_parameters", "energy_scan_result"),
+    "Basket": TASK_NODE_FIELDS + ("name", "location", "free_pin_mode"),
+    "DataCollection": TASK_NODE_FIELDS + ("acquisitions", "crystal",
+         "processing_parameters", "previous_acquisition", "experiment_type",
+         "html_report", "id", "lims_group_id", "lims_start_pos_id",
+         "lims_end_pos_id"),
+    "Characterisation": TASK_NODE_FIELDS + ("reference_image_collection",
+         "characterisation_parameters", "characterisation_software",
+         "html_report", "run_characterisation"),
+    "EnergyScan": TASK_NODE_FIELDS + ("element_symbol", "edge", "sample",
+         "path_template", "centred_position", "result"),
+    "XRFSpectrum": TASK_NODE_FIELDS + ("count_time", "sample",
+         "path_template", "centred_position", "result"),
+    "Advanced": TASK_NODE_FIELDS + ("method_type", "reference_image_collection",
+         "crystal", "html_report", "first_processing_results",
+         "second_processing_results"),
+    "SampleCentring": TASK_NODE_FIELDS + ("kappa", "kappa_phi", "_tasks"),
+    "Workflow": TASK_NODE_FIELDS + ("_type", "path_template"),
+    "Acquisition": ("path_template", "acquisition_parameters"),
+    "PathTemplate": ("directory", "process_directory", "xds_dir",
+         "base_prefix", "mad_prefix", "reference_image_prefix", "wedge_prefix",
+         "run_number", "suffix", "precision", "start_num", "num_files"),
+    "AcquisitionParameters": ("first_image", "num_images", "osc_start",
+         "osc_range", "overlap", "kappa", "kappa_phi", "exp_time",
+         "num_passes", "num_lines", "energy", "centred_position", "resolution",
+         "transmission", "inverse_beam", "shutterless", "take_snapshots",
+         "take_dark_current", "skip_existing_images", "detector_mode",
+         "induce_burn", "mesh_range", "comments", "in_queue", "in_interleave",
+         "screening_id", "osc_end"),
+    # And the motor positions, {"motors": {motor name: position}}
+    "CentredPosition": ("centring_method", "index", "used_for_collection",
+         "motor_pos_delta"),
+    "Crystal": ("space_group", "cell_a", "cell_alpha", "cell_b", "cell_beta",
+         "cell_c", "cell_gamma", "protein_acronym", "energy_scan_result"),
+    "ProcessingParameters": ("space_group", "cell_a", "cell_alpha", "cell_b",
+         "cell_beta", "cell_c", "cell_gamma", "protein_acronym",
+         "num_residues", "process_data", "anomalous", "pdb_code", "pdb_file"),
+    "CharacterisationParameters": ("path_template", "experiment_type",
+         "use_aimed_resolution", "use_aimed_multiplicity", "aimed_resolution",
+         "aimed_multiplicity", "aimed_i_sigma", "aimed_completness",
+         "strategy_complexity", "induce_burn", "use_permitted_rotation",
+         "permitted_phi_start", "permitted_phi_end", "low_res_pass_strat",
+         "determine_rad_params", "burn_osc_start", "burn_osc_interval",
+         "account_rad_damage", "auto_res", "opt_sad", "sad_res", "min_dose",
+         "min_time", "use_min_dose", "use_min_time", "max_crystal_vdim",
+         "min_crystal_vdim", "max_crystal_vphi", "min_crystal_vphi", "beta",
+         "gamma", "rad_suscept", "space_group"),
+    "EnergyScanResult": ("inflection", "peak", "first_remote",
+         "second_remote", "data_file_path", "data", "pk", "fppPeak", "fpPeak",
+         "ip", "fppInfl", "fpInfl", "rm", "chooch_graph_x", "chooch_graph_y1",
+         "chooch_graph_y2", "title"),
+    "XRFSpectrumResult": ("mca_data", "mca_calib", "mca_config"),
+}
+
+# Attributes of CentredPosition that are not motor positions
+CENTRED_POSITION_ATTRIBUTES = frozenset(SCHEMA["CentredPosition"] + \
+                                        ("snapshot_image", ))
+
+_SIMPLE_TYPES = (type(None), bool, int, long, float, str, unicode)
+
+
+def get_schema():
+    """
+    Descript. : {"schema_version": .., "types": {type name: [attributes]}}
+    """
+    return {"schema_version": SCHEMA_VERSION,
+            "types": dict((type_name, list(fields)) for type_name, fields \
+                          in SCHEMA.iteritems())}
+
+
+def encode_value(value):
+    if isinstance(value, _SIMPLE_TYPES):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [encode_value(item) for item in value]
+    if isinstance(value, dict):
+        return dict((str(key), encode_value(item)) for key, item \
+                    in value.iteritems())
+    if isinstance(value, queue_model_objects.TaskNode) and \
+       value._node_id is not None:
+        # Node of the model, e.g. the sample of an energy scan
+        return {"__node__": value._node_id}
+    if value.__class__.__name__ in SCHEMA and \
+       getattr(value, "__module__", None) == queue_model_objects.__name__:
+        return encode_object(value)
+    # Images, graphics items, ...
+    return None
+
+
+def encode_object(obj):
+    type_name = obj.__class__.__name__
+    record = {"__type__": type_name}
+    for field in SCHEMA[type_name]:
+        try:
+            value = getattr(obj, field)
+        except AttributeError:
+            # Not set (AcquisitionParameters.screening_id, ...)
+            continue
+        record[field] = encode_value(value)
+    if isinstance(obj, queue_model_objects.CentredPosition):
+        record["motors"] = dict((name, value) for name, value in \
+             obj.__getstate__().iteritems() \
+             if name not in CENTRED_POSITION_ATTRIBUTES)
+    return record
+
+
+def encode_node(node, node_id=None, parent_id=None):
+    """
+    Descript. : record of node without its children
+    """
+    record = encode_object(node)
+    record["node_id"] = node._node_id if node_id is None else node_id
+    record["parent_id"] = parent_id
+    return record
+
+
+def encode_subtree(node, local_ids=None):
+    """
+    Descript. : records of node and of all its children, parents before
+                children. Nodes that are not in the model (no node id) get
+                a negative id from local_ids (iterator, -1, -2, ... by
+                default), pass the same iterator to encode several
+                subtrees in one message
+    Return    : list of records
+    """
+    records = []
+    if local_ids is None:
+        local_ids = itertools.count(-1, -1)
+
+    def get_node_id(node):
+        if node._node_id is not None:
+            return node._node_id
+        return next(local_ids)
+
+    parent = node.get_parent()
+    pending = [(node, get_node_id(node), parent._node_id if parent else None)]
+    while pending:
+        node, node_id, parent_id = pending.pop()
+        records.append(encode_node(node, node_id, parent_id))
+        # Reversed: children are popped in order
+        for child in reversed(node.get_children()):
+            pending.append((child, get_node_id(child), node_id))
+    return records
+
+
+def decode_value(data, get_node=None, default=None):
+    """
+    Descript. : get_node(node_id) returns the node referenced by
+                {"__node__": node_id}. default is the value of the
+                attribute before it is set, lists are converted to tuples
+                if it is a tuple
+    """
+    if isinstance(data, list):
+        value = [decode_value(item, get_node) for item in data]
+        if isinstance(default, tuple):
+            value = tuple(value)
+        return value
+    if isinstance(data, dict):
+        if "__type__" in data:
+            return decode_object(data, get_node)
+        if "__node__" in data:
+            return get_node(data["__node__"]) if get_node else None
+        return dict((key, decode_value(item, get_node)) for key, item \
+                    in data.iteritems())
+    return data
+
+
+def decode_object(record, get_node=None):
+    """
+    Descript. : creates the object of the record. Only the types of the
+                schema are created
+    """
+    type_name = record["__type__"]
+    if type_name not in SCHEMA:
+        raise ValueError("Unknown queue model type '%s'" % type_name)
+    obj = getattr(queue_model_objects, type_name)()
+    for field in SCHEMA[type_name]:
+        if field in record:
+            setattr(obj, field, decode_value(record[field], get_node,
+                                             getattr(obj, field, None)))
+    if type_name == "CentredPosition":
+        for motor_name, position in record.get("motors", {}).iteritems():
+            setattr(obj, str(motor_name), position)
+    return obj
+
+
+def link_child(parent, child):
+    """
+    Descript. : adds child to parent outside of the model, as the
+                children of a node sent with jsonpickle
+    """
+    parent._add_child(child)
+
+
+def dumps(records):
+    return json.dumps({"schema_version": SCHEMA_VERSION, "nodes": records},
+                      separators=(",", ":"))
+
+
+def loads(message):
+    """
+    Descript. : records of a message (or of a single record)
+    Return    : list of records
+    """
+    data = json.loads(message)
+    if isinstance(data, dict) and "nodes" in data:
+        schema_version = data.get("schema_version", SCHEMA_VERSION)
+        if schema_version > SCHEMA_VERSION:
+            raise ValueError("Schema version %s is not supported (%d)" % \
+                             (schema_version, SCHEMA_VERSION))
+        data = data["nodes"]
+    if isinstance(data, dict):
+        data = [data]
+    return data
+
+
+def iter_nodes(root):
+    """
+    Descript. : nodes of the tree under root (root excepted), parents
+                before children
+    """
+    pending = list(reversed(root.get_children()))
+    while pending:
+        node = pending.pop()
+        yield node
+        pending.extend(reversed(node.get_children()))
+
+
+class QueueChangeLog(object):
+    """
+    Descript. : version of the nodes of the model. The model is compared
+                with the previous state when the changes are requested:
+                nodes added, moved, renamed, enabled/disabled or executed
+                get the new version. Other changes are reported with
+                mark_changed
+    """
+    def __init__(self, max_removed=10000):
+        self.version = 0
+        self.max_removed = max_removed
+        # node id: (version, state, node)
+        self.nodes = {}
+        # (version, node id), oldest first
+        self.removed = []
+        # Removals before this version are no longer known
+        self.removed_horizon = 0
+        self.changed_ids = set()
+
+    def mark_changed(self, node):
+        if node._node_id is not None:
+            self.changed_ids.add(node._node_id)
+
+    def update(self, root):
+        """
+        Descript. : compares the model with the last update
+        Return    : current version
+        """
+        version = self.version + 1
+        changed = False
+        nodes = {}
+        for node in iter_nodes(root):
+            node_id = node._node_id
+            if node_id is None:
+                continue
+            parent = node.get_parent()
+            state = (id(node), parent._node_id if parent else None,
+                     node._name, node._number, node._enabled, node._executed)
+            known = self.nodes.get(node_id)
+            if known is None or known[1] != state or \
+               node_id in self.changed_ids:
+                nodes[node_id] = (version, state, node)
+                changed = True
+            else:
+                nodes[node_id] = known
+
+        for node_id in self.nodes:
+            if node_id not in nodes:
+                self.removed.append((version, node_id))
+                changed = True
+        if len(self.removed) > self.max_removed:
+            self.removed_horizon = self.removed[-self.max_removed - 1][0]
+            del self.removed[:-self.max_removed]
+
+        self.nodes = nodes
+        self.changed_ids.clear()
+        if changed:
+            self.version = version
+        return self.version
+
+    def get_changes(self, root, since_version=0):
+        """
+        Descript. : nodes added or changed and ids of the nodes removed
+                    after since_version. All nodes are returned (reset
+                    True) if since_version is 0 or older than the removals
+                    kept
+        Return    : dict
+        """
+        self.update(root)
+        since_version = since_version or 0
+        reset = since_version < self.removed_horizon or since_version == 0 or \
+                since_version > self.version
+        if reset:
+            since_version = 0
+
+        changed = [(node_id, node) for node_id, (version, state, node) in \
+                   self.nodes.iteritems() if version > since_version]
+        records = []
+        for node_id, node in sorted(changed):
+            parent = node.get_parent()
+            records.append(encode_node(node, node_id,
+                                       parent._node_id if parent else None))
+        removed = [node_id for version, node_id in self.removed \
+                   if version > since_version and node_id not in self.nodes]
+        return {"schema_version": SCHEMA_VERSION,
+                "version": self.version,
+                "reset": reset,
+                "nodes": records,
+                "removed": [] if reset else removed}
+
+
+def _create_benchmark_tasks(num_samples=100, num_collections=5):
+    # Samples with a task group of data collections, as sent by a
+    # workflow engine
+    queue_model_objects.CentredPosition.set_diffractometer_motor_names(\
+         "phi", "phiz", "phiy", "sampx", "sampy", "kappa", "kappa_phi",
+         "focus", "zoom")
+    samples = []
+    for sample_index in range(num_samples):
+        sample = queue_model_objects.Sample()
+        sample.name = "sample%d" % sample_index
+        group = queue_model_objects.TaskGroup()
+        link_child(sample, group)
+        for dc_index in range(num_collections):
+            dc = queue_model_objects.DataCollection(name="dc")
+            acquisition = dc.acquisitions[0]
+            acquisition.path_template.base_prefix = sample.name
+            acquisition.path_template.run_number = dc_index + 1
+            acquisition.acquisition_parameters.centred_position = \
+                 queue_model_objects.CentredPosition({"phi": 10.0 * dc_index,
+                                                      "sampx": 0.1})
+            link_child(group, dc)
+        samples.append(sample)
+    return samples
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    import jsonpickle
+
+    num_samples = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    samples = _create_benchmark_tasks(num_samples)
+    num_nodes = sum(len(records) for records in \
+                    [encode_subtree(sample) for sample in samples[:1]]) * num_samples
+    print("%d samples, %d nodes" % (num_samples, num_nodes))
+
+    start_time = time.time()
+    messages = [jsonpickle.encode(sample) for sample in samples]
+    encode_time = time.time() - start_time
+    start_time = time.time()
+    for message in messages:
+        jsonpickle.decode(message)
+    decode_time = time.time() - start_time
+    print("jsonpickle  encode %7.1f ms  decode %7.1f ms  %8d bytes" % \
+          (1000 * encode_time, 1000 * decode_time, sum(map(len, messages))))
+
+    start_time = time.time()
+    local_ids = itertools.count(-1, -1)
+    message = dumps([record for sample in samples for record in \
+                     encode_subtree(sample, local_ids)])
+    encode_time = time.time() - start_time
+    start_time = time.time()
+    nodes = {}
+    roots = []
+    for record in loads(message):
+        node = decode_object(record, nodes.get)
+        nodes[record["node_id"]] = node
+        if record["parent_id"] in nodes:
+            link_child(nodes[record["parent_id"]], node)
+        else:
+            roots.append(node)
+    decode_time = time.time() - start_time
+    print("schema      encode %7.1f ms  decode %7.1f ms  %8d bytes" % \
+          (1000 * encode_time, 1000 * decode_time, len(message)))
+
+    local_ids = itertools.count(-1, -1)
+    decoded_records = [record for root in roots for record in \
+                       encode_subtree(root, local_ids)]
+    assert decoded_records == loads(message), "records differ after decoding"
+    print("decoded nodes give the same records")
@@ -1,11 +1,12 @@
-from scipy import optimize
 import numpy
+import gevent
 import gevent.event
 import math
 import time
 import logging
 import os
 import tempfile
+import contextlib
 
 try:
   import lucid2 as lucid
@@ -17,15 +18,127 @@ except ImportError:
 
 
 def multiPointCentre(z,phis) :
-    fitfunc = lambda p,x: p[0] * numpy.sin(x+p[1]) + p[2]
-    errfunc = lambda p,x,y: fitfunc(p,x) - y
-    p1, success = optimize.leastsq(errfunc,[1.,0.,0.],args = (phis,z))
-    return p1
+    fit = CentringFit(1, 1, 0)
+    for z_pos, phi_pos in zip(z, phis):
+      fit.add_fit_point(z_pos, phi_pos)
+    return numpy.array(fit.get_fit_parameters())
 
 USER_CLICKED_EVENT = None
 CURRENT_CENTRING = None
 SAVED_INITIAL_POSITIONS = {}
 READY_FOR_NEXT_POINT = gevent.event.Event()
+LAST_CENTRING_TIMINGS = None
+SNAPSHOT_FILENAME = os.path.join(tempfile.gettempdir(), "mxcube_sample_snapshot.png")
+
+class CentringFit:
+  """
+  Least squares fit of z = r*sin(phi+a) + offset to the points clicked
+  (or found) at several phi angles. The model is linear written as
+  z = A*sin(phi) + B*cos(phi) + C, so the normal equations are updated
+  with each point and solved when needed
+  """
+  def __init__(self, pixelsPerMm_Hor, pixelsPerMm_Ver, chi_angle=0):
+    self.pixelsPerMm_Hor = float(pixelsPerMm_Hor)
+    self.pixelsPerMm_Ver = float(pixelsPerMm_Ver)
+    chi_angle = math.radians(chi_angle)
+    self.chiRotMatrix = numpy.matrix([[math.cos(chi_angle), -math.sin(chi_angle)],
+                                      [math.sin(chi_angle), math.cos(chi_angle)]])
+    self.normal_matrix = numpy.zeros((3, 3))
+    self.normal_vector = numpy.zeros(3)
+    self.num_points = 0
+    self.pos_sum = 0.0
+
+  def add_point(self, x, y, phi_position):
+    """
+    x, y in pixels, phi_position in radians (with motor direction)
+    """
+    Z = self.chiRotMatrix*numpy.matrix([[x / self.pixelsPerMm_Hor],
+                                        [y / self.pixelsPerMm_Ver]])
+    self.pos_sum += Z[0,0]
+    self.add_fit_point(Z[1,0], phi_position)
+
+  def add_fit_point(self, z, phi_position):
+    row = numpy.array([math.sin(phi_position), math.cos(phi_position), 1.])
+    self.normal_matrix += numpy.outer(row, row)
+    self.normal_vector += row*z
+    self.num_points += 1
+
+  def get_fit_parameters(self):
+    """
+    Returns r, a, offset
+    """
+    A, B, C = numpy.linalg.lstsq(self.normal_matrix, self.normal_vector, rcond=-1)[0]
+    return math.hypot(A, B), math.atan2(B, A), C
+
+  def get_avg_pos(self):
+    return self.pos_sum / self.num_points
+
+def centred_position_from_fit(fit, phi, phiy, phiz, sampx, sampy, beam_xc, beam_yc):
+  r, a, offset = fit.get_fit_parameters()
+  dy = r * numpy.sin(a)
+  dx = r * numpy.cos(a)
+  
+  d = fit.chiRotMatrix.transpose()*numpy.matrix([[fit.get_avg_pos()], [offset]])
+
+  d_horizontal =  d[0] - (beam_xc / fit.pixelsPerMm_Hor)
+  d_vertical =  d[1] - (beam_yc / fit.pixelsPerMm_Ver)
+
+
+  phi_pos = math.radians(phi.direction*phi.getPosition())
+  phiRotMatrix = numpy.matrix([[math.cos(phi_pos), -math.sin(phi_pos)],
+                               [math.sin(phi_pos), math.cos(phi_pos)]])
+  vertical_move = phiRotMatrix*numpy.matrix([[0],d_vertical])
+  
+  centred_pos = SAVED_INITIAL_POSITIONS.copy()
+  if phiz.reference_position is None:
+      centred_pos.update({ sampx.motor: float(sampx.getPosition() + sampx.direction*dx),
+                           sampy.motor: float(sampy.getPosition() + sampy.direction*dy),
+                           phiz.motor: float(phiz.getPosition() + phiz.direction*d_vertical[0,0]),
+                           phiy.motor: float(phiy.getPosition() + phiy.direction*d_horizontal[0,0]) })
+  else:
+      centred_pos.update({ sampx.motor: float(sampx.getPosition() + sampx.direction*(dx + vertical_move[0,0])),
+                           sampy.motor: float(sampy.getPosition() + sampy.direction*(dy + vertical_move[1,0])),
+                           phiy.motor: float(phiy.getPosition() + phiy.direction*d_horizontal[0,0]) })
+  return centred_pos
+
+class CentringTimings:
+  """
+  Time spent in each stage of the automatic centring
+  """
+  def __init__(self):
+    self.start_time = time.time()
+    self.totals = {}
+    self.counts = {}
+    self.stages = []
+
+  @contextlib.contextmanager
+  def measure(self, stage):
+    start_time = time.time()
+    try:
+      yield
+    finally:
+      self.add(stage, time.time() - start_time)
+
+  def add(self, stage, duration):
+    if stage not in self.totals:
+      self.stages.append(stage)
+      self.totals[stage] = 0
+      self.counts[stage] = 0
+    self.totals[stage] += duration
+    self.counts[stage] += 1
+
+  def get_summary(self):
+    summary = {"total": time.time() - self.start_time}
+    for stage in self.stages:
+      summary[stage] = {"count": self.counts[stage],
+                        "total": self.totals[stage],
+                        "mean": self.totals[stage] / self.counts[stage]}
+    return summary
+
+  def __str__(self):
+    return "total %.2f s: " % (time.time() - self.start_time) + \
+           ", ".join(["%s %dx %.3f s" % (stage, self.counts[stage], self.totals[stage]) \
+                      for stage in self.stages])
 
 class CentringMotor:
   def __init__(self, motor, reference_position=None, direction=1):
@@ -120,7 +233,7 @@ def centre_plate(phi, phiy, phiz,
            chi_angle,
            n_points, phi_range = 40):
   global USER_CLICKED_EVENT
-  X, Y, phi_positions = [], [], []
+  fit = CentringFit(pixelsPerMm_Hor, pixelsPerMm_Ver, chi_angle)
 
   phi_angle = phi_range/(n_points-1)
 
@@ -132,9 +245,7 @@ def centre_plate(phi, phiy, phiz,
       except:
         raise RuntimeError("Aborted while waiting for point selection")
       USER_CLICKED_EVENT = gevent.event.AsyncResult()
-      X.append(x / float(pixelsPerMm_Hor))
-      Y.append(y / float(pixelsPerMm_Ver))
-      phi_positions.append(phi.direction*math.radians(phi.getPosition()))
+      fit.add_point(x, y, phi.direction*math.radians(phi.getPosition()))
       if i != n_points-1:
         phi.syncMoveRelative(phi.direction*phi_angle)
       READY_FOR_NEXT_POINT.set()
@@ -144,38 +255,8 @@ def centre_plate(phi, phiy, phiz,
     move_motors(SAVED_INITIAL_POSITIONS)
     raise
 
-  #logging.info("X=%s,Y=%s", X, Y)
-  chi_angle = math.radians(chi_angle)
-  chiRotMatrix = numpy.matrix([[math.cos(chi_angle), -math.sin(chi_angle)],
-                               [math.sin(chi_angle), math.cos(chi_angle)]])
-  Z = chiRotMatrix*numpy.matrix([X,Y])
-  z = Z[1]; avg_pos = Z[0].mean()
-
-  r, a, offset = multiPointCentre(numpy.array(z).flatten(), phi_positions)
-  dy = r * numpy.sin(a)
-  dx = r * numpy.cos(a)
-  
-  d = chiRotMatrix.transpose()*numpy.matrix([[avg_pos], [offset]])
-
-  d_horizontal =  d[0] - (beam_xc / float(pixelsPerMm_Hor))
-  d_vertical =  d[1] - (beam_yc / float(pixelsPerMm_Ver))
-
-
-  phi_pos = math.radians(phi.direction*phi.getPosition())
-  phiRotMatrix = numpy.matrix([[math.cos(phi_pos), -math.sin(phi_pos)],
-                               [math.sin(phi_pos), math.cos(phi_pos)]])
-  vertical_move = phiRotMatrix*numpy.matrix([[0],d_vertical])
-  
-  centred_pos = SAVED_INITIAL_POSITIONS.copy()
-  if phiz.reference_position is None:
-      centred_pos.update({ sampx.motor: float(sampx.getPosition() + sampx.direction*dx),
-                           sampy.motor: float(sampy.getPosition() + sampy.direction*dy),
-                           phiz.motor: float(phiz.getPosition() + phiz.direction*d_vertical[0,0]),
-                           phiy.motor: float(phiy.getPosition() + phiy.direction*d_horizontal[0,0]) })
-  else:
-      centred_pos.update({ sampx.motor: float(sampx.getPosition() + sampx.direction*(dx + vertical_move[0,0])),
-                           sampy.motor: float(sampy.getPosition() + sampy.direction*(dy + vertical_move[1,0])),
-                           phiy.motor: float(phiy.getPosition() + phiy.direction*d_horizontal[0,0]) })
+  centred_pos = centred_position_from_fit(fit, phi, phiy, phiz, sampx, sampy,
+                                         beam_xc, beam_yc)
 
   
   move_motors(centred_pos)
@@ -225,7 +306,7 @@ def center(phi, phiy, phiz,
            chi_angle,
            n_points, phi_range= 180):
   global USER_CLICKED_EVENT
-  X, Y, phi_positions = [], [], []
+  fit = CentringFit(pixelsPerMm_Hor, pixelsPerMm_Ver, chi_angle)
 
   phi_angle = phi_range/(n_points-1)
 
@@ -237,9 +318,7 @@ def center(phi, phiy, phiz,
       except:
         raise RuntimeError("Aborted while waiting for point selection")
       USER_CLICKED_EVENT = gevent.event.AsyncResult()
-      X.append(x / float(pixelsPerMm_Hor))
-      Y.append(y / float(pixelsPerMm_Ver))
-      phi_positions.append(phi.direction*math.radians(phi.getPosition()))
+      fit.add_point(x, y, phi.direction*math.radians(phi.getPosition()))
       if i != n_points-1:
         phi.syncMoveRelative(phi.direction*phi_angle)
       READY_FOR_NEXT_POINT.set()
@@ -249,40 +328,8 @@ def center(phi, phiy, phiz,
     move_motors(SAVED_INITIAL_POSITIONS)
     raise
 
-  #logging.info("X=%s,Y=%s", X, Y)
-  chi_angle = math.radians(chi_angle)
-  chiRotMatrix = numpy.matrix([[math.cos(chi_angle), -math.sin(chi_angle)],
-                               [math.sin(chi_angle), math.cos(chi_angle)]])
-  Z = chiRotMatrix*numpy.matrix([X,Y])
-  z = Z[1]; avg_pos = Z[0].mean()
-
-  r, a, offset = multiPointCentre(numpy.array(z).flatten(), phi_positions)
-  dy = r * numpy.sin(a)
-  dx = r * numpy.cos(a)
-  
-  d = chiRotMatrix.transpose()*numpy.matrix([[avg_pos], [offset]])
-
-  d_horizontal =  d[0] - (beam_xc / float(pixelsPerMm_Hor))
-  d_vertical =  d[1] - (beam_yc / float(pixelsPerMm_Ver))
-
-
-  phi_pos = math.radians(phi.direction*phi.getPosition())
-  phiRotMatrix = numpy.matrix([[math.cos(phi_pos), -math.sin(phi_pos)],
-                               [math.sin(phi_pos), math.cos(phi_pos)]])
-  vertical_move = phiRotMatrix*numpy.matrix([[0],d_vertical])
-  
-  centred_pos = SAVED_INITIAL_POSITIONS.copy()
-  if phiz.reference_position is None:
-      centred_pos.update({ sampx.motor: float(sampx.getPosition() + sampx.direction*dx),
-                           sampy.motor: float(sampy.getPosition() + sampy.direction*dy),
-                           phiz.motor: float(phiz.getPosition() + phiz.direction*d_vertical[0,0]),
-                           phiy.motor: float(phiy.getPosition() + phiy.direction*d_horizontal[0,0]) })
-  else:
-      centred_pos.update({ sampx.motor: float(sampx.getPosition() + sampx.direction*(dx + vertical_move[0,0])),
-                           sampy.motor: float(sampy.getPosition() + sampy.direction*(dy + vertical_move[1,0])),
-                           phiy.motor: float(phiy.getPosition() + phiy.direction*d_horizontal[0,0]) })
-
-  return centred_pos
+  return centred_position_from_fit(fit, phi, phiy, phiz, sampx, sampy,
+                                   beam_xc, beam_yc)
 
 def end(centred_pos=None):
   if centred_pos is None:
@@ -315,11 +362,40 @@ def start_auto(camera,  centring_motors_dict,
                                     msg_cb, new_point_cb)
     return CURRENT_CENTRING
 
-def find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb):
-  snapshot_filename = os.path.join(tempfile.gettempdir(), "mxcube_sample_snapshot.png")
-  camera.takeSnapshot(snapshot_filename, bw=True)
-  
-  info, x, y = lucid.find_loop(snapshot_filename,IterationClosing=6)
+def to_grayscale(image_array):
+  """
+  Converts the snapshot array of the camera to a 8 bit grayscale image.
+  Color images are (height, width, 4) arrays of QImage RGB32 data,
+  i.e. blue, green, red, alpha bytes
+  """
+  if image_array.ndim == 3:
+    image_array = 0.114*image_array[:,:,0] + 0.587*image_array[:,:,1] + \
+                  0.299*image_array[:,:,2]
+  return image_array.astype(numpy.uint8)
+
+def grab_image(camera):
+  """
+  Returns the current camera image as numpy array, or the file name of
+  a snapshot if the camera cannot return arrays (no get_snapshot)
+  """
+  if hasattr(camera, "get_snapshot"):
+    image_array = camera.get_snapshot(bw=True, return_as_array=True)
+    if image_array is not None:
+      return to_grayscale(numpy.asarray(image_array))
+  camera.takeSnapshot(SNAPSHOT_FILENAME, bw=True)
+  return SNAPSHOT_FILENAME
+
+def find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb, image=None, timings=None):
+  if timings is None:
+    timings = CentringTimings()
+  if image is None:
+    with timings.measure("grab"):
+      image = grab_image(camera)
+
+  # detection runs in a worker thread, so motors can move meanwhile
+  with timings.measure("detect"):
+    info, x, y = gevent.get_hub().threadpool.apply(lucid.find_loop, (image, ),
+                                                   {"IterationClosing": 6})
   
   try:
     x = float(x)
@@ -334,6 +410,86 @@ def find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb):
         
   return x, y
 
+def auto_center_pass(camera,
+                     phi, phiy, phiz,
+                     sampx, sampy,
+                     pixelsPerMm_Hor, pixelsPerMm_Ver,
+                     beam_xc, beam_yc,
+                     chi_angle,
+                     n_points,
+                     msg_cb, new_point_cb,
+                     timings, phi_range=180):
+  """
+  Finds the loop at n_points phi angles and returns the centred position.
+  The image of an angle is grabbed before phi moves to the next angle,
+  so loop detection and fitting run while phi is moving
+  """
+  imgHeight = camera.getHeight()
+  fit = CentringFit(pixelsPerMm_Hor, pixelsPerMm_Ver, chi_angle)
+  phi_angle = phi_range/(n_points-1)
+  phi_move = None
+
+  try:
+    for a in range(n_points):
+      phi_position = phi.direction*math.radians(phi.getPosition())
+      with timings.measure("grab"):
+        image = grab_image(camera)
+      phi_move = None
+      if a != n_points-1:
+        phi_move = gevent.spawn(phi.syncMoveRelative, phi.direction*phi_angle)
+
+      x, y = find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb, image, timings)
+      if x < 0 or y < 0:
+        # loop not found: go back to the angle and search around it
+        if phi_move is not None:
+          with timings.measure("move"):
+            phi_move.get()
+          phi.syncMoveRelative(-phi.direction*phi_angle)
+        for i in range(1,18):
+          #logging.info("loop not found - moving back %d" % i)
+          with timings.measure("move"):
+            phi.syncMoveRelative(5)
+          x, y = find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb, timings=timings)
+          if -1 in (x, y):
+            continue
+          if y < imgHeight/2:
+            y = 0
+          else:
+            y = imgHeight
+          if callable(new_point_cb):
+            new_point_cb((x,y))
+          break
+        if -1 in (x,y):
+          raise RuntimeError("Could not centre sample automatically.")
+        with timings.measure("fit"):
+          fit.add_point(x, y, phi.direction*math.radians(phi.getPosition()))
+        with timings.measure("move"):
+          if a != n_points-1:
+            phi.syncMoveRelative(phi.direction*phi_angle)
+          phi.syncMoveRelative(-i*5)
+      else:
+        with timings.measure("fit"):
+          fit.add_point(x, y, phi_position)
+        if phi_move is not None:
+          # only the part of the move not hidden by the detection
+          with timings.measure("move"):
+            phi_move.get()
+  except:
+    logging.exception("Exception while centring")
+    if phi_move is not None and not phi_move.ready():
+      # phi must be stopped before it is moved back to its initial position
+      phi_move.kill()
+      phi.stop()
+      with gevent.Timeout(30, RuntimeError("Phi did not stop")):
+        while not ready(phi):
+          time.sleep(0.1)
+    move_motors(SAVED_INITIAL_POSITIONS)
+    raise
+
+  with timings.measure("fit"):
+    return centred_position_from_fit(fit, phi, phiy, phiz, sampx, sampy,
+                                     beam_xc, beam_yc)
+
 def auto_center(camera, 
                 phi, phiy, phiz,
                 sampx, sampy, 
@@ -342,13 +498,15 @@ def auto_center(camera,
                 chi_angle, 
                 n_points,
                 msg_cb, new_point_cb):
-    imgWidth = camera.getWidth()
-    imgHeight = camera.getHeight()
+    global LAST_CENTRING_TIMINGS
+    timings = CentringTimings()
+    LAST_CENTRING_TIMINGS = timings
  
     #check if loop is there at the beginning
     i = 0
-    while -1 in find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb):
-        phi.syncMoveRelative(90)
+    while -1 in find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb, timings=timings):
+        with timings.measure("move"):
+            phi.syncMoveRelative(90)
         i+=1
         if i>4:
             if callable(msg_cb):
@@ -360,46 +518,17 @@ def auto_center(camera,
       if callable(msg_cb):
             msg_cb("Doing automatic centring")
             
-      centring_greenlet = gevent.spawn(center,
-                                       phi, phiy, phiz,
-                                       sampx, sampy, 
-                                       pixelsPerMm_Hor, pixelsPerMm_Ver, 
-                                       beam_xc, beam_yc, 
-                                       chi_angle, 
-                                       n_points)
-
-      for a in range(n_points):
-            x, y = find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb) 
-            #logging.info("in autocentre, x=%f, y=%f",x,y)
-            if x < 0 or y < 0:
-              for i in range(1,18):
-                #logging.info("loop not found - moving back %d" % i)
-                phi.syncMoveRelative(5)
-                x, y = find_loop(camera, pixelsPerMm_Hor, chi_angle, msg_cb, new_point_cb)
-                if -1 in (x, y):
-                    continue
-                if x >=0:
-                  if y < imgHeight/2:
-                    y = 0
-                    if callable(new_point_cb):
-                        new_point_cb((x,y))
-                    user_click(x,y,wait=True)
-                    break
-                  else:
-                    y = imgHeight
-                    if callable(new_point_cb):
-                        new_point_cb((x,y))
-                    user_click(x,y,wait=True)
-                    break
-              if -1 in (x,y):
-                centring_greenlet.kill()
-                raise RuntimeError("Could not centre sample automatically.")
-              phi.syncMoveRelative(-i*5)
-            else:
-              user_click(x,y,wait=True)
-
-      centred_pos = centring_greenlet.get()
-      end(centred_pos)
-                 
+      centred_pos = auto_center_pass(camera,
+                                     phi, phiy, phiz,
+                                     sampx, sampy, 
+                                     pixelsPerMm_Hor, pixelsPerMm_Ver, 
+                                     beam_xc, beam_yc, 
+                                     chi_angle, 
+                                     n_points,
+                                     msg_cb, new_point_cb,
+                                     timings)
+      with timings.measure("centre move"):
+        end(centred_pos)
+
+    logging.getLogger("HWR").info("Automatic centring timings: %s" % str(timings))
     return centred_pos
-    
@@ -158,6 +158,42 @@ class Cats90(SampleChanger):
         # self._updateSelection()
         self._updateState()               
         self._updateLoadedSample()
+
+    def _connectUpdateChannels(self):
+        """
+        Connects the status channels of the CATS Tango DS, so that only the
+        components whose channels have changed are updated
+
+        :returns: None
+        :rtype: None
+        """
+        for basket_index in range(Cats90.NO_OF_BASKETS):
+            self._connectUpdateChannel(getattr(self, "_chnBasket%dState" % (basket_index + 1)),
+                                       ("basket", basket_index))
+        for channel in (self._chnState, self._chnPathRunning, self._chnSampleIsDetected, self._lidStatus):
+            self._connectUpdateChannel(channel, "state")
+        for channel in (self._chnLidLoadedSample, self._chnNumLoadedSample):
+            self._connectUpdateChannel(channel, "loaded_sample")
+        self._connectUpdateChannel(self._chnSampleBarcode, "barcode")
+
+    def _doUpdateComponents(self, components):
+        """
+        Updates the components marked dirty by the channel update events,
+        in the same order as _doUpdateInfo
+
+        :returns: None
+        :rtype: None
+        """
+        for component in components:
+            if isinstance(component, tuple) and component[0] == "basket":
+                self._updateBasketPresence(component[1])
+        # state depends on the loaded sample
+        if "state" in components or "loaded_sample" in components:
+            self._updateState()
+        if "loaded_sample" in components:
+            self._updateLoadedSample()
+        elif "barcode" in components and self.getLoadedSample() is not None:
+            self._updateSampleBarcode(self.getLoadedSample())
                     
     def _doChangeMode(self,mode):
         """
@@ -415,11 +451,11 @@ class Cats90(SampleChanger):
             return          
 
         #_chnSampleIsDetected does not exist in our CATS. 
-        if self.hasLoadedSample() ^ self._chnSampleIsDetected.getValue():
+        if self.hasLoadedSample() ^ self._readChannel(self._chnSampleIsDetected):
             # go to Unknown state if a sample is detected on the gonio but not registered in the internal database
             # or registered but not on the gonio anymore
             state = SampleChangerState.Unknown 
-        elif self._chnPathRunning.getValue() and not (state in [SampleChangerState.Loading, SampleChangerState.Unloading]):
+        elif self._readChannel(self._chnPathRunning) and not (state in [SampleChangerState.Loading, SampleChangerState.Unloading]):
             state = SampleChangerState.Moving
         elif self._scIsCharging and not (state in [SampleChangerState.Alarm, SampleChangerState.Moving, SampleChangerState.Loading, SampleChangerState.Unloading]):
             state = SampleChangerState.Charging
@@ -432,7 +468,7 @@ class Cats90(SampleChanger):
         :returns: Sample changer state
         :rtype: GenericSampleChanger.SampleChangerState
         """
-        state = self._chnState.getValue()
+        state = self._readChannel(self._chnState)
         #print "*** _readState: ", state
         if state is not None:
             stateStr = str(state).upper()
@@ -515,8 +551,8 @@ class Cats90(SampleChanger):
         :returns: None
         :rtype: None
         """
-        loadedSampleLid = self._chnLidLoadedSample.getValue()
-        loadedSampleNum = self._chnNumLoadedSample.getValue()
+        loadedSampleLid = self._readChannel(self._chnLidLoadedSample)
+        loadedSampleNum = self._readChannel(self._chnNumLoadedSample)
         if loadedSampleLid != -1 or loadedSampleNum != -1:
             lidBase = (loadedSampleLid - 1) * 3
             lidOffset = ((loadedSampleNum - 1) / 10) + 1
@@ -555,7 +591,7 @@ class Cats90(SampleChanger):
         :rtype: None
         """
         # update information of recently scanned sample
-        datamatrix = str(self._chnSampleBarcode.getValue())
+        datamatrix = str(self._readChannel(self._chnSampleBarcode))
         scanned = (len(datamatrix) != 0)
         if not scanned:    
            datamatrix = '----------'   
@@ -602,38 +638,47 @@ class Cats90(SampleChanger):
         :rtype: None
         """
         for basket_index in range(Cats90.NO_OF_BASKETS):            
-            # get presence information from the device server
-            newBasketPresence = getattr(self, "_chnBasket%dState" % (basket_index + 1)).getValue()
-            # get saved presence information from object's internal bookkeeping
-            basket=self.getComponents()[basket_index]
+            self._updateBasketPresence(basket_index)
+
+    def _updateBasketPresence(self, basket_index):
+        """
+        Updates the presence of one basket (index starting from 0) and of its samples
+
+        :returns: None
+        :rtype: None
+        """
+        # get presence information from the device server
+        newBasketPresence = self._readChannel(getattr(self, "_chnBasket%dState" % (basket_index + 1)))
+        # get saved presence information from object's internal bookkeeping
+        basket=self.getComponents()[basket_index]
            
-            # check if the basket was newly mounted or removed from the dewar
-            if newBasketPresence ^ basket.isPresent():
-                # import pdb; pdb.set_trace()
-                # a mounting action was detected ...
-                if newBasketPresence:
-                    # basket was mounted
-                    present = True
-                    scanned = False
-                    datamatrix = None
-                    basket._setInfo(present, datamatrix, scanned)
+        # check if the basket was newly mounted or removed from the dewar
+        if newBasketPresence ^ basket.isPresent():
+            # import pdb; pdb.set_trace()
+            # a mounting action was detected ...
+            if newBasketPresence:
+                # basket was mounted
+                present = True
+                scanned = False
+                datamatrix = None
+                basket._setInfo(present, datamatrix, scanned)
+            else:
+                # basket was removed
+                present = False
+                scanned = False
+                datamatrix = None
+                basket._setInfo(present, datamatrix, scanned)
+            # set the information for all dependent samples
+            for sample_index in range(Basket.NO_OF_SAMPLES_PER_PUCK):
+                sample = self.getComponentByAddress(Pin.getSampleAddress((basket_index + 1), (sample_index + 1)))
+                present = sample.getContainer().isPresent()
+                if present:
+                    datamatrix = '          '   
                 else:
-                    # basket was removed
-                    present = False
-                    scanned = False
                     datamatrix = None
-                    basket._setInfo(present, datamatrix, scanned)
-                # set the information for all dependent samples
-                for sample_index in range(Basket.NO_OF_SAMPLES_PER_PUCK):
-                    sample = self.getComponentByAddress(Pin.getSampleAddress((basket_index + 1), (sample_index + 1)))
-                    present = sample.getContainer().isPresent()
-                    if present:
-                        datamatrix = '          '   
-                    else:
-                        datamatrix = None
-                    scanned = False
-                    sample._setInfo(present, datamatrix, scanned)
-                    # forget about any loaded state in newly mounted or removed basket)
-                    loaded = has_been_loaded = False
-                    sample._setLoaded(loaded, has_been_loaded)
+                scanned = False
+                sample._setInfo(present, datamatrix, scanned)
+                # forget about any loaded state in newly mounted or removed basket)
+                loaded = has_been_loaded = False
+                sample._setLoaded(loaded, has_been_loaded)
 
@@ -38,6 +38,12 @@ class Component(object):
         return self.address
 
     def getCoords(self):
+        container = self.getContainer()
+        if container is not None:
+            coords_cache = container._getComponentIndex().coords
+            coords = coords_cache.get(id(self))
+            if coords is not None:
+                return coords
         coords_list = [self.getIndex()+1]
         x = self.getContainer()
         while x:
@@ -46,7 +52,10 @@ class Component(object):
             coords_list.append(idx+1)
           x = x.getContainer()        
         coords_list.reverse()
-        return tuple(coords_list) 
+        coords = tuple(coords_list)
+        if container is not None:
+            coords_cache[id(self)] = coords
+        return coords
     
     def getIndex(self):
         """
@@ -57,6 +66,9 @@ class Component(object):
             container = self.getContainer()
             if container is not None:
                 components = container.getComponents()
+                index = container._getComponentIndex().indexes.get(id(self))
+                if index is not None and index < len(components) and components[index] is self:
+                    return index
                 for i in range(len(components)):
                     if (components[i] is self):
                         return i
@@ -1,5 +1,68 @@
 from Sample import  *
 
+class ComponentIndex(object):
+    """
+    Index of the component tree under a root container: components by address
+    and by ID, index within the parent, coordinates and sample lists.
+    Built when first used. Cleared by _addComponent, _removeComponent and
+    _clearComponents, the ID part also by _setDirty (IDs change with _setInfo)
+    """
+    
+    def __init__(self, root):
+        self.components = []    # all components in depth first order
+        self.ranges = {}        # id(container) -> (start, end) in components
+        self.indexes = {}       # id(component) -> index within the parent
+        self.by_address = {}
+        self.by_id = None
+        self.coords = {}
+        self.sample_lists = {}
+        self.ranges[id(root)] = (0, self._addComponents(root))
+
+    def _addComponents(self, container):
+        for i, c in enumerate(container.getComponents()):
+            self.indexes.setdefault(id(c), i)
+            self.by_address.setdefault(c.getAddress(), []).append(c)
+            self.components.append(c)
+            start = len(self.components)
+            end = self._addComponents(c) if isinstance(c, Container) else start
+            self.ranges.setdefault(id(c), (start, end))
+        return len(self.components)
+
+    def contains(self, component):
+        return id(component) in self.ranges
+
+    def find(self, container, key, by_id=False):
+        """
+        Returns the first component (depth first) under container with
+        the given address or ID
+        """
+        if by_id:
+            if self.by_id is None:
+                self.by_id = {}
+                for c in self.components:
+                    self.by_id.setdefault(c.getID(), []).append(c)
+            candidates = self.by_id.get(key, ())
+        else:
+            candidates = self.by_address.get(key, ())
+        start, end = self.ranges[id(container)]
+        for c in candidates:
+            if start < self.ranges[id(c)][0] <= end:
+                return c
+        return None
+
+    def getSampleList(self, container):
+        samples = self.sample_lists.get(id(container))
+        if samples is None:
+            samples = []
+            for c in container.getComponents():
+                if isinstance(c,Sample):
+                    samples.append(c)
+                else:
+                    samples.extend(self.getSampleList(c))
+            self.sample_lists[id(container)] = samples
+        return samples
+
+
 class Container(Component):
     """
     Entity class holding state of any any hierarchical sample container
@@ -9,6 +72,7 @@ class Container(Component):
         super(Container, self).__init__(container, address, scannable)
         self.type = type
         self.components = []     
+        self._component_index = None
     
     
     #########################           PUBLIC           #########################
@@ -43,13 +107,7 @@ class Container(Component):
         Returns the list of all Sample objects under of this container (recursivelly)
         :rtype: list 
         """        
-        samples=[]
-        for c in self.getComponents():
-            if isinstance(c,Sample):
-                samples.append(c)
-            else:
-                samples.extend(c.getSampleList())
-        return samples
+        return list(self._getComponentIndex().getSampleList(self))
 
     def getBasketList(self):
         basket_list = []
@@ -64,16 +122,17 @@ class Container(Component):
         :rtype: list 
         """        
         ret = []
-        for sample in self.getSampleList():
+        for sample in self._getComponentIndex().getSampleList(self):
             if sample.isPresent():
                 ret.append(sample)
+        return ret
 
     def isEmpty(self):
         """
         Returns true if there is no sample present sample under this container
         :rtype: bool 
         """        
-        for s in self.getSampleList():
+        for s in self._getComponentIndex().getSampleList(self):
             if s.isPresent():
                 return False
         return True
@@ -83,14 +142,7 @@ class Container(Component):
         Returns a component through its slot address or None if address is invalid
         :rtype: Component 
         """        
-        for c in self.getComponents():
-            if c.getAddress() == address:
-                return c            
-            if isinstance(c,Container):
-                aux=c.getComponentByAddress(address)
-                if aux is not None:
-                    return aux
-        return None
+        return self._getComponentIndex().find(self, address)
 
     def hasComponentAddress(self, address):
         """
@@ -104,14 +156,7 @@ class Container(Component):
         Returns a component through its id or None if id is invalid
         :rtype: Component 
         """        
-        for c in self.getComponents():
-            if c.getID() == id:
-                return c            
-            if  isinstance(c,Container):
-                aux=c.getComponentById(id)
-                if aux is not None:
-                    return aux
-        return None
+        return self._getComponentIndex().find(self, id, by_id=True)
 
 
     def hasComponentId(self, id):
@@ -122,7 +167,7 @@ class Container(Component):
         return self.getComponentById(id) is not None
     
     def getSelectedSample(self):
-        for s in self.getSampleList():
+        for s in self._getComponentIndex().getSampleList(self):
             if s.isSelected():
                 return s
         return None
@@ -142,12 +187,43 @@ class Container(Component):
     
     def _addComponent(self, c):
         self.components.append(c)
+        self._clearComponentIndex()
 
     def _removeComponent(self, c):
         self.components.remove(c)
+        self._clearComponentIndex()
 
     def _clearComponents(self):
         self.components = []     
+        self._clearComponentIndex()
+
+    def _getComponentIndex(self):
+        """
+        Returns the ComponentIndex of the root container if this container
+        is part of its tree, otherwise the index of this container
+        """
+        root = self
+        while isinstance(root.getContainer(), Container):
+            root = root.getContainer()
+        if root is not self:
+            if root._component_index is None:
+                root._component_index = ComponentIndex(root)
+            if root._component_index.contains(self):
+                return root._component_index
+        if self._component_index is None:
+            self._component_index = ComponentIndex(self)
+        return self._component_index
+
+    def _clearComponentIndex(self):
+        container = self
+        while isinstance(container, Container):
+            container._component_index = None
+            container = container.getContainer()
+
+    def _setDirty(self):
+        if self._component_index is not None:
+            self._component_index.by_id = None
+        Component._setDirty(self)
 
     def _resetDirty(self):
         Component._resetDirty(self)
@@ -155,7 +231,7 @@ class Container(Component):
             c._resetDirty()  
 
     def _setSelectedSample(self,sample):
-        for s in self.getSampleList():
+        for s in self._getComponentIndex().getSampleList(self):
             if s==sample:
                 s._setSelected(True)
             else:
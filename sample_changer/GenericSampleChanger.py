@@ -7,6 +7,7 @@ import abc
 import logging
 import time
 import gevent
+import gevent.event
 import types
 
 class SampleChangerState:
@@ -76,6 +77,11 @@ class SampleChanger(Container,Equipment):
     LOADED_SAMPLE_CHANGED_EVENT="loadedSampleChanged"
     SELECTION_CHANGED_EVENT="selectionChanged"    
     TASK_FINISHED_EVENT="taskFinished"
+
+    # Update modes: "timer" calls updateInfo periodically, "events" updates
+    # the components marked dirty by the channel update signals (see
+    # _connectUpdateChannels) and keeps the timer as a low rate safety net
+    UPDATE_MODE="timer"
     
                 
     def __init__(self,type,scannable, *args, **kwargs):
@@ -91,14 +97,41 @@ class SampleChanger(Container,Equipment):
         self.task_error=None
         self._transient=False
         self._token=None
-        self._timer_update_inverval = 5 # defines the interval in periods of 100 ms
+        self._timer_update_inverval = 1 # defines the interval in periods of 100 ms
         self._timer_update_counter = 0            
+        self._update_mode = self.UPDATE_MODE
+        self._update_coalesce_time = 0.05
+        self._update_event = gevent.event.Event()
+        self._update_callbacks = []
+        self._dirty_components = set()
+        self._update_statistics = {}
+        self.resetUpdateStatistics()
 
     def init(self):
         use_update_timer = self.getProperty("useUpdateTimer")
         if use_update_timer is None:
             use_update_timer = True
 
+        update_mode = self.getProperty("updateMode")
+        if update_mode is not None:
+            self._update_mode = update_mode
+
+        # Update timer interval in s, by default every 100 ms. In events
+        # mode the timer is only a safety net, by default every 10 s
+        update_timer_interval = self.getProperty("updateTimerInterval")
+        if update_timer_interval is None and self._update_mode == "events":
+            update_timer_interval = 10
+        if update_timer_interval is not None:
+            self._setTimerUpdateInterval(max(1, int(float(update_timer_interval) * 10)))
+
+        if self._update_mode == "events":
+            update_coalesce_time = self.getProperty("updateCoalesceTime")
+            if update_coalesce_time is not None:
+                self._update_coalesce_time = float(update_coalesce_time)
+            self._connectUpdateChannels()
+            eventTask=self.__event_update_task(wait=False)
+            eventTask.link(self._onEventUpdateExit)
+
         if use_update_timer:
             task1s=self.__timer_1s_task(wait=False)
             task1s.link(self._onTimer1sExit)
@@ -112,6 +145,9 @@ class SampleChanger(Container,Equipment):
         
     def _onTimerUpdateExit(self, task):
         logging.warning("Exiting Sample Changer update timer task")
+
+    def _onEventUpdateExit(self, task):
+        logging.warning("Exiting Sample Changer event update task")
         
         
     @task
@@ -131,12 +167,29 @@ class SampleChanger(Container,Equipment):
             try:
                 if self.isEnabled():
                     self._timer_update_counter += 1
-                    if (self._timer_update_counter >= self._timer_update_counter):
+                    if (self._timer_update_counter >= self._timer_update_inverval):
+                        self._update_statistics["timer_updates"] += 1
                         self._onTimerUpdate()
                         self._timer_update_counter = 0
             except:
                 pass                
 
+    @task
+    def __event_update_task(self, *args):
+        while(True):
+            self._update_event.wait()
+            # Channel updates arriving together are handled with one update
+            gevent.sleep(self._update_coalesce_time)
+            self._update_event.clear()
+            components = self._dirty_components
+            self._dirty_components = set()
+            try:
+                if self.isEnabled():
+                    self._update_statistics["event_updates"] += 1
+                    self.updateInfo(components)
+            except:
+                logging.getLogger("HWR").exception("Sample changer: update failed")
+
 #########################           TIMER           #########################
     def _setTimerUpdateInterval(self,value):
         self._timer_update_inverval=value
@@ -148,6 +201,68 @@ class SampleChanger(Container,Equipment):
     def _onTimer1s(self):
         pass        
 
+#########################           EVENTS           #########################
+    def _connectUpdateChannels(self):
+        """
+        Connects the channels used by _doUpdateInfo with _connectUpdateChannel.
+        Implemented by the sample changers supporting the "events" update mode
+        """
+        logging.getLogger("HWR").warning("Sample changer: update events " + \
+             "not supported, only the update timer is used")
+
+    def _connectUpdateChannel(self, channel, component):
+        """
+        Marks component dirty when channel emits update. component is any
+        key understood by _doUpdateComponents
+        """
+        if channel is None:
+            return
+        def channel_updated(value, component=component):
+            self._setComponentDirty(component)
+        # Dispatcher keeps weak references to the receivers
+        self._update_callbacks.append(channel_updated)
+        channel.connectSignal("update", channel_updated)
+
+    def _setComponentDirty(self, component):
+        self._update_statistics["events"] += 1
+        self._dirty_components.add(component)
+        self._update_event.set()
+
+    def _doUpdateComponents(self, components):
+        """
+        Updates the components marked dirty. By default everything is updated
+        """
+        self._doUpdateInfo()
+
+    def _readChannel(self, channel):
+        """
+        Reads channel value, reads are counted in the update statistics
+        """
+        self._update_statistics["channel_reads"] += 1
+        return channel.getValue()
+
+    def getUpdateStatistics(self):
+        """
+        Returns update mode, number of updates, channel reads and events
+        since resetUpdateStatistics, with their rate per second
+        :rtype: dict
+        """
+        statistics = dict(self._update_statistics)
+        elapsed = max(time.time() - statistics.pop("start_time"), 1e-6)
+        for key in ("updates", "timer_updates", "event_updates", "events", "channel_reads"):
+            statistics[key + "_per_second"] = statistics[key] / elapsed
+        statistics["mode"] = self._update_mode
+        statistics["elapsed"] = elapsed
+        return statistics
+
+    def resetUpdateStatistics(self):
+        self._update_statistics = {"start_time": time.time(),
+                                   "updates": 0,
+                                   "timer_updates": 0,
+                                   "event_updates": 0,
+                                   "events": 0,
+                                   "channel_reads": 0}
+
 ########################           EQUIPMENT           #######################
              
     def connectNotify(self, signal):
@@ -279,11 +394,16 @@ class SampleChanger(Container,Equipment):
                 self.task_error=None
         
 
-    def updateInfo(self):
+    def updateInfo(self, components=None):
         """
+        Updates all the sample changer info or only the given dirty components
         """
         former_loaded = self.getLoadedSample()
-        self._doUpdateInfo()        
+        self._update_statistics["updates"] += 1
+        if components is None:
+            self._doUpdateInfo()        
+        else:
+            self._doUpdateComponents(components)
         if self._isDirty():
             self._triggerInfoChangedEvent()
         